@@ -1,278 +1,190 @@
 import time
+BOOT_STARTED = time.perf_counter() # Before the imports below, so boot timing includes them
+
+import base64
+import functools
+import itertools
 import random
-import json
 import os
-import requests
+import threading
 from dotenv import load_dotenv
-from flask import Flask, render_template, send_from_directory, request
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, render_template, send_from_directory, request
+from flask_socketio import SocketIO, emit, join_room, leave_room
+from sessions import SessionManager
+from queue_backend import MESSAGE_QUEUE, WORKER_COUNT, WORKER_INDEX, client_manager
+from sequencer import PATTERN_DIR
+from pitch import G_MINOR
+from pattern_library import PatternLibrary
+from uploads import MAX_UPLOAD_BYTES, PatternIngest, UploadError
+from compact_pattern import CompactPattern
+import metrics
+# ollama_client, synth and variation (NumPy) are imported on first use, off the boot path
 
 load_dotenv()
 
+# Several workers (workers.py) share clients and rooms through a message queue
+if WORKER_COUNT > 1 and not MESSAGE_QUEUE:
+    raise SystemExit("WORKER_COUNT > 1 needs a MESSAGE_QUEUE")
+queue_manager = client_manager(MESSAGE_QUEUE, worker_index=WORKER_INDEX)
+
 app = Flask(__name__, template_folder='.', static_folder='.', static_url_path='')
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Threads only: handlers block on threading primitives (melody_ready, upload futures),
+# which would stall every client under eventlet or gevent
+socketio = SocketIO(app, async_mode="threading", cors_allowed_origins="*", client_manager=queue_manager)
 
 # Configuration
 BPM = 140
 SIXTEENTH_NOTE_DURATION = (60 / BPM) / 4
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
-
-SCALE = ["G1", "A1", "Bb1", "C2", "D2", "Eb2", "F2", "G2", "A2", "Bb2", "C3", "D3", "Eb3", "F3", "G3", "A3", "Bb3", "C4", "D4", "Eb4", "F4", "G4", "A4", "Bb4"]
-MELODY_INDICES = [14, 18, 14, 23, 21]
-
-def generate_with_ollama(prompt):
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL')  # None: ollama_client.DEFAULT_MODEL
+# "tick" emits every event as it happens, "bar" sends one timestamped batch per bar,
+# "binary" sends the same batch packed (wire.py) as a binary attachment
+SCHEDULE_MODE = os.getenv('SCHEDULE_MODE', 'tick')
+LOOKAHEAD_BARS = float(os.getenv('LOOKAHEAD_BARS', '1'))
+MAX_AUDIO_BARS = 512  # Longest finite /api/audio render
+# Seconds the background warm-up waits for a first client before it starts anyway
+WARM_DELAY = float(os.getenv('WARM_DELAY', '1'))
+
+ingest = PatternIngest()
+
+def wait_for(future):
+    # Yield to the clock loop instead of blocking the worker while Ollama answers
+    while not future.done():
+        socketio.sleep(0.01)
+    return future.result()
+
+# Built on first use: the Ollama client and the HTTP API's shared pattern pool
+ollama = None
+pattern_pool = None
+singletons_lock = threading.Lock()
+
+def get_ollama():
+    global ollama
+    with singletons_lock:
+        if ollama is None:
+            from ollama_client import DEFAULT_MODEL, OllamaClient
+            ollama = OllamaClient(OLLAMA_URL, model=OLLAMA_MODEL or DEFAULT_MODEL)
+        return ollama
+
+def get_pattern_pool():
+    """Shared warm queue for the HTTP API; every session also gets a pool of its own."""
+    global pattern_pool
+    client = get_ollama()
+    with singletons_lock:
+        if pattern_pool is None:
+            from pregen import PatternPool
+            pattern_pool = PatternPool(spawn=socketio.start_background_task, ollama=client,
+                                       model=get_melody_model())
+        return pattern_pool
+
+def generate_with_ollama(prompt, parse_json=False):
+    started = time.perf_counter_ns()
+    result = wait_for(get_ollama().submit(prompt, parse_json))
+    metrics.OLLAMA_SECONDS.observe(metrics.elapsed(started), "ok" if result else "empty")
+    return result
+
+# Seed patterns, indexed and compiled once for every session
+pattern_library = PatternLibrary(PATTERN_DIR)
+
+# Local n-gram model behind TranceAI's groove lines (markov.py), trained from
+# the library as it is at startup and frozen before any session gets it
+melody_model = None
+melody_ready = threading.Event()
+
+def train_melody_model():
+    """Startup task: warm the library and train the melody model on it.
+
+    Starts with the process rather than waiting for a client, so it is
+    normally done long before the first session asks for a pattern pool.
+    Uploads never train it, so no client changes another session's
+    material and a seed always plays the same.
+    """
+    global melody_model
     try:
-        response = requests.post(f"{OLLAMA_URL}/api/generate", 
-            json={"model": "mrasif/functiongemma-270m-it-GGUF-F16:latest", "prompt": prompt, "stream": False},
-            timeout=15)
-        return response.json().get('response', '')
-    except Exception as e:
-        print(f"Ollama error: {e}")
-        return None
-
-class Sequencer:
-    def __init__(self):
-        self.is_running = False
-        self.state = "Groove"
-        self.bar_count = 0
-        self.sixteenth_count = 0
-        self.melody_step = 0
-        self.thread = None
-        self.pattern = None
-        self.mutation = 0.0
-        self.arp_mode = "UpDown"
-        self.bpm = 140 # Initialize BPM here
-        self.sixteenth_note_duration = (60 / self.bpm) / 4 # Calculate based on self.bpm
-
-    def note_to_midi(self, name):
-        base_map = {'C': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'F': 5, 'F#': 6, 'Gb': 6, 'G': 7, 'G#': 8, 'Ab': 8, 'A': 9, 'A#': 10, 'Bb': 10, 'B': 11}
-        try:
-            note_parts = name[:-1]
-            octave = int(name[-1])
-            return (octave + 1) * 12 + base_map.get(note_parts, 0)
-        except:
-            return 60
-
-    def snap_to_scale(self, note_name):
-        target_midi = self.note_to_midi(note_name)
-        closest_note = SCALE[0]
-        min_dist = 999
-        for s_note in SCALE:
-            s_midi = self.note_to_midi(s_note)
-            dist = abs(s_midi - target_midi)
-            if dist < min_dist:
-                min_dist = dist
-                closest_note = s_note
-        return closest_note
-
-    def process_pattern(self, pattern):
-        """Transpose to G Minor and snap to scale."""
-        if not pattern or 'tracks' not in pattern:
-            return pattern
-
-        # Simple transposition: shift everything so the first note is in G minor scale
-        # or just snap everything. Snapping is safer for trance.
-        for track in pattern['tracks']:
-            for note in track.get('notes', []):
-                note['name'] = self.snap_to_scale(note['name'])
-        return pattern
-
-    def load_seed_pattern(self, name):
-        filepath = f"patterns/{name}.json"
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                pattern = json.load(f)
-                self.pattern = self.process_pattern(pattern)
-                print(f"Loaded seed pattern: {name}")
-
-    def start(self):
-        if not self.is_running:
-            self.is_running = True
-            self.thread = socketio.start_background_task(self.run)
-
-    def stop(self):
-        self.is_running = False
-
-    def run(self):
-        next_tick = time.time()
-        while self.is_running:
-            current_time = time.time()
-            if current_time >= next_tick:
-                self.tick()
-                next_tick += self.sixteenth_note_duration
-            else:
-                socketio.sleep(0.005)
-
-    def tick(self):
-        # State Machine (every 32 bars)
-        if self.sixteenth_count == 0 and self.bar_count % 32 == 0 and self.bar_count > 0:
-            self.update_state()
-
-        # Sequencing Logic
-        self.play_kick()
-        self.play_bass()
-        self.play_lead()
-        self.play_chords()
-        self.play_piano()
-        self.play_pads()
-        self.play_arp()
-        self.play_fx()
-        self.update_params()
-
-        # Increment counts
-        self.sixteenth_count += 1
-        if self.sixteenth_count == 16:
-            self.sixteenth_count = 0
-            self.bar_count += 1
-
-    def update_state(self):
-        states = ["Groove", "Breakdown", "Build-up", "Drop"]
-        current_index = states.index(self.state)
-        # Advance state
-        self.state = states[(current_index + 1) % len(states)]
-        socketio.emit('state_change', {'state': self.state, 'bar': self.bar_count})
-
-    def play_kick(self):
-        if self.sixteenth_count % 4 == 0:
-            # Ghost Kick: always trigger sidechain for the pumping effect
-            socketio.emit('trigger_sidechain')
-
-            if self.state != "Breakdown":
-                socketio.emit('trigger_kick', {'note': 'C1', 'duration': '8n'})
-
-    def play_bass(self):
-        if self.state in ["Breakdown", "Build-up"]:
-            return
-        # Emit constant 16th notes for the frontend Trance Gate to mask
-        # Only emit when actually needed to avoid overwhelming the socket
-        if self.sixteenth_count % 1 == 0:  # Every 16th note, but with explicit condition
-            socketio.emit('trigger_bass', {'note': SCALE[0], 'duration': '16n'})
-
-    def play_lead(self):
-        # Use MIDI pattern if available
-        if self.pattern and 'tracks' in self.pattern:
-            track = self.pattern['tracks'][0]
-            # Loop pattern every 4 beats
-            current_beats_in_bar = self.sixteenth_count * 0.25
-
-            for note_data in track.get('notes', []):
-                note_time_beats = note_data.get('time', 0) * (self.bpm / 60)
-                # Loop the pattern time within 4 beats
-                pattern_time = note_time_beats % 4
-
-                if abs(pattern_time - current_beats_in_bar) < 0.05:
-                    note = note_data.get('name', 'G3')
-
-                    # Apply Mutation
-                    if random.random() < self.mutation:
-                        note = random.choice(SCALE[7:17]) # Range around center
-
-                    socketio.emit('trigger_lead', {
-                        'note': note,
-                        'duration': '16n',
-                        'detune': (random.random() - 0.5) * 20
-                    })
-            return
-
-        prob = 0.3
-        if self.state == "Drop": prob = 0.6
-        if self.state == "Breakdown": prob = 0.2
-
-        if random.random() < prob:
-            note_index = MELODY_INDICES[self.melody_step % len(MELODY_INDICES)]
-            self.melody_step += 1
-            note = SCALE[note_index]
-
-            # Chaos factor: random detune
-            detune = (random.random() - 0.5) * 20
-            socketio.emit('trigger_lead', {'note': note, 'duration': '16n', 'detune': detune})
-
-    def play_chords(self):
-        if self.state != "Groove":
-            return
-        # Play a G minor chord progression on the first beat of every 2 bars
-        if self.sixteenth_count == 0 and self.bar_count % 2 == 0:
-            progression = [
-                ["G2", "Bb2", "D3"],  # Gm
-                ["C3", "Eb3", "G3"],  # Cm
-                ["F2", "A2", "C3"],   # F
-                ["D3", "F3", "A3"]    # Dm
-            ]
-            chord = progression[(self.bar_count // 2) % len(progression)]
-            socketio.emit('trigger_chords', {'notes': chord, 'duration': '2n'})
-
-    def play_piano(self):
-        if self.state != "Breakdown":
-            return
-        # Sparse, staccato melody in high register
-        if self.sixteenth_count in [0, 4, 8, 12] and random.random() < 0.4:
-            note = random.choice(SCALE[14:]) # Higher notes
-            socketio.emit('trigger_piano', {'note': note, 'duration': '8n'})
-
-    def play_pads(self):
-        if self.state not in ["Groove", "Breakdown"]:
-            return
-        # Long, ambient textures on the first beat of every 4 bars
-        if self.sixteenth_count == 0 and self.bar_count % 4 == 0:
-            note = random.choice(["G1", "C2", "F1", "D2"]) # Root notes
-            socketio.emit('trigger_pads', {'note': note, 'duration': '1m'})
-
-    def play_arp(self):
-        if self.state not in ["Drop", "Groove"]:
-            return
-
-        g_minor_scale = ["G2", "A2", "Bb2", "C3", "D3", "Eb3", "F3", "G3"]
-
-        if self.arp_mode == "Random":
-            note = random.choice(g_minor_scale)
-        else:
-            if self.arp_mode == "Up":
-                arp_pattern = [0, 1, 2, 3, 4, 5, 6, 7]
-            elif self.arp_mode == "Down":
-                arp_pattern = [7, 6, 5, 4, 3, 2, 1, 0]
-            else: # UpDown
-                arp_pattern = [0, 1, 2, 3, 4, 5, 6, 7, 6, 5, 4, 3, 2, 1]
-
-            note_index = arp_pattern[self.sixteenth_count % len(arp_pattern)]
-            note = g_minor_scale[note_index]
-
-        socketio.emit('trigger_arp', {'note': note, 'duration': '16n'})
-
-    def play_fx(self):
-        if self.state == "Build-up":
-            # Riser start every 8 bars
-            if self.sixteenth_count == 0 and self.bar_count % 8 == 0:
-                socketio.emit('trigger_riser', {'duration': 8})
-
-            # Snare roll
-            phase_pos = self.bar_count % 32
-            snare_prob = 0
-            if phase_pos > 16: snare_prob = 0.3
-            if phase_pos > 24: snare_prob = 0.6
-            if phase_pos > 28: snare_prob = 1.0
-
-            if self.sixteenth_count % 2 == 0 and random.random() < snare_prob:
-                 socketio.emit('trigger_snare', {'duration': '16n'})
-
-    def update_params(self):
-        # Evolve filter
-        cutoff = 1000
-        if self.state == "Groove":
-            cutoff = 1500 + 500 * (self.bar_count % 8) / 8
-        elif self.state == "Breakdown":
-            cutoff = 600
-        elif self.state == "Build-up":
-            cutoff = 600 + (self.bar_count % 32) * 100
-        elif self.state == "Drop":
-            cutoff = 3000
-
-        socketio.emit('param_update', {'param': 'lead_cutoff', 'value': cutoff})
-
-        # Chaos factor for bass
-        spread = 20 + random.random() * 20
-        socketio.emit('param_update', {'param': 'bass_spread', 'value': spread})
-
-sequencer = Sequencer()
+        from markov import MelodyModel
+        model = MelodyModel()
+        pattern_library.warm()
+        for _, compiled in pattern_library.compiled():
+            model.learn(compiled)
+        print(f"Melody model trained on {model.notes_learned} notes")
+        melody_model = model.freeze()
+    finally:
+        melody_ready.set()  # On failure every session plays without a model, alike
+
+def get_melody_model():
+    """The frozen melody model, waiting for startup training the first time (None if it failed)."""
+    melody_ready.wait()
+    return melody_model
+
+def session_pool():
+    """Each session's own PatternPool; pregen and TranceAI load with the first one."""
+    from pregen import PatternPool
+    return PatternPool(spawn=socketio.start_background_task, model=get_melody_model())
+
+def boot_timing():
+    """Milliseconds from the start of app.py to imports done, server starting and first clock step."""
+    def since_start(at):
+        return None if at is None else round((at - BOOT_STARTED) * 1e3, 1)
+    return {"imports_ms": since_start(BOOT_IMPORTED), "ready_ms": since_start(BOOT_READY),
+            "first_tick_ms": since_start(sessions.first_tick)}
+
+def warm_up():
+    """Background warm-up: NumPy for the variation engine.
+
+    Waits for the first clock step (or WARM_DELAY seconds without one) so
+    it never competes with the first client for the interpreter.
+    """
+    waited = 0.0
+    while sessions.first_tick is None and waited < WARM_DELAY:
+        socketio.sleep(0.05)
+        waited += 0.05
+    print(f"Boot: {boot_timing()}")
+    import variation  # noqa: F401 -- loaded here so the first mutated bar does not pay for NumPy
+
+sessions = SessionManager(socketio, schedule_mode=SCHEDULE_MODE, lookahead_bars=LOOKAHEAD_BARS,
+                          worker_index=WORKER_INDEX, worker_count=WORKER_COUNT,
+                          relay=queue_manager.relay if queue_manager else None,
+                          pattern_library=pattern_library,
+                          pool_factory=session_pool)
+
+BOOT_IMPORTED = time.perf_counter()
+BOOT_READY = None  # Set when the server starts listening (__main__ only)
+socketio.start_background_task(train_melody_model)
+socketio.start_background_task(warm_up)
+
+metrics.REGISTRY.register(metrics.Gauge(
+    "trance_boot_first_tick_seconds", "Time from the start of app.py to the first clock step (0 until then)",
+    lambda: 0 if sessions.first_tick is None else sessions.first_tick - BOOT_STARTED))
+metrics.REGISTRY.register(metrics.Gauge("trance_sessions", "Live sessions", lambda: len(sessions.sessions)))
+metrics.REGISTRY.register(metrics.Gauge(
+    "trance_sessions_running", "Sessions whose sequencer is playing",
+    lambda: sum(1 for s in list(sessions.sessions.values()) if s.sequencer.is_running)))
+metrics.REGISTRY.register(metrics.Gauge(
+    "trance_clock_slips", "Grid slips across live sessions",
+    lambda: sum(s.sequencer.clock.stats.slips for s in list(sessions.sessions.values()))))
+
+if queue_manager:
+    queue_manager.command_handler = sessions.handle_command
+
+def owned(handler):
+    """Run a Socket.IO handler on the worker that owns the caller's session.
+
+    On any other worker the call is relayed to the owner, which runs it
+    with the same sid; its emits reach the client through the queue.
+    """
+    def relayed(sid, *args):
+        with app.test_request_context('/'):
+            request.sid = sid
+            request.namespace = '/'
+            handler(*args)
+    sessions.commands[handler.__name__] = relayed
+
+    @functools.wraps(handler)
+    def wrapper(*args):
+        if sessions.is_local(request.sid):
+            return handler(*args)
+        sessions.forward(request.sid, handler.__name__, args)
+    return wrapper
 
 @app.route('/')
 def index():
@@ -281,76 +193,287 @@ def index():
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
-    sequencer.start()
+    sequencer = sessions.start(request.sid)
     # Send initial state
-    emit('state_change', {'state': sequencer.state, 'bar': sequencer.bar_count})
+    emit('state_change', {'state': sequencer.state, 'bar': sequencer.bar_count, 'seed': sequencer.seed})
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    print('Client disconnected')
+    sessions.leave(request.sid)
+
+@socketio.on('join_session')
+def handle_join_session(data):
+    # Share one sequencer between everyone who joins the same room
+    room = data.get('room')
+    if not room:
+        return
+    old_room = sessions.room_for(request.sid)
+    if old_room != request.sid:
+        leave_room(old_room)
+    join_room(room)
+    sessions.join(request.sid, room)
+    print(f"Client joined session {room}")
+    start_session()
+
+@owned
+def start_session():
+    sequencer = sessions.start(request.sid)
+    emit('state_change', {'state': sequencer.state, 'bar': sequencer.bar_count, 'seed': sequencer.seed})
+
+@socketio.on('join_broadcast')
+def handle_join_broadcast(data):
+    # Listen to a shared radio stream: rendered once per bar for every listener
+    stream = data.get('stream')
+    if not stream:
+        return
+    old_room = sessions.room_for(request.sid)
+    room = sessions.subscribe(request.sid, stream)
+    if old_room not in (request.sid, room):
+        leave_room(old_room)
+    join_room(room)
+    print(f"Client joined broadcast {stream}")
+    start_listener(stream)
+
+@owned
+def start_listener(stream):
+    sync_listener(sessions.start(request.sid), stream)
+
+def sync_listener(sequencer, stream=None):
+    """Send a newcomer the current state and any buffered bars that have not started yet."""
+    snapshot = {'state': sequencer.state, 'bar': sequencer.bar_count, 'seed': sequencer.seed}
+    if stream:
+        snapshot['broadcast'] = stream
+    emit('state_change', snapshot)
+    for event, payload in sessions.replay(request.sid):
+        emit(event, payload)
 
 @socketio.on('start_music')
+@owned
 def handle_start():
     print('Starting music')
-    sequencer.start()
+    sequencer = sessions.start(request.sid)
     # Sync client state
-    emit('state_change', {'state': sequencer.state, 'bar': sequencer.bar_count})
+    stream = sessions.stream_for(request.sid)
+    if stream:
+        sync_listener(sequencer, stream)
+        return
+    emit('state_change', {'state': sequencer.state, 'bar': sequencer.bar_count, 'seed': sequencer.seed})
 
 @socketio.on('stop_music')
+@owned
 def handle_stop():
     print('Stopping music')
-    sequencer.stop()
+    sessions.stop(request.sid)
 
 @socketio.on('update_pattern')
+@owned
 def handle_update_pattern(pattern):
-    print('Pattern updated')
-    sequencer.pattern = sequencer.process_pattern(pattern)
+    sequencer = sessions.control(request.sid)
+    if sequencer is None:
+        return
+    try:
+        pattern, compiled = wait_for(ingest.submit_pattern(sequencer, pattern))
+    except UploadError as e:
+        print(f"Pattern rejected: {e}")
+        emit('upload_error', {'error': str(e)})
+        return
+    sequencer.queue_pattern(compiled, pattern)
+    print('Pattern updated at the next bar')
 
 @socketio.on('set_seed_pattern')
+@owned
 def handle_set_seed_pattern(data):
     name = data.get('name')
-    if name:
+    sequencer = sessions.control(request.sid)
+    if name and sequencer:
         sequencer.load_seed_pattern(name)
 
 @socketio.on('set_mutation')
+@owned
 def handle_set_mutation(data):
     val = data.get('value', 0)
+    sequencer = sessions.control(request.sid)
+    if sequencer is None:
+        return
     sequencer.mutation = float(val) / 100.0
     print(f"Mutation set to {sequencer.mutation}")
 
 @socketio.on('reset_pattern')
+@owned
 def handle_reset_pattern():
+    sequencer = sessions.control(request.sid)
+    if sequencer is None:
+        return
     print('Pattern reset')
-    sequencer.pattern = None
+    sequencer.set_pattern(None)
     sequencer.mutation = 0.0
     sequencer.arp_mode = "UpDown"
 
 @socketio.on('set_arp_mode')
+@owned
 def handle_set_arp_mode(data):
     mode = data.get('mode', 'UpDown')
+    sequencer = sessions.control(request.sid)
+    if sequencer is None:
+        return
     sequencer.arp_mode = mode
     print(f"Arp mode set to {mode}")
 
+@socketio.on('set_schedule_mode')
+@owned
+def handle_set_schedule_mode(data):
+    mode = data.get('mode', 'tick')
+    sequencer = sessions.control(request.sid)
+    if mode in ("tick", "bar", "binary") and sequencer:
+        sequencer.schedule_mode = mode
+        print(f"Schedule mode set to {mode}")
+
+@socketio.on('set_seed')
+@owned
+def handle_set_seed(data):
+    # Same seed + same controls = same event stream, so restart the arrangement too
+    seed = data.get('seed')
+    sequencer = sessions.control(request.sid)
+    if seed is None or seed == '' or sequencer is None:
+        return
+    sequencer.set_seed(seed)
+    sequencer.rewind()
+    print(f"Seed set to {seed}")
+    emit('state_change', {'state': sequencer.state, 'bar': sequencer.bar_count, 'seed': sequencer.seed})
+
 @socketio.on('set_bpm')
+@owned
 def handle_set_bpm(data):
     new_bpm = data.get('bpm')
-    if new_bpm is not None:
-        sequencer.bpm = new_bpm
-        sequencer.sixteenth_note_duration = (60 / sequencer.bpm) / 4
-        print(f"BPM updated to {sequencer.bpm}")
+    sequencer = sessions.control(request.sid)
+    if new_bpm is None or sequencer is None:
+        return
+    try:
+        new_bpm = sequencer.set_bpm(new_bpm)
+    except ValueError as e:
+        emit('control_error', {'control': 'bpm', 'error': str(e)})
+        return
+    print(f"BPM will change to {new_bpm} at the next bar")
 
 @app.route('/api/test-ollama', methods=['GET'])
 def test_ollama():
     response = generate_with_ollama("Say 'Ollama is working!' in exactly 3 words.")
     return {"ollama_response": response, "working": response is not None}
 
+@app.route('/api/timing', methods=['GET'])
+def timing():
+    return {**sessions.timing(), "boot": boot_timing()}
+
+@app.route('/api/bandwidth', methods=['GET'])
+def bandwidth():
+    return sessions.bandwidth()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/upload-midi', methods=['POST'])
+def upload_midi():
+    """Raw .mid bytes in the body, ?sid=<socket id> of the session to load them into."""
+    sid = request.args.get('sid', '')
+    if sid not in sessions.rooms_by_sid and sessions.is_local(sid):
+        return {"error": "unknown session"}, 404
+    if sessions.stream_for(sid):
+        return {"error": "broadcast listeners cannot change the pattern"}, 403
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        return {"error": f"file is larger than {MAX_UPLOAD_BYTES} bytes"}, 413
+    sequencer = sessions.control(sid)
+    try:
+        compiled = wait_for(ingest.submit_midi(request.stream, sequencer.scale if sequencer else G_MINOR))
+    except UploadError as e:
+        return {"error": str(e)}, 400
+    result = {"tracks": compiled.names, "steps": compiled.steps, "notes": sum(compiled.active)}
+    if sequencer is None:
+        # The session runs on another worker: parse here, ship the compiled pattern there
+        sessions.forward(sid, 'queue_compiled', [base64.b64encode(compiled.to_bytes()).decode('ascii')])
+        return result
+    sequencer.queue_pattern(compiled)
+    print(f"MIDI upload loaded: {compiled.names}, {compiled.steps} steps")
+    return {**result, "bar": sequencer.bar_count + (sequencer.sixteenth_count > 0)}
+
+def queue_compiled(sid, data):
+    """Relayed upload_midi result for a session owned by this worker."""
+    sequencer = sessions.control(sid)
+    if sequencer is not None:
+        compiled = CompactPattern.from_bytes(base64.b64decode(data))
+        sequencer.queue_pattern(compiled)
+        print(f"MIDI upload loaded: {compiled.names}, {compiled.steps} steps")
+
+sessions.commands['queue_compiled'] = queue_compiled
+
+# Stream name -> synth.AudioBroadcast shared by every HTTP listener of that stream
+audio_broadcasts = {}
+audio_lock = threading.Lock()
+audio_listeners = itertools.count()
+
+@app.route('/api/audio/<stream>.wav', methods=['GET'])
+def audio_stream(stream):
+    """Radio `stream` as its Socket.IO listeners hear it, synthesized server-side as WAV (?bars=N for a finite file)."""
+    from synth import AudioBroadcast
+    bars = request.args.get('bars', type=int)
+    if bars is not None:
+        bars = max(1, min(MAX_AUDIO_BARS, bars))
+    # Listen like a Socket.IO client would, so the broadcast runs while anyone is listening
+    listener = f"audio:{next(audio_listeners)}"
+    room = sessions.subscribe(listener, stream)
+    if sessions.start(listener) is None:
+        sessions.leave(listener)
+        return {"error": f"stream runs on worker {sessions.owner(room)}"}, 421
+    session = sessions.sessions[room]
+    with audio_lock:
+        broadcast = audio_broadcasts.get(stream)
+        if broadcast is None or broadcast.session is not session:
+            broadcast = audio_broadcasts[stream] = AudioBroadcast(session)
+
+    def generate():
+        try:
+            yield from broadcast.stream(bars, sleep=socketio.sleep)
+        finally:
+            sessions.leave(listener)
+            with audio_lock:
+                if room not in sessions.sessions and audio_broadcasts.get(stream) is broadcast:
+                    del audio_broadcasts[stream]
+
+    return Response(generate(), mimetype='audio/wav', headers={'Cache-Control': 'no-store'})
+
+@app.route('/api/audio/stats', methods=['GET'])
+def audio_stats():
+    from synth import VOICES
+    return VOICES.stats()
+
+@app.route('/api/patterns', methods=['GET'])
+def list_patterns():
+    """Seed patterns, filtered by ?key=G minor&bars=&min_bpm=&max_bpm=&min_density=&max_density=&q=&limit=&offset="""
+    args = request.args
+    return pattern_library.search(key=args.get('key'), bars=args.get('bars', type=int),
+                                  min_bpm=args.get('min_bpm', type=float), max_bpm=args.get('max_bpm', type=float),
+                                  min_density=args.get('min_density', type=float),
+                                  max_density=args.get('max_density', type=float),
+                                  text=args.get('q'), limit=min(500, args.get('limit', 50, type=int)),
+                                  offset=args.get('offset', 0, type=int))
+
+@app.route('/api/patterns/stats', methods=['GET'])
+def pattern_stats():
+    model = melody_model
+    return {**pattern_library.stats(), "melody_model": model.stats() if model else None}
+
 @app.route('/api/generate-pattern', methods=['POST'])
 def generate_pattern():
-    from trance_ai import TranceAI
-    
     data = request.json
     state = data.get('state', 'groove')
     energy = data.get('energy', 0.7)
-    
-    ai = TranceAI()
-    pattern = ai.generate_state_pattern(state, energy)
-    
+
+    try:
+        pattern = get_pattern_pool().take(state, energy).to_state_pattern()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
     return {"pattern": pattern, "state": state, "energy": energy}
 
 @app.route('/api/generate-music', methods=['POST'])
@@ -358,18 +481,10 @@ def generate_music():
     prompt = request.json.get('prompt', '')
     music_prompt = f"Return only valid JSON for {prompt} music: {{\"bpm\": 140, \"scale_notes\": [14,18,14,23,21], \"melody_pattern\": [0,2,1,4,3,1,2,0]}}"
     
-    response = generate_with_ollama(music_prompt)
-    if response:
-        try:
-            # Extract JSON from response
-            start = response.find('{')
-            end = response.rfind('}') + 1
-            if start != -1 and end != 0:
-                params = json.loads(response[start:end])
-                return params
-        except:
-            pass
-    
+    params = generate_with_ollama(music_prompt, parse_json=True)
+    if params:
+        return params
+
     # Fallback to random generation
     return {
         'bpm': random.randint(130, 145),
@@ -378,4 +493,6 @@ def generate_music():
     }
 
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
+    BOOT_READY = time.perf_counter()
+    print(f"Ready in {(BOOT_READY - BOOT_STARTED) * 1e3:.0f} ms")
+    socketio.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')), allow_unsafe_werkzeug=True)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""Benchmarks for the sequencer hot path and Socket.IO fan-out.
+
+    python benchmark.py                          # everything, JSON report on stdout
+    python benchmark.py --only tick,snap --out report.json
+    python benchmark.py --baseline report.json   # exit 1 if anything regressed
+
+The socket benchmark connects N Flask-SocketIO test clients to app.py's
+real session manager, so it runs in real time for --seconds.
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from compact_pattern import MAX_STEPS
+from delta import frame_size
+from markov import MelodyModel
+from midi_file import encode_midi
+from pattern_library import PatternLibrary
+from pitch import midi_to_note, note_to_midi
+from sequencer import PATTERN_DIR, Sequencer
+from synth import AudioRenderer, VoiceCache
+from trance_ai import TranceAI
+from uploads import compile_midi
+from wire import encode_bar
+
+STATES = ["Groove", "Breakdown", "Build-up", "Drop"]
+
+
+def summarize(samples_ns):
+    """Mean/p50/p99/max of nanosecond samples, in microseconds."""
+    ordered = sorted(samples_ns)
+    n = len(ordered)
+    return {
+        "n": n,
+        "mean_us": sum(ordered) / n / 1e3,
+        "p50_us": ordered[n // 2] / 1e3,
+        "p99_us": ordered[min(n - 1, int(n * 0.99))] / 1e3,
+        "max_us": ordered[-1] / 1e3,
+    }
+
+
+def bench_tick(bars=30):
+    """Cost of one Sequencer.tick() in each state (no socket, events discarded)."""
+    results = {}
+    for state in STATES:
+        sequencer = Sequencer(seed=1)
+        sequencer.state = state
+        sequencer.bar_count = 1  # Stay clear of the 32-bar state change
+        samples = []
+        for _ in range(bars * 16):
+            started = time.perf_counter_ns()
+            sequencer.tick()
+            samples.append(time.perf_counter_ns() - started)
+        results[state] = summarize(samples)
+    return results
+
+
+def synthetic_upload(notes, seed=1):
+    """A @tonejs/midi style pattern with `notes` random chromatic notes, stacked to stay within MAX_STEPS."""
+    rng = random.Random(seed)
+    per_step = -(-notes // (MAX_STEPS - 1))
+    return {"header": {"ppq": 480}, "tracks": [{"notes": [
+        {"name": midi_to_note(rng.randint(24, 96)), "ticks": i // per_step * 120, "time": i // per_step * 0.107,
+         "duration": 0.1}
+        for i in range(notes)]}]}
+
+
+def bench_snap(notes=5000, repeat=5):
+    """Scale snapping and compilation of a large upload, as JSON and as a .mid file."""
+    upload = synthetic_upload(notes)
+    sequencer = Sequencer(seed=1)
+    process, compile_ = [], []
+    for _ in range(repeat):
+        pattern = copy.deepcopy(upload)
+        started = time.perf_counter_ns()
+        sequencer.pattern = sequencer.process_pattern(pattern)
+        process.append(time.perf_counter_ns() - started)
+        started = time.perf_counter_ns()
+        sequencer.compile_pattern()
+        compile_.append(time.perf_counter_ns() - started)
+    # The same notes as a .mid file through the streaming upload path
+    midi = encode_midi([("Upload", 0, [(n["ticks"], 60, note_to_midi(n["name"]), 100)
+                                        for n in upload["tracks"][0]["notes"]])], ppq=480)
+    midi_compile = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        compile_midi(io.BytesIO(midi), max_bytes=None, max_notes=None)
+        midi_compile.append(time.perf_counter_ns() - started)
+    best_process, best_compile = min(process), min(compile_)
+    return {
+        "notes": notes,
+        "process_pattern_ms": best_process / 1e6,
+        "compile_pattern_ms": best_compile / 1e6,
+        "snap_notes_per_s": notes / (best_process / 1e9),
+        "midi_upload_ms": min(midi_compile) / 1e6,
+    }
+
+
+def bench_trance_ai(iterations=2000):
+    """TranceAI.generate_state_pattern latency per state, plus the groove from a trained melody model."""
+    model = MelodyModel()
+    for _, compiled in PatternLibrary(PATTERN_DIR).compiled():
+        model.learn(compiled)
+    runs = [(state, TranceAI(seed=1)) for state in ["groove", "breakdown", "buildup", "drop"]]
+    runs.append(("groove_markov", TranceAI(seed=1, model=model)))
+    results = {}
+    for name, ai in runs:
+        state = name.split('_')[0]
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter_ns()
+            ai.generate_state_pattern(state, 0.7)
+            samples.append(time.perf_counter_ns() - started)
+        results[name] = summarize(samples)
+    return results
+
+
+def bench_audio(bars=32):
+    """Server-side synthesis: real-time factor of one audio stream on one core, per state.
+
+    Each state starts with an empty voice cache, so warm-up is included.
+    """
+    results = {}
+    for state in STATES:
+        sequencer = Sequencer(seed=1)
+        sequencer.state = state
+        sequencer.bar_count = 1  # Stay clear of the 32-bar state change
+        sequencer.start()
+        renderer = AudioRenderer(sequencer, voices=VoiceCache())
+        samples = []
+        for _ in range(bars):
+            started = time.perf_counter_ns()
+            renderer.render_bar()
+            samples.append(time.perf_counter_ns() - started)
+        results[state] = {"realtime_factor": renderer.seconds / (sum(samples) / 1e9), "bar": summarize(samples)}
+    results["streams_per_core"] = int(min(r["realtime_factor"] for r in results.values()))
+    return results
+
+
+def bench_wire(bars=128, repeat=5):
+    """Bytes per bar and encode cost of bar batches, JSON vs the packed binary format."""
+    sequencer = Sequencer(seed=1, schedule_mode="bar")
+    sequencer.load_seed_pattern("acid_sequence")
+    sequencer.mutation = 0.3
+    batches = []
+    sequencer.output = lambda event, data=None: batches.append(data)
+    sequencer.start()
+    for _ in range(bars):
+        sequencer.step()
+
+    def best_us(encode):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            for batch in batches:
+                encode(batch)
+            elapsed = time.perf_counter_ns() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best / len(batches) / 1e3
+
+    json_bytes = sum(frame_size('bar_events', b) for b in batches) / len(batches)
+    binary_bytes = sum(frame_size('bar_binary', encode_bar(b)) for b in batches) / len(batches)
+    return {
+        "bars": len(batches),
+        "json_bytes_per_bar": json_bytes,
+        "binary_bytes_per_bar": binary_bytes,
+        "json_encode_us_per_bar": best_us(lambda b: json.dumps(['bar_events', b], separators=(',', ':'))),
+        "binary_encode_us_per_bar": best_us(encode_bar),
+    }
+
+
+class TimedQueue(list):
+    """Test-client receive queue that timestamps and sizes every packet."""
+
+    def __init__(self):
+        super().__init__()
+        self.arrivals = []  # (perf_counter_ns, event name, bytes)
+
+    def append(self, packet):
+        args = packet['args']
+        self.arrivals.append((time.perf_counter_ns(), packet['name'],
+                              frame_size(packet['name'], args[0] if args else None)))
+        # The packet itself is dropped to keep memory flat; only the log is needed
+
+
+def interval_jitter(times_ns, expected_s):
+    """How far consecutive arrivals deviate from the expected spacing, in ms."""
+    deviations = sorted(abs((b - a) / 1e9 - expected_s) * 1e3 for a, b in zip(times_ns, times_ns[1:]))
+    if not deviations:
+        return {"n": 0}
+    n = len(deviations)
+    return {"n": n, "mean_ms": sum(deviations) / n, "p99_ms": deviations[min(n - 1, int(n * 0.99))],
+            "max_ms": deviations[-1]}
+
+
+def bench_sockets(clients=20, seconds=5.0, mode="tick", warmup=1.0):
+    """End-to-end emit-to-receive timing and bandwidth with N local test clients."""
+    # The server logs with print(); keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as server
+
+        test_clients = []
+        for _ in range(clients):
+            client = server.socketio.test_client(server.app)
+            client.queue = TimedQueue()
+            if mode == "broadcast":
+                client.emit('join_broadcast', {'stream': 'benchmark'})
+            elif mode != "tick":
+                client.emit('set_schedule_mode', {'mode': mode})
+            test_clients.append(client)
+
+        # Measure only steady state, not the connection handshakes above
+        time.sleep(warmup)
+        for client in test_clients:
+            client.queue.arrivals.clear()
+        for session in list(server.sessions.sessions.values()):
+            session.sequencer.clock.stats.reset()
+
+        cpu_started = time.process_time()
+        time.sleep(seconds)
+        # Includes the in-process test clients, which only timestamp each packet
+        cpu = time.process_time() - cpu_started
+        timing = server.sessions.timing()
+        for client in test_clients:
+            client.disconnect()
+
+    # Sidechain fires every beat in tick mode; bar modes deliver one batch per bar
+    marker, expected = {"tick": ('trigger_sidechain', 60 / 140), "bar": ('bar_events', 4 * 60 / 140),
+                        "binary": ('bar_binary', 4 * 60 / 140), "broadcast": ('bar_binary', 4 * 60 / 140)}[mode]
+    per_client = []
+    for client in test_clients:
+        arrivals = client.queue.arrivals
+        total_bytes = sum(size for _, _, size in arrivals)
+        per_client.append({
+            "frames_per_s": len(arrivals) / seconds,
+            "bytes_per_s": total_bytes / seconds,
+            "jitter": interval_jitter([t for t, name, _ in arrivals if name == marker], expected),
+        })
+
+    # None (null in the report) when nothing was measured, rather than a perfect-looking 0
+    jitter_means = [c["jitter"]["mean_ms"] for c in per_client if c["jitter"]["n"]]
+    lateness = [room["p99_ms"] for room in timing["rooms"].values() if room["p99_ms"] is not None]
+    return {
+        "clients": clients,
+        "seconds": seconds,
+        "mode": mode,
+        "frames_per_s_per_client": sum(c["frames_per_s"] for c in per_client) / clients,
+        "bytes_per_s_per_client": sum(c["bytes_per_s"] for c in per_client) / clients,
+        "bytes_per_bar_per_client": sum(c["bytes_per_s"] for c in per_client) / clients * 4 * 60 / 140,
+        "cpu_ms_per_s_per_client": cpu / seconds / clients * 1e3,
+        "jitter_mean_ms": sum(jitter_means) / len(jitter_means) if jitter_means else None,
+        "jitter_max_ms": max((c["jitter"]["max_ms"] for c in per_client if c["jitter"]["n"]), default=None),
+        "tick_lateness_p99_ms": max(lateness, default=None),
+    }
+
+
+def bench_boot(runs=3, port=5099, timeout=30.0):
+    """Cold start of `python app.py`: time until a Socket.IO client connects and hears its first event.
+
+    Also reports the server's own boot timing (/api/timing), measured from
+    the start of app.py rather than from process launch.
+    """
+    import requests
+    import socketio
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    connect, first_event, server = [], [], []
+    for _ in range(runs):
+        started = time.perf_counter_ns()
+        process = subprocess.Popen([sys.executable, app_path], env=dict(os.environ, PORT=str(port)),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        client = socketio.Client()
+        heard = []
+        client.on('*', lambda event, *args: heard or heard.append(time.perf_counter_ns()))
+        try:
+            while True:
+                try:
+                    client.connect(f"http://127.0.0.1:{port}", transports=['polling'])
+                    break
+                except socketio.exceptions.ConnectionError:
+                    if (time.perf_counter_ns() - started) / 1e9 > timeout:
+                        raise
+                    time.sleep(0.005)
+            connect.append(time.perf_counter_ns() - started)
+            # Every client gets its own session, playing from the moment it connects
+            while not heard:
+                time.sleep(0.001)
+            first_event.append(heard[0] - started)
+            server.append(requests.get(f"http://127.0.0.1:{port}/api/timing", timeout=5).json()["boot"])
+        finally:
+            client.disconnect()
+            process.terminate()
+            process.wait()
+    return {
+        "connect_ms": summarize(connect)["p50_us"] / 1e3,
+        "first_event_ms": summarize(first_event)["p50_us"] / 1e3,
+        "server": {key: sorted(boot[key] for boot in server)[len(server) // 2] for key in server[0]},
+    }
+
+
+BENCHMARKS = {
+    "tick": bench_tick,
+    "snap": bench_snap,
+    "trance_ai": bench_trance_ai,
+    "wire": bench_wire,
+    "audio": bench_audio,
+    "sockets": bench_sockets,
+    "boot": bench_boot,
+}
+
+# Metrics checked against a baseline (lower is better for all of them)
+REGRESSION_METRICS = [
+    ("tick", "worst p99_us", lambda r: max(s["p99_us"] for s in r.values())),
+    ("snap", "process+compile ms", lambda r: r["process_pattern_ms"] + r["compile_pattern_ms"]),
+    ("trance_ai", "worst p99_us", lambda r: max(s["p99_us"] for s in r.values())),
+    ("wire", "binary_bytes_per_bar", lambda r: r["binary_bytes_per_bar"]),
+    ("audio", "worst bar p99_us", lambda r: max(r[state]["bar"]["p99_us"] for state in STATES)),
+    ("sockets", "bytes_per_s_per_client", lambda r: r["bytes_per_s_per_client"]),
+    ("sockets", "tick_lateness_p99_ms", lambda r: r["tick_lateness_p99_ms"]),
+    ("boot", "first_event_ms", lambda r: r["first_event_ms"]),
+]
+
+
+def compare(report, baseline, tolerance):
+    """List of human-readable regressions beyond `tolerance` (0.2 = 20%)."""
+    regressions = []
+    for name, label, metric in REGRESSION_METRICS:
+        now_results = report["results"].get(name)
+        then_results = baseline.get("results", {}).get(name)
+        if not now_results or not then_results:
+            continue
+        if name == "sockets" and now_results["mode"] != then_results["mode"]:
+            continue  # Scheduling modes are not comparable
+        now, then = metric(now_results), metric(then_results)
+        if now is None or then is None:
+            continue  # Nothing measured on one side
+        if then > 0 and now > then * (1 + tolerance):
+            regressions.append(f"{name} {label}: {then:.3f} -> {now:.3f} (+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', help="comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument('--clients', type=int, default=20, help="simulated Socket.IO clients")
+    parser.add_argument('--seconds', type=float, default=5.0, help="socket benchmark duration")
+    parser.add_argument('--mode', default="tick", choices=["tick", "bar", "binary", "broadcast"],
+                        help="socket scheduling mode (broadcast: every client on one shared stream)")
+    parser.add_argument('--notes', type=int, default=5000, help="notes in the synthetic upload")
+    parser.add_argument('--out', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="previous report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before failing")
+    args = parser.parse_args()
+
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    options = {"sockets": {"clients": args.clients, "seconds": args.seconds, "mode": args.mode},
+               "snap": {"notes": args.notes}}
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": {},
+    }
+    for name in selected:
+        print(f"Running {name}...", file=sys.stderr)
+        report["results"][name] = BENCHMARKS[name](**options.get(name, {}))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
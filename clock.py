@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import time
+from collections import deque
+
+
+class JitterStats:
+    """Rolling record of how late each tick fired, in nanoseconds."""
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.ticks = 0
+        self.slips = 0
+        self.max_late_ns = 0
+
+    def record(self, late_ns):
+        self.samples.append(late_ns)
+        self.ticks += 1
+        if late_ns > self.max_late_ns:
+            self.max_late_ns = late_ns
+
+    def reset(self):
+        self.samples.clear()
+        self.ticks = 0
+        self.slips = 0
+        self.max_late_ns = 0
+
+    def snapshot(self):
+        """Summary in milliseconds over the recent window (max is all-time); None before any tick."""
+        recent = sorted(self.samples)
+        if not recent:
+            return {"ticks": self.ticks, "slips": self.slips, "window": 0,
+                    "mean_ms": None, "p50_ms": None, "p99_ms": None, "max_ms": None}
+        n = len(recent)
+        return {
+            "ticks": self.ticks,
+            "slips": self.slips,
+            "window": n,
+            "mean_ms": sum(recent) / n / 1e6,
+            "p50_ms": recent[n // 2] / 1e6,
+            "p99_ms": recent[min(n - 1, int(n * 0.99))] / 1e6,
+            "max_ms": self.max_late_ns / 1e6,
+        }
+
+
+class TickClock:
+    """Deadline clock built on time.monotonic_ns().
+
+    Deadlines are accumulated from the previous deadline rather than from
+    "now", so there is no drift. If the loop falls more than one interval
+    behind, the grid slips forward to the present instead of firing the
+    missed ticks back-to-back.
+    """
+
+    def __init__(self):
+        self.start_ns = 0
+        self.deadline_ns = 0
+        self.stats = JitterStats()
+
+    def start(self, now_ns=None):
+        self.start_ns = time.monotonic_ns() if now_ns is None else now_ns
+        self.deadline_ns = self.start_ns
+        self.stats.reset()
+
+    def until_next(self, now_ns=None):
+        """Seconds until the next deadline (<= 0 means the tick is due)."""
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        return (self.deadline_ns - now_ns) / 1e9
+
+    def mark(self, now_ns=None):
+        """Record the lateness of the tick that is about to run."""
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        late_ns = max(0, now_ns - self.deadline_ns)
+        self.stats.record(late_ns)
+        return late_ns
+
+    def advance(self, interval, now_ns=None):
+        """Move the deadline on by `interval` seconds, slipping if far behind."""
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        interval_ns = int(interval * 1e9)
+        self.deadline_ns += interval_ns
+        if now_ns - self.deadline_ns > interval_ns:
+            self.deadline_ns = now_ns
+            self.stats.slips += 1
+        return self.deadline_ns
+
+    def transport_time(self, ns=None):
+        """Seconds since start() on the clock's own timeline."""
+        ns = self.deadline_ns if ns is None else ns
+        return (ns - self.start_ns) / 1e9
+
+    def now(self):
+        return self.transport_time(time.monotonic_ns())
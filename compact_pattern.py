@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Fixed-width, array-backed step patterns.
+
+One CompactPattern holds every track of a pattern as four flat arrays
+(pitch, velocity, duration, active), indexed by track * steps + step.
+Comparing and serializing a pattern is then a handful of array operations
+instead of walking thousands of small dicts.
+
+Converters cover the three formats used in this repo:
+- TranceAI / pattern_generator step lists ({"note", "vel"/"velocity", "dur"/"duration"} or None)
+- trigger masks ([1, 0, 0, 0, ...]) and bare pitch lists ([67, 77, ...])
+- @tonejs/midi JSON ({"tracks": [{"notes": [{"name", "time"/"ticks", ...}]}]})
+"""
+import struct
+import sys
+from array import array
+
+from pitch import note_to_midi
+
+PPQ = 96  # Duration resolution in ticks per beat
+TICKS_PER_STEP = PPQ // 4
+DEFAULT_VELOCITY = 100
+DRUM_PITCH = 36  # Pitch given to trigger-mask tracks (GM bass drum)
+MAGIC = b'CPAT'
+MAX_BARS = 256  # Longest pattern from_tracks/from_placed will allocate
+MAX_STEPS = MAX_BARS * 16
+MAX_VOICES = 16  # Notes one track may stack on a single step
+
+
+def _beats_to_ticks(beats):
+    return min(0xFFFF, max(1, int(round(beats * PPQ))))
+
+
+def _number(note, key, default):
+    """note[key] if it is a real number, else ValueError (naming the type, never the value)."""
+    value = note.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"note {key} must be a number, not {type(value).__name__}")
+    return value
+
+
+class CompactPattern:
+    __slots__ = ("names", "steps", "pitch", "velocity", "duration", "active")
+
+    def __init__(self, names=(), steps=16):
+        self.names = list(names)
+        self.steps = steps
+        size = len(self.names) * steps
+        self.pitch = array('B', bytes(size))
+        self.velocity = array('B', bytes(size))
+        self.duration = array('H', [TICKS_PER_STEP]) * size
+        self.active = array('B', bytes(size))
+
+    def __len__(self):
+        return self.steps
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __eq__(self, other):
+        if not (isinstance(other, CompactPattern) and self.names == other.names
+                and self.steps == other.steps and self.active == other.active):
+            return False
+        return all(self.pitch[i] == other.pitch[i] and self.velocity[i] == other.velocity[i]
+                   and self.duration[i] == other.duration[i] for i, on in enumerate(self.active) if on)
+
+    def __repr__(self):
+        return f"CompactPattern({self.names!r}, steps={self.steps})"
+
+    def track(self, name):
+        """Index of track `name`, adding an empty track if it does not exist."""
+        try:
+            return self.names.index(name)
+        except ValueError:
+            return self._add_track(name)
+
+    def _add_track(self, name):
+        """Append an empty track without looking for an existing one; returns its index."""
+        self.names.append(name)
+        self.pitch.extend(bytes(self.steps))
+        self.velocity.extend(bytes(self.steps))
+        self.duration.extend(array('H', [TICKS_PER_STEP]) * self.steps)
+        self.active.extend(bytes(self.steps))
+        return len(self.names) - 1
+
+    def set(self, name, step, pitch, velocity=DEFAULT_VELOCITY, duration=TICKS_PER_STEP):
+        i = self.track(name) * self.steps + step
+        self.pitch[i] = min(127, max(0, int(pitch)))
+        self.velocity[i] = min(127, max(0, int(velocity)))
+        self.duration[i] = duration
+        self.active[i] = 1
+
+    def clear(self, name, step):
+        if name in self.names:
+            self.active[self.names.index(name) * self.steps + step] = 0
+
+    def get(self, name, step):
+        """(pitch, velocity, duration_ticks) at `step`, or None for a rest."""
+        if name not in self.names:
+            return None
+        i = self.names.index(name) * self.steps + step % self.steps
+        if not self.active[i]:
+            return None
+        return self.pitch[i], self.velocity[i], self.duration[i]
+
+    def notes(self, name):
+        """(step, pitch, velocity, duration_ticks) for every active step of a track."""
+        base = self.names.index(name) * self.steps
+        return [(step, self.pitch[base + step], self.velocity[base + step], self.duration[base + step])
+                for step in range(self.steps) if self.active[base + step]]
+
+    # Bulk serialization
+
+    def to_bytes(self):
+        header = struct.pack('<4sHH', MAGIC, len(self.names), self.steps)
+        names = b''.join(struct.pack('<B', len(n)) + n for n in (name.encode('utf-8')[:255] for name in self.names))
+        duration = array('H', self.duration)
+        if sys.byteorder == 'big':
+            duration.byteswap()
+        return header + names + self.pitch.tobytes() + self.velocity.tobytes() + duration.tobytes() + self.active.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, count, steps = struct.unpack_from('<4sHH', data)
+        if magic != MAGIC:
+            raise ValueError("not a compact pattern")
+        offset = struct.calcsize('<4sHH')
+        names = []
+        for _ in range(count):
+            length = data[offset]
+            names.append(data[offset + 1:offset + 1 + length].decode('utf-8'))
+            offset += 1 + length
+        pattern = cls.__new__(cls)
+        pattern.names = names
+        pattern.steps = steps
+        size = count * steps
+        pattern.pitch = array('B', data[offset:offset + size])
+        pattern.velocity = array('B', data[offset + size:offset + 2 * size])
+        pattern.duration = array('H')
+        pattern.duration.frombytes(data[offset + 2 * size:offset + 4 * size])
+        if sys.byteorder == 'big':
+            pattern.duration.byteswap()
+        pattern.active = array('B', data[offset + 4 * size:offset + 5 * size])
+        return pattern
+
+    # Converters
+
+    @classmethod
+    def from_state_pattern(cls, patterns, steps=16):
+        """From TranceAI.generate_state_pattern() or generate_trance_pattern() output."""
+        pattern = cls(steps=steps)
+        for name, track in patterns.items():
+            pattern.track(name)
+            if all(value in (0, 1) for value in track):
+                # Trigger mask (kick)
+                for step, hit in enumerate(track[:steps]):
+                    if hit:
+                        pattern.set(name, step, DRUM_PITCH)
+                continue
+            for step, value in enumerate(track[:steps]):
+                if value is None:
+                    continue
+                if isinstance(value, int):
+                    # Bare pitch list (switch_angel motif)
+                    pattern.set(name, step, value)
+                    continue
+                velocity = value.get('vel', value.get('velocity', DEFAULT_VELOCITY))
+                beats = value.get('dur', value.get('duration'))
+                pattern.set(name, step, value['note'], velocity,
+                            TICKS_PER_STEP if beats is None else _beats_to_ticks(beats))
+        return pattern
+
+    def to_state_pattern(self, masks=("kick",)):
+        """Back to the TranceAI shape: {track: [None | {"note", "vel", "dur"}] * steps}.
+
+        Tracks named in `masks` come back as 0/1 trigger lists.
+        """
+        patterns = {}
+        for name in self.names:
+            if name in masks:
+                base = self.names.index(name) * self.steps
+                patterns[name] = list(self.active[base:base + self.steps])
+                continue
+            track = [None] * self.steps
+            for step, pitch, velocity, duration in self.notes(name):
+                track[step] = {"note": pitch, "vel": velocity, "dur": duration / PPQ}
+            patterns[name] = track
+        return patterns
+
+    @classmethod
+    def from_tracks(cls, pattern, bpm=140):
+        """From @tonejs/midi JSON, quantized to sixteenths and padded to whole bars.
+
+        Each JSON track becomes one or more voices ("Lead", "Lead/2", ...) so that
+        notes landing on the same step are all kept, in their original order.
+        Returns None for a pattern without notes; raises ValueError for one
+        longer than MAX_BARS or with fields of the wrong type.
+        """
+        header = pattern.get('header', {})
+        ppq = _number(header, 'ppq', None) if isinstance(header, dict) and header.get('ppq') is not None else None
+        beats_per_second = bpm / 60
+        default_velocity = DEFAULT_VELOCITY / 127
+        placed = []
+        seen = set()
+        tracks = pattern.get('tracks', [])
+        if not isinstance(tracks, list):
+            raise ValueError("tracks must be a list")
+        for t, track in enumerate(tracks):
+            if not isinstance(track, dict) or not isinstance(track.get('notes', []), list):
+                raise ValueError("each track must be an object with a list of notes")
+            name = track.get('name') or f"track{t}"
+            if not isinstance(name, str):
+                raise ValueError(f"track name must be a string, not {type(name).__name__}")
+            if name in seen:
+                name = f"{name}#{t}"
+            seen.add(name)
+            for note in track.get('notes', []):
+                if not isinstance(note, dict):
+                    raise ValueError("each note must be an object")
+                if ppq and 'ticks' in note:
+                    beats = _number(note, 'ticks', 0) / ppq
+                    length = _number(note, 'durationTicks', ppq / 4) / ppq
+                else:
+                    beats = _number(note, 'time', 0) * beats_per_second
+                    length = _number(note, 'duration', 0.25 / beats_per_second) * beats_per_second
+                # Names win over 'midi', which Scale.snap_track leaves untouched
+                if 'name' in note:
+                    if not isinstance(note['name'], str):
+                        raise ValueError(f"note name must be a string, not {type(note['name']).__name__}")
+                    midi = note_to_midi(note['name'])
+                else:
+                    midi = _number(note, 'midi', 67)
+                step = beats * 4
+                if not step < MAX_STEPS - 0.5:  # Also catches NaN and infinity
+                    raise ValueError(f"pattern is longer than {MAX_BARS} bars")
+                step = round(step)
+                velocity = min(1.0, max(0.0, _number(note, 'velocity', default_velocity)))
+                ticks = length * PPQ + 0.5
+                placed.append((step if step > 0 else 0, name, midi, int(velocity * 127),
+                               min(0xFFFF, int(ticks)) if ticks >= 1 else 1))  # Also NaN -> 1
+        return cls.from_placed(placed)
+
+    @classmethod
+    def from_placed(cls, placed):
+        """From (step, track name, midi, velocity 0-127, duration ticks) tuples.
+
+        Shared by from_tracks and the MIDI upload path; None if `placed` is empty.
+        Raises ValueError rather than allocate more than MAX_STEPS steps or
+        stack more than MAX_VOICES notes of one track on a step.
+        """
+        if not placed:
+            return None
+
+        last = max(p[0] for p in placed)
+        if last >= MAX_STEPS:
+            raise ValueError(f"pattern is longer than {MAX_BARS} bars")
+        steps = -(-(last + 1) // 16) * 16
+        compact = cls(steps=steps)
+        voices = {}  # voice name -> track index
+        next_voice = {}  # (track name, step) -> number of the next free voice there
+        pitch, velocities, durations, active = compact.pitch, compact.velocity, compact.duration, compact.active
+        for step, name, midi, velocity, duration in placed:
+            i = None
+            while i is None or active[i]:  # Only loops again if a track is really called "<name>/<n>"
+                n = next_voice.get((name, step), 1)
+                if n > MAX_VOICES:
+                    raise ValueError(f"more than {MAX_VOICES} notes of {name} on one step")
+                next_voice[name, step] = n + 1
+                voice = name if n == 1 else f"{name}/{n}"
+                t = voices.get(voice)
+                if t is None:
+                    t = voices[voice] = compact._add_track(voice)  # Extends the arrays in place
+                i = t * steps + step
+            pitch[i] = midi if 0 <= midi <= 127 else min(127, max(0, int(midi)))
+            velocities[i] = velocity if 0 <= velocity <= 127 else min(127, max(0, velocity))
+            durations[i] = duration
+            active[i] = 1
+        return compact
+
+    def step_voices(self, step):
+        """(pitch, velocity) of every note at `step` across all tracks, in track order."""
+        step %= self.steps
+        return [(self.pitch[i], self.velocity[i]) for i in range(step, len(self.active), self.steps) if self.active[i]]
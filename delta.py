@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import json
+import time
+
+
+def frame_size(event, data):
+    """Approximate size of one Socket.IO event frame in bytes."""
+    if isinstance(data, (bytes, bytearray)):
+        # Binary attachments travel as a small placeholder frame plus the raw bytes
+        return len(json.dumps([event, {"_placeholder": True, "num": 0}], separators=(',', ':'))) + len(data)
+    return len(json.dumps([event, data], separators=(',', ':')))
+
+
+class DeltaChannel:
+    """Change-only emission with a last-sent cache and savings counters.
+
+    send() only emits when the token for a key differs from what was last
+    sent. Callers report every frame the old per-tick path would have sent
+    but no longer does via count_saved(), so the savings can be shown.
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.last_sent = {}
+        self.reset_stats()
+
+    def reset(self):
+        """Forget what was sent so the next value for every key goes out again."""
+        self.last_sent.clear()
+
+    def reset_stats(self):
+        self.started = time.monotonic()
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.saved_frames = 0
+        self.saved_bytes = 0
+
+    def send(self, key, event, data, token=None):
+        token = (event, data) if token is None else token
+        if key in self.last_sent and self.last_sent[key] == token:
+            return False
+        self.last_sent[key] = token
+        self.sent_frames += 1
+        self.sent_bytes += frame_size(event, data)
+        self.emit(event, data)
+        return True
+
+    def count_saved(self, event, data):
+        self.saved_frames += 1
+        self.saved_bytes += frame_size(event, data)
+
+    def snapshot(self):
+        minutes = max(time.monotonic() - self.started, 1e-6) / 60
+        return {
+            "sent_frames": self.sent_frames,
+            "sent_bytes": self.sent_bytes,
+            "saved_frames": self.saved_frames,
+            "saved_bytes": self.saved_bytes,
+            "saved_frames_per_min": self.saved_frames / minutes,
+            "saved_bytes_per_min": self.saved_bytes / minutes,
+        }
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""N-gram melody model trained from compiled patterns.
+
+Each track of a CompactPattern is read as a loop of notes and turned into
+three token streams:
+- pitch intervals between consecutive notes (-12..+12 semitones)
+- gaps in steps to the next note (1..16)
+- note length in steps (1..8), conditioned on the gap
+
+Transition counts for every context of up to `order` previous tokens live
+in flat array('I') tables, so learning is an increment. Sampling is a
+bisect over a row's cumulative counts, built once per row after each
+round of learning. Unseen contexts back off to shorter ones.
+
+app.py trains one model from the pattern library and freezes it before
+any session starts, so every session samples the same fixed tables.
+"""
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from compact_pattern import PPQ, TICKS_PER_STEP
+
+MAX_INTERVAL = 12
+INTERVALS = 2 * MAX_INTERVAL + 1
+MAX_GAP = 16
+MAX_LENGTH = 8
+
+
+class NGramTable:
+    """Counts of next-token given the previous 0..order tokens, over `size` symbols."""
+
+    __slots__ = ("size", "order", "counts", "rows")
+
+    def __init__(self, size, order=2):
+        self.size = size
+        self.order = order
+        # counts[k]: contexts of length k, row-major (context index * size + next token)
+        self.counts = [array('I', bytes(4 * size ** (k + 1))) for k in range(order + 1)]
+        self.rows = {}  # context tuple -> (cumulative counts, total), rebuilt after learning
+
+    def learn(self, tokens):
+        """Count every transition in `tokens`, read as a loop."""
+        n = len(tokens)
+        size = self.size
+        for i in range(n):
+            for k in range(self.order + 1):
+                context = 0
+                for j in range(i - k, i):
+                    context = context * size + tokens[j % n]
+                self.counts[k][context * size + tokens[i]] += 1
+        self.rows = {}
+
+    def add(self, context, token):
+        """Count one transition; `context` is a tuple of previous tokens."""
+        index = 0
+        for previous in context:
+            index = index * self.size + previous
+        self.counts[len(context)][index * self.size + token] += 1
+        self.rows = {}
+
+    def sample(self, history, rng):
+        """Next token after the tuple `history` (most recent last, at most `order` long).
+
+        Returns None if nothing was ever learned.
+        """
+        rows = self.rows
+        for k in range(len(history), -1, -1):
+            context = history[len(history) - k:]
+            row = rows.get(context)
+            if row is None:
+                row = self._row(context)
+            if row[1]:
+                return bisect_right(row[0], rng.random() * row[1])
+        return None
+
+    def _row(self, context):
+        index = 0
+        for token in context:
+            index = index * self.size + token
+        start = index * self.size
+        cumulative = list(accumulate(self.counts[len(context)][start:start + self.size]))
+        row = self.rows[context] = (cumulative, cumulative[-1])
+        return row
+
+
+class MelodyModel:
+    def __init__(self, order=2):
+        self.order = order
+        self.intervals = NGramTable(INTERVALS, order)
+        self.gaps = NGramTable(MAX_GAP, order)
+        self.lengths = NGramTable(MAX_GAP, 1)  # Context is the gap; only the first MAX_LENGTH symbols are used
+        self.lock = threading.Lock()  # Serializes learners; sampling reads without it
+        self.notes_learned = 0
+        self.patterns_learned = 0
+        self.frozen = False
+
+    @property
+    def trained(self):
+        return self.notes_learned > 0
+
+    def freeze(self):
+        """Stop learning; generate() output then depends only on the rng."""
+        with self.lock:
+            self.frozen = True
+        return self
+
+    def learn(self, pattern):
+        """Add every track of a CompactPattern to the tables (RuntimeError once frozen)."""
+        with self.lock:
+            if self.frozen:
+                raise RuntimeError("melody model is frozen")
+            for name in pattern.names:
+                notes = pattern.notes(name)
+                if len(notes) < 2:
+                    continue
+                steps = [step for step, _, _, _ in notes]
+                pitches = [pitch for _, pitch, _, _ in notes]
+                gaps = [(steps[(i + 1) % len(steps)] - step) % pattern.steps or pattern.steps
+                        for i, step in enumerate(steps)]
+                intervals = [max(-MAX_INTERVAL, min(MAX_INTERVAL, pitches[(i + 1) % len(pitches)] - pitch))
+                             + MAX_INTERVAL for i, pitch in enumerate(pitches)]
+                gap_tokens = [min(MAX_GAP, gap) - 1 for gap in gaps]
+                self.intervals.learn(intervals)
+                self.gaps.learn(gap_tokens)
+                for gap, (_, _, _, duration) in zip(gap_tokens, notes):
+                    length = max(1, min(MAX_LENGTH, round(duration / TICKS_PER_STEP))) - 1
+                    self.lengths.add((gap,), length)
+                    self.lengths.add((), length)
+                self.notes_learned += len(notes)
+            self.patterns_learned += 1
+
+    def generate(self, rng, scale, low, high, steps=16, start=None, velocity=(60, 90)):
+        """A new line as TranceAI step dicts ({"note", "vel", "dur"} or None), or None if untrained.
+
+        Pitches walk by sampled intervals, folded by octaves into [low, high]
+        and snapped to `scale`.
+        """
+        if not self.trained:
+            return None
+        pattern = [None] * steps
+        low_velocity, velocity_range = velocity[0], velocity[1] - velocity[0] + 1
+        pitch = scale.snap(start if start is not None else low + (high - low) // 3)
+        order = self.order
+        intervals = gaps = ()
+        step = 0
+        while step < steps:
+            gap = self.gaps.sample(gaps, rng)
+            gap = 3 if gap is None else gap
+            length = self.lengths.sample((gap,), rng)
+            pattern[step] = {"note": pitch, "vel": low_velocity + int(rng.random() * velocity_range),
+                             "dur": (1 if length is None else length + 1) * TICKS_PER_STEP / PPQ}
+            gaps = (gaps + (gap,))[-order:]
+            step += gap + 1
+
+            interval = self.intervals.sample(intervals, rng)
+            interval = MAX_INTERVAL if interval is None else interval
+            intervals = (intervals + (interval,))[-order:]
+            pitch += interval - MAX_INTERVAL
+            while pitch > high:
+                pitch -= 12
+            while pitch < low:
+                pitch += 12
+            pitch = scale.snap(pitch)
+        return pattern
+
+    def stats(self):
+        return {"patterns": self.patterns_learned, "notes": self.notes_learned, "order": self.order,
+                "frozen": self.frozen}
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""In-process counters and histograms, rendered as Prometheus text.
+
+Every metric keeps plain ints/floats in lists allocated when its label set
+is first seen, so recording a sample is a dict lookup, a bisect and an
+add. Expensive measurements (per-instrument timing, frame sizes) are only
+taken on every SAMPLE_EVERY-th occasion and scaled up.
+"""
+import os
+import time
+from bisect import bisect_left
+
+from delta import frame_size
+
+# 1 measures everything; larger values trade precision for less overhead.
+# Odd by default so tick samples walk across all 16 steps of the bar.
+SAMPLE_EVERY = max(1, int(os.getenv('METRICS_SAMPLE_EVERY', '15')))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class DerivedCounter(Counter):
+    """Counter whose per-label totals are computed by `read()` at scrape time."""
+
+    def __init__(self, name, help, labelnames, read):
+        super().__init__(name, help, labelnames)
+        self.read = read
+
+    def render(self):
+        self.values = self.read()
+        return super().render()
+
+
+class Histogram:
+    """Fixed-bucket histogram; bucket bounds are upper limits in seconds."""
+
+    def __init__(self, name, help, buckets, labelnames=(), prealloc=()):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self.series = {}  # labels -> [bucket counts (+Inf last), sum, count]
+        for labels in prealloc:
+            self._series(labels if isinstance(labels, tuple) else (labels,))
+
+    def _series(self, labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value, *labels):
+        series = self._series(labels)
+        series[0][bisect_left(self.bounds, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.bounds + (float('inf'),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(self.read())}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TICK_BUCKETS = (25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3)
+LATENESS_BUCKETS = (0.5e-3, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 250e-3)
+PATTERN_BUCKETS = (100e-6, 1e-3, 5e-3, 10e-3, 50e-3, 100e-3, 500e-3, 1.0)
+REQUEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PLAYERS = ("play_kick", "play_bass", "play_lead", "play_chords", "play_piano",
+           "play_pads", "play_arp", "play_fx", "update_params")
+
+TICK_SECONDS = REGISTRY.register(Histogram(
+    "trance_tick_seconds", "Time spent in Sequencer.tick()", TICK_BUCKETS))
+TICK_LATENESS = REGISTRY.register(Histogram(
+    "trance_tick_lateness_seconds", "How late each clock step fired", LATENESS_BUCKETS))
+PLAY_SECONDS = REGISTRY.register(Histogram(
+    "trance_play_seconds", "Time per instrument method (sampled)", TICK_BUCKETS,
+    labelnames=("method",), prealloc=PLAYERS))
+EMIT_FRAMES = REGISTRY.register(Counter(
+    "trance_emit_frames_total", "Socket.IO frames sent, counting every room member", ("event",)))
+_emit_calls = {}
+_emit_samples = {}  # event -> [sampled bytes, sampled frames]
+
+
+def _emit_bytes():
+    return {labels: int(frames * _emit_samples[labels[0]][0] / _emit_samples[labels[0]][1])
+            for labels, frames in EMIT_FRAMES.values.items() if labels[0] in _emit_samples}
+
+
+EMIT_BYTES = REGISTRY.register(DerivedCounter(
+    "trance_emit_bytes_total", "Socket.IO payload bytes sent (frames x mean sampled frame size)",
+    ("event",), _emit_bytes))
+PROCESS_PATTERN_SECONDS = REGISTRY.register(Histogram(
+    "trance_process_pattern_seconds", "Time to snap an uploaded pattern to the scale", PATTERN_BUCKETS))
+AUDIO_BAR_SECONDS = REGISTRY.register(Histogram(
+    "trance_audio_bar_seconds", "Time to synthesize one bar of server-side audio", PATTERN_BUCKETS))
+OLLAMA_SECONDS = REGISTRY.register(Histogram(
+    "trance_ollama_seconds", "generate_with_ollama latency", REQUEST_BUCKETS,
+    labelnames=("outcome",), prealloc=("ok", "empty")))
+
+
+def record_emit(event, data, fanout=1):
+    """Count one emit to `fanout` clients; its size is measured every SAMPLE_EVERY-th time."""
+    EMIT_FRAMES.inc(event, amount=fanout)
+    calls = _emit_calls.get(event, 0)
+    _emit_calls[event] = calls + 1
+    # The first emit of each event type is always sized so rare events show up too
+    if calls % SAMPLE_EVERY == 0:
+        sample = _emit_samples.setdefault(event, [0, 0])
+        sample[0] += frame_size(event, data)
+        sample[1] += 1
+
+
+def elapsed(started_ns):
+    return (time.perf_counter_ns() - started_ns) / 1e9
+
+
+def render():
+    return REGISTRY.render()
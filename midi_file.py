@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Minimal Standard MIDI File (type 1) writer and streaming reader."""
+import struct
+
+
+def _varlen(value):
+    """Encode an int as a MIDI variable-length quantity."""
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _chunk(kind, data):
+    return kind + struct.pack('>I', len(data)) + data
+
+
+def _track(events):
+    """events: (tick, order, bytes) tuples -> MTrk chunk with delta times."""
+    data = bytearray()
+    last = 0
+    for tick, _, message in sorted(events, key=lambda e: (e[0], e[1])):
+        data += _varlen(tick - last) + message
+        last = tick
+    data += b'\x00\xff\x2f\x00'  # End of track
+    return _chunk(b'MTrk', bytes(data))
+
+
+def _name_event(name):
+    encoded = name.encode('utf-8')
+    return b'\xff\x03' + _varlen(len(encoded)) + encoded
+
+
+def encode_midi(tracks, bpm=140, ppq=480):
+    """Build SMF bytes.
+
+    tracks is a list of (name, channel, notes) where each note is
+    (start_tick, duration_ticks, midi, velocity).
+    """
+    tempo = int(round(60_000_000 / bpm))
+    conductor = [(0, 0, _name_event("Generative Trance")),
+                 (0, 1, b'\xff\x51\x03' + tempo.to_bytes(3, 'big')),
+                 (0, 2, b'\xff\x58\x04\x04\x02\x18\x08')]  # 4/4
+    chunks = [_track(conductor)]
+
+    for name, channel, notes in tracks:
+        events = [(0, 0, _name_event(name))]
+        for start, length, midi, velocity in notes:
+            midi = min(127, max(0, int(midi)))
+            velocity = min(127, max(1, int(velocity)))
+            # Note-offs sort before note-ons on the same tick so repeated notes retrigger
+            events.append((start, 2, bytes([0x90 | channel, midi, velocity])))
+            events.append((start + max(1, length), 1, bytes([0x80 | channel, midi, 0])))
+        chunks.append(_track(events))
+
+    header = _chunk(b'MThd', struct.pack('>HHH', 1, len(chunks), ppq))
+    return header + b''.join(chunks)
+
+
+def write_midi(path, tracks, bpm=140, ppq=480):
+    with open(path, 'wb') as f:
+        f.write(encode_midi(tracks, bpm, ppq))
+
+
+class MidiError(ValueError):
+    pass
+
+
+def _read_varlen(data, offset):
+    value = 0
+    for _ in range(4):
+        if offset >= len(data):
+            raise MidiError("truncated variable-length quantity")
+        byte = data[offset]
+        offset += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, offset
+    raise MidiError("variable-length quantity too long")
+
+
+class MidiReader:
+    """Incremental Standard MIDI File reader.
+
+    Reads the header, then one MTrk chunk at a time from a file-like
+    `stream`, so memory stays bounded by the largest track and nothing but
+    note tuples is ever built. `max_bytes` and `max_notes` abort the read
+    with MidiError as soon as they are crossed.
+    """
+
+    def __init__(self, stream, max_bytes=None, max_notes=None):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.max_notes = max_notes
+        self.bytes_read = 0
+        self.note_count = 0
+        self.track_names = []
+        kind, header = self._chunk(expect=b'MThd')
+        if len(header) < 6:
+            raise MidiError("truncated header")
+        self.format, self.track_count, division = struct.unpack('>HHH', header[:6])
+        if division & 0x8000:
+            raise MidiError("SMPTE time division is not supported")
+        if division == 0:
+            raise MidiError("time division is zero")
+        self.ppq = division
+
+    def _read(self, size):
+        if self.max_bytes is not None and self.bytes_read + size > self.max_bytes:
+            raise MidiError(f"file is larger than {self.max_bytes} bytes")
+        data = self.stream.read(size)
+        if len(data) < size:
+            raise MidiError("unexpected end of file")
+        self.bytes_read += size
+        return data
+
+    def _chunk(self, expect=None):
+        header = self.stream.read(8)
+        if not header and expect is None:
+            return None, None
+        if len(header) < 8:
+            raise MidiError("truncated chunk header")
+        self.bytes_read += 8
+        kind, length = struct.unpack('>4sI', header)
+        if expect is not None and kind != expect:
+            raise MidiError("not a Standard MIDI File")
+        return kind, self._read(length)
+
+    def notes(self):
+        """Yield (track, start_tick, duration_ticks, midi, velocity) for every note."""
+        track = 0
+        while track < self.track_count:
+            kind, data = self._chunk()
+            if kind is None:
+                break
+            if kind != b'MTrk':
+                continue  # Unknown chunks are skipped, as the spec requires
+            self.track_names.append(None)
+            yield from self._track_notes(track, data)
+            track += 1
+
+    def _track_notes(self, track, data):
+        end = len(data)
+        tick = 0
+        offset = 0
+        status = None
+        sounding = {}  # (channel, key) -> [(start, order, velocity)]
+        finished = []
+        order = 0
+        limit = None if self.max_notes is None else self.max_notes - self.note_count
+        while offset < end:
+            byte = data[offset]
+            if byte < 0x80:  # One-byte delta, by far the most common
+                tick += byte
+                offset += 1
+            else:
+                delta, offset = _read_varlen(data, offset)
+                tick += delta
+            if offset >= end:
+                raise MidiError("truncated event")
+            byte = data[offset]
+            if byte >= 0xF0:
+                if byte == 0xFF:
+                    kind = data[offset + 1] if offset + 1 < end else None
+                    length, offset = _read_varlen(data, offset + 2)
+                    if kind == 0x03 and self.track_names[track] is None:
+                        self.track_names[track] = data[offset:offset + length].decode('latin-1')
+                    offset += length
+                    if kind == 0x2F:
+                        break
+                else:  # Sysex
+                    length, offset = _read_varlen(data, offset + 1)
+                    offset += length
+                continue
+            if byte & 0x80:
+                status = byte
+                offset += 1
+            elif status is None:
+                raise MidiError("running status without a status byte")
+            kind = status & 0xF0
+            if kind == 0xC0 or kind == 0xD0:
+                offset += 1
+                continue
+            if offset + 2 > end:
+                raise MidiError("truncated event")
+            key = (status & 0x0F, data[offset])
+            velocity = data[offset + 1]
+            if key[1] >= 0x80 or velocity >= 0x80:
+                raise MidiError("data byte out of range")
+            offset += 2
+            if kind == 0x90 and velocity:
+                if order == limit:
+                    raise MidiError(f"more than {self.max_notes} notes")
+                started = sounding.get(key)
+                if started is None:
+                    sounding[key] = [(tick, order, velocity)]
+                else:
+                    started.append((tick, order, velocity))
+                order += 1
+            elif kind == 0x80 or kind == 0x90:
+                started = sounding.get(key)
+                if started:
+                    start, on, velocity = started.pop(0)
+                    finished.append((start, on, tick - start, key[1], velocity))
+        self.note_count += order
+        # Notes never released last until the end of the track
+        for (channel, key), started in sounding.items():
+            for start, on, velocity in started:
+                finished.append((start, on, tick - start, key, velocity))
+        # In note-on order, like @tonejs/midi
+        finished.sort()
+        for start, _, duration, key, velocity in finished:
+            yield track, start, duration, key, velocity
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_MODEL = "mrasif/functiongemma-270m-it-GGUF-F16:latest"
+
+
+def extract_json(text):
+    """Parse the outermost {...} in an LLM response, or None."""
+    if not text:
+        return None
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start == -1 or end == 0:
+        return None
+    try:
+        return json.loads(text[start:end])
+    except ValueError:
+        return None
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=128, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, retries after `reset_timeout`."""
+
+    def __init__(self, threshold=3, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let one request through to probe the server
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class OllamaClient:
+    """Pooled, cached Ollama client that never blocks the caller.
+
+    Requests run on a small thread pool (which also bounds concurrency) and
+    return Futures. Identical in-flight prompts share one request, parsed
+    results are cached, and while the circuit breaker is open calls resolve
+    to None straight away so callers fall back immediately.
+    """
+
+    def __init__(self, base_url, model=DEFAULT_MODEL, timeout=15, max_concurrency=2,
+                 cache_size=128, cache_ttl=600, failure_threshold=3, reset_timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='ollama')
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.inflight = {}
+        self.lock = threading.RLock()  # Re-entered when a done callback fires immediately
+
+    def submit(self, prompt, parse_json=False):
+        """Future resolving to the response text (or parsed JSON), None on failure."""
+        key = (self.model, prompt, parse_json)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._resolved(cached)
+        if not self.breaker.allow():
+            return self._resolved(None)
+
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.executor.submit(self._generate, prompt, parse_json)
+                self.inflight[key] = future
+                future.add_done_callback(lambda f: self._finish(key, f))
+        return future
+
+    def generate(self, prompt, parse_json=False):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(prompt, parse_json).result()
+
+    def _finish(self, key, future):
+        with self.lock:
+            self.inflight.pop(key, None)
+        result = future.result()
+        if result is not None:
+            self.cache.put(key, result)
+
+    def _generate(self, prompt, parse_json):
+        try:
+            text = self._stream(prompt)
+        except Exception as e:
+            print(f"Ollama error: {e}")
+            self.breaker.record(False)
+            return None
+        self.breaker.record(True)
+        return extract_json(text) if parse_json else text
+
+    def _stream(self, prompt):
+        """Collect a streamed /api/generate response into one string."""
+        chunks = []
+        with self.session.post(f"{self.base_url}/api/generate",
+                               json={"model": self.model, "prompt": prompt, "stream": True},
+                               timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                part = json.loads(line)
+                chunks.append(part.get('response', ''))
+                if part.get('done'):
+                    break
+        return ''.join(chunks)
+
+    @staticmethod
+    def _resolved(value):
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -2,10 +2,15 @@
 import random
 import json
 import time
+import sys
+
+from pitch import get_scale, note_to_midi
+
+def generate_trance_pattern(seed=None):
+    rng = random.Random(seed)
 
-def generate_trance_pattern():
     # G minor pentatonic scale (matching TranceAngel frontend)
-    gm_scale = [67, 70, 72, 74, 77]  # G4, Bb4, C5, D5, F5
+    gm_scale = get_scale('G', 'minor_pentatonic', note_to_midi('G4'), note_to_midi('F5')).midi  # G4, Bb4, C5, D5, F5
     
     # Switch Angel motif: scale degrees 0, 4, 0, 9, 7
     switch_angel = [67, 77, 67, 79, 74]  # G, F, G, G5, D
@@ -13,7 +18,7 @@ def generate_trance_pattern():
     patterns = {
         "kick": [1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0],
         "bass": generate_bass_pattern(),
-        "lead": generate_lead_pattern(gm_scale),
+        "lead": generate_lead_pattern(gm_scale, rng),
         "switch_angel": switch_angel
     }
     
@@ -29,20 +34,20 @@ def generate_bass_pattern():
             pattern.append(None)
     return pattern
 
-def generate_lead_pattern(scale):
+def generate_lead_pattern(scale, rng=random):
     pattern = []
     for i in range(16):
-        if random.random() > 0.4:  # 60% note probability
-            note = random.choice(scale)
+        if rng.random() > 0.4:  # 60% note probability
+            note = rng.choice(scale)
             pattern.append({
                 "note": note,
-                "velocity": random.randint(60, 100),
-                "duration": random.choice([0.25, 0.5, 1.0])
+                "velocity": rng.randint(60, 100),
+                "duration": rng.choice([0.25, 0.5, 1.0])
             })
         else:
             pattern.append(None)
     return pattern
 
 if __name__ == "__main__":
-    pattern = generate_trance_pattern()
+    pattern = generate_trance_pattern(int(sys.argv[1]) if len(sys.argv) > 1 else None)
     print(json.dumps(pattern, indent=2))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""Seed pattern library: an indexed, cached view of the patterns/ directory.
+
+The index (name -> key, tempo, length, density, ...) is kept for every
+pattern and saved to patterns/.index.json, so a restart only re-reads
+files whose mtime or size changed. The snapped and compiled patterns
+themselves are kept in an LRU cache of `cache_size` entries, filled by
+warm() at startup and on first use after that.
+
+Rescans are cheap (one directory listing) and happen at most every
+`rescan_interval` seconds when the library is used, so patterns added,
+edited or deleted on disk show up without a restart.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from compact_pattern import CompactPattern
+from pitch import G_MINOR, detect_key, note_to_midi
+from uploads import count_notes
+
+INDEX_FILE = ".index.json"
+INDEX_VERSION = 1
+COMPILE_BPM = 140  # Seconds-based patterns are cached compiled at this tempo
+PATTERN_CACHE_SIZE = int(os.getenv('PATTERN_CACHE_SIZE', '256'))
+
+
+def _title(name):
+    return name.replace('_', ' ').replace('-', ' ').title()
+
+
+def _tempo(pattern):
+    """Tempo stored in a @tonejs/midi header, or None."""
+    header = pattern.get('header', {})
+    tempos = header.get('tempos')
+    if tempos:
+        return round(tempos[0].get('bpm', 0), 2) or None
+    return header.get('bpm')
+
+
+class PatternLibrary:
+    def __init__(self, directory, scale=G_MINOR, cache_size=PATTERN_CACHE_SIZE, rescan_interval=2.0):
+        self.directory = directory
+        self.scale = scale
+        self.cache_size = cache_size
+        self.rescan_interval = rescan_interval
+        self.entries = {}  # name -> index entry
+        self.by_key = {}  # "G minor" -> {names}
+        self.by_bars = {}  # length in bars -> {names}
+        self.skipped = {}  # name -> (mtime_ns, size) of files that failed to load, so they are not retried
+        self.cache = OrderedDict()  # name -> (snapped pattern, CompactPattern), LRU order
+        self.lock = threading.RLock()
+        self.scanned_at = None
+        self.hits = 0
+        self.misses = 0
+
+    # Scanning
+
+    def refresh(self, force=False):
+        """Bring the index in line with the directory; returns the number of files (re)indexed."""
+        with self.lock:
+            if not force and self.scanned_at is not None and time.monotonic() - self.scanned_at < self.rescan_interval:
+                return 0
+            self.scanned_at = time.monotonic()
+            if not self.entries:
+                self._load_index()
+            try:
+                files = {entry.name[:-5]: entry for entry in os.scandir(self.directory)
+                         if entry.name.endswith('.json') and not entry.name.startswith('.')}
+            except FileNotFoundError:
+                files = {}
+
+            removed = [name for name in self.entries if name not in files]
+            for name in removed:
+                self._forget(name)
+            changed = 0
+            for name, file in sorted(files.items()):
+                stat = file.stat()
+                entry = self.entries.get(name)
+                if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    continue
+                if self.skipped.get(name) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                self._forget(name)
+                if self._index(name, file.path, stat) is None:
+                    self.skipped[name] = (stat.st_mtime_ns, stat.st_size)
+                else:
+                    self.skipped.pop(name, None)
+                changed += 1
+            if changed or removed or not os.path.exists(self._index_path()):
+                self._save_index()
+            return changed
+
+    def warm(self):
+        """Full scan, then load patterns the index already knew until the cache is full (startup task)."""
+        self.refresh(force=True)
+        for name in sorted(self.entries):
+            if len(self.cache) >= self.cache_size:
+                break
+            if name not in self.cache:
+                self._load(name)
+
+    def _index(self, name, path, stat):
+        """Read, snap and compile one file and add it to the index (and cache, if there is room).
+
+        Any failure skips just this file; None tells refresh() to record it in `skipped`.
+        """
+        try:
+            entry, loaded = self._read(name, path, stat)
+        except Exception as e:
+            print(f"Skipping pattern {name}: {e!r}")
+            return None
+        self._add(entry)
+        if len(self.cache) < self.cache_size:
+            self.cache[name] = loaded
+        return entry
+
+    def _read(self, name, path, stat):
+        with open(path, 'r') as f:
+            pattern = json.load(f)
+        if not isinstance(pattern, dict) or not isinstance(pattern.get('tracks'), list):
+            raise ValueError("no tracks")
+        notes = count_notes(pattern)  # Type-checks every note before anything below reads them
+        key = detect_key(note_to_midi(note['name']) if 'name' in note else note.get('midi', 60)
+                         for track in pattern['tracks'] for note in track.get('notes', []))
+        loaded = self._compile(pattern)
+        compiled = loaded[1]
+        bars = compiled.steps // 16 if compiled else 0
+        entry = {
+            "name": name,
+            "title": _title(name),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "key": key,
+            "bpm": _tempo(pattern),
+            "bars": bars,
+            "notes": notes,
+            "density": round(notes / bars, 2) if bars else 0.0,
+            "tracks": len(pattern['tracks']),
+        }
+        return entry, loaded
+
+    def _compile(self, pattern):
+        for track in pattern['tracks']:
+            self.scale.snap_track(track.get('notes', []))
+        return pattern, CompactPattern.from_tracks(pattern, COMPILE_BPM)
+
+    def _add(self, entry):
+        name = entry['name']
+        self.entries[name] = entry
+        self.by_key.setdefault(entry['key'], set()).add(name)
+        self.by_bars.setdefault(entry['bars'], set()).add(name)
+
+    def _forget(self, name):
+        entry = self.entries.pop(name, None)
+        self.cache.pop(name, None)
+        if entry:
+            self.by_key.get(entry['key'], set()).discard(name)
+            self.by_bars.get(entry['bars'], set()).discard(name)
+
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get('version') != INDEX_VERSION:
+            return
+        for entry in saved.get('patterns', []):
+            self._add(entry)
+
+    def _save_index(self):
+        # Best effort: a read-only patterns/ directory just means a full scan next time
+        data = {"version": INDEX_VERSION, "patterns": [self.entries[name] for name in sorted(self.entries)]}
+        tmp = self._index_path() + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, self._index_path())
+        except OSError as e:
+            print(f"Could not save pattern index: {e}")
+
+    # Lookup
+
+    def get(self, name):
+        """(snapped pattern, CompactPattern) for `name`, or None if there is no such pattern.
+
+        Both are shared between sessions and must not be modified.
+        """
+        self.refresh()
+        with self.lock:
+            loaded = self.cache.get(name)
+            if loaded is not None:
+                self.hits += 1
+                self.cache.move_to_end(name)
+                return loaded
+            if name not in self.entries:
+                return None
+            self.misses += 1
+            return self._load(name)
+
+    def _load(self, name):
+        with self.lock:
+            try:
+                with open(os.path.join(self.directory, f"{name}.json"), 'r') as f:
+                    loaded = self._compile(json.load(f))
+            except Exception as e:  # Changed on disk since it was indexed; the next rescan re-reads it
+                print(f"Could not load pattern {name}: {e!r}")
+                return None
+            self.cache[name] = loaded
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return loaded
+
+    def compiled(self):
+        """Every pattern's CompactPattern, by name; patterns outside the cache are loaded but not cached."""
+        self.refresh()
+        for name in sorted(self.entries):
+            with self.lock:
+                loaded = self.cache.get(name)
+            if loaded is None:
+                try:
+                    with open(os.path.join(self.directory, f"{name}.json"), 'r') as f:
+                        loaded = self._compile(json.load(f))
+                except Exception:
+                    continue
+            if loaded[1] is not None:
+                yield name, loaded[1]
+
+    def search(self, key=None, bars=None, min_bpm=None, max_bpm=None, min_density=None, max_density=None,
+               text=None, limit=50, offset=0):
+        """Index entries matching every given filter, sorted by name."""
+        self.refresh()
+        with self.lock:
+            names = None
+            if key is not None:
+                names = set(self.by_key.get(key, ()))
+            if bars is not None:
+                matching = self.by_bars.get(bars, set())
+                names = set(matching) if names is None else names & matching
+            if names is None:
+                names = self.entries.keys()
+            results = []
+            for name in sorted(names):
+                entry = self.entries[name]
+                bpm, density = entry['bpm'], entry['density']
+                if min_bpm is not None and (bpm is None or bpm < min_bpm):
+                    continue
+                if max_bpm is not None and (bpm is None or bpm > max_bpm):
+                    continue
+                if min_density is not None and density < min_density:
+                    continue
+                if max_density is not None and density > max_density:
+                    continue
+                if text and text.lower() not in entry['title'].lower():
+                    continue
+                results.append(entry)
+            return {"total": len(results), "patterns": [{k: v for k, v in entry.items() if k not in ('mtime_ns', 'size')}
+                                                        for entry in results[offset:offset + limit]]}
+
+    def stats(self):
+        with self.lock:
+            return {"patterns": len(self.entries), "cached": len(self.cache), "cache_size": self.cache_size,
+                    "hits": self.hits, "misses": self.misses,
+                    "keys": {key: len(names) for key, names in self.by_key.items() if names}}
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Note names, MIDI numbers and scale snapping shared by the sequencer and generators."""
+import re
+from functools import lru_cache
+
+NOTE_OFFSETS = {'C': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'F': 5, 'F#': 6, 'Gb': 6,
+                'G': 7, 'G#': 8, 'Ab': 8, 'A': 9, 'A#': 10, 'Bb': 10, 'B': 11}
+NOTE_NAMES = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+
+MODES = {
+    'major': [0, 2, 4, 5, 7, 9, 11],
+    'minor': [0, 2, 3, 5, 7, 8, 10],
+    'harmonic_minor': [0, 2, 3, 5, 7, 8, 11],
+    'dorian': [0, 2, 3, 5, 7, 9, 10],
+    'phrygian': [0, 1, 3, 5, 7, 8, 10],
+    'major_pentatonic': [0, 2, 4, 7, 9],
+    'minor_pentatonic': [0, 3, 5, 7, 10],
+}
+
+_NOTE_RE = re.compile(r'^([A-Ga-g][#b]?)(-?\d+)$')
+
+
+@lru_cache(maxsize=1024)
+def note_to_midi(name):
+    """'G1' -> 31. Unparseable names fall back to middle C (60)."""
+    match = _NOTE_RE.match(str(name).strip())
+    if not match:
+        return 60
+    pitch, octave = match.groups()
+    offset = NOTE_OFFSETS.get(pitch[0].upper() + pitch[1:], 0)
+    return (int(octave) + 1) * 12 + offset
+
+
+@lru_cache(maxsize=128)
+def midi_to_note(midi):
+    """31 -> 'G1', spelled with flats like the rest of the app."""
+    midi = int(midi)
+    return f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}"
+
+
+class Scale:
+    """A key/mode over a MIDI range with precomputed 0-127 lookup tables."""
+
+    def __init__(self, root='G', mode='minor', low=0, high=127):
+        self.root = root
+        self.mode = mode
+        root_pc = NOTE_OFFSETS[root]
+        pitch_classes = {(root_pc + step) % 12 for step in MODES[mode]}
+        self.midi = [m for m in range(low, high + 1) if m % 12 in pitch_classes]
+        self.names = [midi_to_note(m) for m in self.midi]
+
+        # Nearest scale note for every MIDI number (ties resolve downwards)
+        self.snap_table = []
+        self.degree_table = []
+        index = 0
+        for m in range(128):
+            while index + 1 < len(self.midi) and abs(self.midi[index + 1] - m) < abs(self.midi[index] - m):
+                index += 1
+            self.snap_table.append(self.midi[index])
+            self.degree_table.append(index)
+
+    def snap(self, midi):
+        return self.snap_table[min(127, max(0, int(midi)))]
+
+    def snap_name(self, name):
+        return self.names[self.degree_table[min(127, max(0, note_to_midi(name)))]]
+
+    def snap_track(self, notes):
+        """Snap a list of note dicts ({'name': ...} or {'midi': ...}) in place."""
+        names, degrees = self.names, self.degree_table
+        for note in notes:
+            midi = note_to_midi(note['name']) if 'name' in note else note.get('midi', 60)
+            note['name'] = names[degrees[min(127, max(0, int(midi)))]]
+        return notes
+
+
+@lru_cache(maxsize=64)
+def get_scale(root='G', mode='minor', low=0, high=127):
+    """Shared, cached Scale instance."""
+    return Scale(root, mode, low, high)
+
+
+# The app's home key: G natural minor from G1 to Bb4
+G_MINOR = get_scale('G', 'minor', note_to_midi('G1'), note_to_midi('Bb4'))
+
+
+def detect_key(midis, modes=('minor', 'major')):
+    """Best-fitting key for a set of MIDI notes, e.g. 'G minor', or None if empty.
+
+    Scores each root/mode by how many notes fall in the scale, then by how
+    often the root itself is played.
+    """
+    counts = [0] * 12
+    for m in midis:
+        counts[int(m) % 12] += 1
+    if not any(counts):
+        return None
+    best, best_score = None, None
+    for mode in modes:
+        for root in range(12):
+            score = (sum(counts[(root + step) % 12] for step in MODES[mode]), counts[root])
+            if best_score is None or score > best_score:
+                best, best_score = f"{NOTE_NAMES[root]} {mode}", score
+    return best
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import math
+from collections import deque
+
+STATES = ["groove", "breakdown", "buildup", "drop"]
+DEFAULT_ENERGY = 0.7
+
+
+def state_key(state):
+    """Sequencer state name ("Build-up") -> TranceAI state name ("buildup")."""
+    return state.lower().replace('-', '')
+
+
+def next_state(state):
+    return STATES[(STATES.index(state_key(state)) + 1) % len(STATES)]
+
+
+def energy_level(energy):
+    """Client energy -> one of the 11 levels 0.0, 0.1 .. 1.0 (None stays None); ValueError if not a number."""
+    if energy is None:
+        return None
+    try:
+        energy = float(energy)
+    except (TypeError, ValueError):
+        raise ValueError(f"energy must be a number, not {energy!r}")
+    if not math.isfinite(energy):
+        raise ValueError(f"energy must be finite, not {energy}")
+    return round(min(1.0, max(0.0, energy)), 1)
+
+
+class PatternPool:
+    """Bounded queues of ready-made TranceAI patterns (CompactPattern), refilled in the background.
+
+    take() pops a finished pattern (generating inline only when the queue is
+    cold) and schedules a refill, so state changes never wait on generation.
+    Each state draws from its own seeded TranceAI, so background refills
+    running in any order still produce the same material for a seed.
+    If an OllamaClient is given, it is asked for an energy level per state;
+    its answer is used once it has arrived and never waited on. A
+    markov.MelodyModel, if given, is shared by every generator.
+
+    States and energies are checked against STATES and the energy levels,
+    so client input can never create more than len(STATES) * 11 queues.
+    """
+
+    def __init__(self, seed=None, depth=2, spawn=None, ollama=None, model=None):
+        self.depth = depth
+        self.model = model
+        # spawn(fn, *args) runs fn in the background; without one, refills run inline
+        self.spawn = spawn or (lambda fn, *args: fn(*args))
+        self.ollama = ollama
+        self.energy_requests = {}
+        self.generation = 0
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        """Restart every state's stream from `seed`, dropping queued material."""
+        self.seed = seed
+        self.generation += 1  # Refills still running for the old seed throw their work away
+        self.generators = {}
+        self.queues = {}
+        self.filling = set()
+
+    def _generator(self, state):
+        generator = self.generators.get(state)
+        if generator is None:
+            from trance_ai import TranceAI  # Not imported until the first pattern, off the boot path
+            generator = self.generators[state] = TranceAI(None if self.seed is None else f"{self.seed}:{state}", self.model)
+        return generator
+
+    def _key(self, state, energy):
+        """(TranceAI state, energy level) for a queue; ValueError for an unknown state or energy."""
+        state = state_key(state) if isinstance(state, str) else state
+        if state not in STATES:
+            raise ValueError(f"unknown state {state!r}")
+        energy = energy_level(energy)
+        return state, DEFAULT_ENERGY if energy is None else energy
+
+    def _queue(self, key):
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque(maxlen=self.depth)
+        return queue
+
+    def _energy(self, state, energy):
+        if energy is not None or self.ollama is None:
+            return energy
+        future = self.energy_requests.get(state)
+        if future is None:
+            prompt = f"Return only valid JSON with the energy (0-1) of a trance {state} section: {{\"energy\": 0.7}}"
+            future = self.energy_requests[state] = self.ollama.submit(prompt, parse_json=True)
+        if future.done() and isinstance(future.result(), dict):
+            try:
+                return min(1.0, max(0.0, float(future.result().get('energy', DEFAULT_ENERGY))))
+            except (TypeError, ValueError):
+                pass
+        return None
+
+    def _generate(self, state, energy):
+        return self._generator(state).generate_compact(state, DEFAULT_ENERGY if energy is None else energy)
+
+    def take(self, state, energy=None):
+        """A pattern for `state`, from the queue when one is ready."""
+        key = self._key(state, energy)
+        energy = energy_level(energy)
+        queue = self._queue(key)
+        pattern = queue.popleft() if queue else None
+        if pattern is None:
+            pattern = self._generate(key[0], self._energy(key[0], energy))
+        self.prefetch(state, energy)
+        return pattern
+
+    def prefetch(self, state, energy=None):
+        """Top up the queue for `state` in the background."""
+        key = self._key(state, energy)
+        if key in self.filling or len(self._queue(key)) >= self.depth:
+            return
+        self.filling.add(key)
+        # The fill keeps this generation's queue and generator even if reseed() replaces them
+        self.spawn(self._fill, key, energy_level(energy), self.generation, self._queue(key),
+                   self._generator(key[0]))
+
+    def prefetch_after(self, state, energy=None):
+        """Top up the queue for the state that follows `state`."""
+        self.prefetch(next_state(state), energy)
+
+    def _fill(self, key, energy, generation, queue, generator):
+        try:
+            while len(queue) < self.depth:
+                level = self._energy(key[0], energy)
+                pattern = generator.generate_compact(key[0], DEFAULT_ENERGY if level is None else level)
+                if generation != self.generation:
+                    return  # Reseeded meanwhile: this material belongs to the old seed
+                queue.append(pattern)
+        finally:
+            if generation == self.generation:
+                self.filling.discard(key)
+
+    def ready(self, state, energy=None):
+        return len(self.queues.get(self._key(state, energy), ()))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Message-queue backends for running several app workers side by side.
+
+Every worker is a full app.py process. Flask-SocketIO's pub/sub client
+managers carry emits between them, so a room can have members connected
+to any worker. On top of that channel, RelayMixin adds worker-addressed
+commands: SessionManager uses them to run each shared session's clock on
+exactly one worker (its owner) and to forward control events there.
+
+MESSAGE_QUEUE picks the backend by URL:
+    local://            in-process stand-in (tests, several apps in one process)
+    redis://, rediss:// RedisManager
+    kafka://            KafkaManager
+    zmq+tcp://          ZmqManager
+    anything else       KombuManager (amqp://, ...)
+"""
+import os
+import queue
+import threading
+import zlib
+
+import socketio
+
+MESSAGE_QUEUE = os.getenv('MESSAGE_QUEUE', '')
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+WORKER_COUNT = max(1, int(os.getenv('WORKER_COUNT', '1')))
+
+
+def owner(room, worker_count=WORKER_COUNT):
+    """Worker that runs the shared session `room` (stable across processes, unlike hash())."""
+    return zlib.crc32(room.encode('utf-8')) % worker_count
+
+
+class LocalManager(socketio.PubSubManager):
+    """In-process message queue: every LocalManager on a channel sees every message.
+
+    Messages are JSON-encoded on the way through, like on a real broker.
+    """
+    name = 'local'
+    channels = {}  # channel -> [inbox queue]
+    lock = threading.Lock()
+
+    def __init__(self, url='local://', channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.inbox = queue.Queue()
+        with LocalManager.lock:
+            LocalManager.channels.setdefault(channel, []).append(self.inbox)
+
+    def _publish(self, data):
+        message = self.json.dumps(data)
+        for inbox in LocalManager.channels.get(self.channel, []):
+            inbox.put(message)
+
+    def _listen(self):
+        while True:
+            yield self.inbox.get()
+
+
+class RelayMixin:
+    """Worker-addressed commands on the Socket.IO channel.
+
+    relay(worker, name, sid, args) reaches command_handler(name, sid, args) on
+    that worker. Commands run one at a time, in order, on their own
+    background task so a slow one never holds up the emits behind it.
+    """
+    worker_index = WORKER_INDEX
+    command_handler = None
+
+    def initialize(self):
+        super().initialize()
+        if not self.write_only:
+            self.commands = queue.Queue()
+            self.server.start_background_task(self._run_commands)
+
+    def relay(self, worker, name, sid, args=()):
+        self._publish({'method': 'relay', 'worker': worker, 'name': name, 'sid': sid,
+                       'args': list(args), 'host_id': self.host_id})
+
+    def _listen(self):
+        for message in super()._listen():
+            data = message
+            if not isinstance(data, dict):
+                try:
+                    data = self.json.loads(message)
+                except ValueError:
+                    continue
+            if isinstance(data, dict) and data.get('method') == 'relay':
+                if data.get('worker') == self.worker_index:
+                    self.commands.put((data['name'], data['sid'], data['args']))
+                continue
+            yield data
+
+    def _run_commands(self):
+        while True:
+            name, sid, args = self.commands.get()
+            try:
+                self.command_handler(name, sid, args)
+            except Exception as e:
+                print(f"Relayed command {name} failed: {e}")
+
+
+_BACKENDS = {}
+
+
+def client_manager(url, channel='flask-socketio', worker_index=WORKER_INDEX, write_only=False):
+    """A relaying Socket.IO client manager for `url`, or None for a single-process app."""
+    if not url:
+        return None
+    if url.startswith('local://'):
+        base = LocalManager
+    elif url.startswith(('redis://', 'rediss://')):
+        base = socketio.RedisManager
+    elif url.startswith('kafka://'):
+        base = socketio.KafkaManager
+    elif url.startswith('zmq'):
+        base = socketio.ZmqManager
+    else:
+        base = socketio.KombuManager
+    cls = _BACKENDS.get(base)
+    if cls is None:
+        cls = _BACKENDS[base] = type('Relay' + base.__name__, (RelayMixin, base), {})
+    manager = cls(url, channel=channel, write_only=write_only)
+    manager.worker_index = worker_index
+    return manager
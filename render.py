@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Render the sequencer offline, as fast as it can run, to MIDI and JSON.
+
+    python render.py --bars 2100 --out set.mid --json set.json
+"""
+import argparse
+import json
+import time
+
+from midi_file import write_midi
+from pitch import note_to_midi, midi_to_note
+from pregen import PatternPool
+from sequencer import Sequencer
+
+PPQ = 480
+TICKS_PER_STEP = PPQ // 4
+
+# Track name, MIDI channel (9 is GM drums)
+TRACKS = [("Lead", 0), ("Bass", 1), ("Chords", 2), ("Piano", 3), ("Pads", 4), ("Arp", 5), ("Drums", 9)]
+EVENT_TRACKS = {'trigger_lead': "Lead", 'trigger_chords': "Chords", 'trigger_piano': "Piano",
+                'trigger_pads': "Pads", 'trigger_arp': "Arp"}
+DRUMS = {'trigger_kick': 36, 'trigger_snare': 38}  # GM bass drum / snare
+DURATIONS = {'16n': 1, '8n': 2, '4n': 4, '2n': 8, '1n': 16, '1m': 16}
+
+
+def render(sequencer, bars):
+    """Drive `sequencer` for `bars` bars with no clock or socket.
+
+    Returns {track name: [(step, length_steps, midi, velocity)]} with steps
+    counted from the first rendered bar.
+    """
+    notes = {name: [] for name, _ in TRACKS}
+    origin = sequencer.bar_count * 16 + sequencer.sixteenth_count
+    bass = None
+
+    for _ in range(bars):
+        bar_start = sequencer.bar_count * 16 - origin
+        events = iter(sequencer.render_bar())
+        pending = next(events, None)
+        for step in range(16):
+            # Events arrive in step order; consume this step's batch
+            while pending is not None and pending[0] == step:
+                _, event, data = pending
+                at = bar_start + step
+                if event == 'bass_loop':
+                    bass = data
+                elif event in DRUMS:
+                    notes["Drums"].append((at, 1, DRUMS[event], 110))
+                elif event in EVENT_TRACKS:
+                    length = DURATIONS.get(data.get('duration'), 1)
+                    velocity = int(round(data.get('velocity', 1.0) * 100))  # 1.0 is an unaccented note
+                    for name in data.get('notes') or [data['note']]:
+                        notes[EVENT_TRACKS[event]].append((at, length, note_to_midi(name), velocity))
+                pending = next(events, None)
+            if bass and bass.get('note'):
+                notes["Bass"].append((bar_start + step, DURATIONS.get(bass.get('duration'), 1),
+                                      note_to_midi(bass['note']), 100))
+    return notes
+
+
+def to_midi_tracks(notes):
+    return [(name, channel, [(step * TICKS_PER_STEP, length * TICKS_PER_STEP, midi, vel)
+                             for step, length, midi, vel in notes[name]])
+            for name, channel in TRACKS if notes[name]]
+
+
+def to_json(notes, bpm):
+    """Same tracks/notes shape as the seed patterns (@tonejs/midi JSON)."""
+    step_seconds = (60 / bpm) / 4
+    return {
+        "header": {"bpm": bpm, "ppq": PPQ, "name": "Generative Trance"},
+        "tracks": [{
+            "name": name,
+            "channel": channel,
+            "notes": [{"name": midi_to_note(midi), "midi": midi,
+                       "time": step * step_seconds, "ticks": step * TICKS_PER_STEP,
+                       "duration": length * step_seconds, "durationTicks": length * TICKS_PER_STEP,
+                       "velocity": vel / 127}
+                      for step, length, midi, vel in notes[name]]
+        } for name, channel in TRACKS if notes[name]]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render generative trance offline to MIDI/JSON")
+    parser.add_argument('--bars', type=int, default=128, help="bars to render (128 covers all four states)")
+    parser.add_argument('--bpm', type=float, default=140)
+    parser.add_argument('--out', default='render.mid', help="Standard MIDI File to write")
+    parser.add_argument('--json', help="also write the notes as pattern JSON")
+    parser.add_argument('--seed-pattern', help="name of a patterns/*.json seed for the lead")
+    parser.add_argument('--mutation', type=float, default=0.0, help="0-100")
+    parser.add_argument('--arp-mode', default="UpDown")
+    parser.add_argument('--seed', help="seed for every random stream (same seed, same output)")
+    parser.add_argument('--ai-patterns', action='store_true', help="play pre-generated TranceAI material")
+    args = parser.parse_args()
+
+    sequencer = Sequencer(pattern_pool=PatternPool() if args.ai_patterns else None, seed=args.seed)
+    sequencer.bpm = args.bpm
+    sequencer.sixteenth_note_duration = (60 / args.bpm) / 4
+    sequencer.mutation = args.mutation / 100.0
+    sequencer.arp_mode = args.arp_mode
+    if args.seed_pattern:
+        sequencer.load_seed_pattern(args.seed_pattern)
+    sequencer.start()
+
+    started = time.perf_counter()
+    notes = render(sequencer, args.bars)
+    elapsed = time.perf_counter() - started
+
+    write_midi(args.out, to_midi_tracks(notes), args.bpm, PPQ)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(to_json(notes, args.bpm), f)
+
+    music_seconds = args.bars * 16 * sequencer.sixteenth_note_duration
+    print(f"Rendered {args.bars} bars ({music_seconds / 60:.1f} min, {sum(map(len, notes.values()))} notes) "
+          f"in {elapsed:.2f}s ({music_seconds / max(elapsed, 1e-9):.0f}x real time, seed {sequencer.seed}) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+import math
+import random
+import json
+import os
+import time
+
+import metrics
+from clock import TickClock
+from compact_pattern import CompactPattern, DEFAULT_VELOCITY
+from delta import DeltaChannel
+from pattern_library import COMPILE_BPM
+from pitch import G_MINOR, get_scale, midi_to_note, note_to_midi
+from wire import encode_bar
+
+SCALE = G_MINOR.names # G1 .. Bb4
+MELODY_INDICES = [14, 18, 14, 23, 21]
+MIN_BPM, MAX_BPM = 60, 200
+RNG_STREAMS = ["lead", "piano", "pads", "arp", "fx", "params", "variation"]
+VARIANTS_PER_BATCH = 8
+# Pre-generated leads sit an octave above G_MINOR until play_lead drops them
+STATE_LEAD_SCALE = get_scale('G', 'minor', note_to_midi('G2'), note_to_midi('Bb5'))
+PATTERN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "patterns")
+
+class Sequencer:
+    def __init__(self, output=None, schedule_mode="tick", lookahead_bars=1, pattern_pool=None, seed=None,
+                 pattern_library=None):
+        # output(event, data) delivers events to this sequencer's listeners
+        self.output = output or (lambda event, data=None: None)
+        # Optional PatternPool; when set, each state plays pre-generated TranceAI material
+        self.pattern_pool = pattern_pool
+        # Optional PatternLibrary serving precompiled seed patterns from memory
+        self.pattern_library = pattern_library
+        self.state_pattern = None
+        self.is_running = False
+        self.state = "Groove"
+        self.bar_count = 0
+        self.sixteenth_count = 0
+        self.melody_step = 0
+        self.scale = G_MINOR
+        self.pattern = None
+        self.pattern_steps = None # Loaded pattern compiled to a CompactPattern
+        self.mutation = 0.0
+        self.arp_mode = "UpDown"
+        self.bpm = 140 # Initialize BPM here
+        self.sixteenth_note_duration = (60 / self.bpm) / 4 # Calculate based on self.bpm
+        self.schedule_mode = schedule_mode
+        self.lookahead_bars = lookahead_bars
+        self.pending_bpm = None # Applied on the next bar boundary
+        self.next_bar_time = None # Play time where the next scheduled bar starts (bar/binary modes)
+        self.pending_pattern = None # (pattern, compiled) from queue_pattern, swapped in on the next bar
+        self.clock = TickClock()
+        self.event_buffer = None # Collects [step, event, data] while rendering a bar
+        self.delta = DeltaChannel(self.emit) # Change-only params, bass loop and ramps
+        self.bass_spread = 30.0
+        self.players = [(name, getattr(self, name)) for name in metrics.PLAYERS] # Run in this order every tick
+        self.ticks_until_sample = 0
+        self.variations = None # VariationEngine, built on the first mutated bar so NumPy loads off the boot path
+        self.variation_seed = None
+        self.variants = [] # Upcoming bars' variants of variant_source, consumed from the end
+        self.variant_source = None
+        self.variant_amount = 0.0
+        self.lead_variant = None # This bar's variant, or None to play the source as is
+        self.set_seed(random.randrange(2**32) if seed is None else seed)
+
+    def set_seed(self, seed):
+        """Reseed every instrument's random stream (and the pattern pool) from one seed.
+
+        Each instrument draws from its own stream, so the same seed and the same
+        controls reproduce the same event stream exactly.
+        """
+        self.seed = seed
+        self.rng = {name: random.Random(f"{seed}:{name}") for name in RNG_STREAMS}
+        self.variation_seed = self.rng['variation'].getrandbits(64)
+        if self.variations is not None:
+            self.variations.reseed(self.variation_seed)
+        self.variants = []
+        self.variant_source = None
+        if self.pattern_pool:
+            self.pattern_pool.reseed(seed)
+
+    def rewind(self):
+        """Back to bar 0 of the Groove, e.g. to replay a seed from the top."""
+        self.state = "Groove"
+        self.bar_count = 0
+        self.sixteenth_count = 0
+        self.melody_step = 0
+        self.bass_spread = 30.0
+        self.delta.reset()
+        self.state_pattern = None
+        if self.pattern_pool:
+            self.state_pattern = self.pattern_pool.take(self.state)
+            self.pattern_pool.prefetch_after(self.state)
+
+    def snap_to_scale(self, note_name):
+        return self.scale.snap_name(note_name)
+
+    def process_pattern(self, pattern):
+        """Transpose to G Minor and snap to scale."""
+        if not pattern or 'tracks' not in pattern:
+            return pattern
+
+        started = time.perf_counter_ns()
+        # Simple transposition: shift everything so the first note is in G minor scale
+        # or just snap everything. Snapping is safer for trance.
+        for track in pattern['tracks']:
+            self.scale.snap_track(track.get('notes', []))
+        metrics.PROCESS_PATTERN_SECONDS.observe(metrics.elapsed(started))
+        return pattern
+
+    def set_pattern(self, pattern):
+        """Snap a pattern to the scale and compile it for playback (None clears it)."""
+        self.pending_pattern = None
+        self.pattern = self.process_pattern(pattern)
+        self.compile_pattern()
+
+    def prepare_pattern(self, pattern):
+        """Snap and compile `pattern` without touching playback; safe off the clock thread.
+
+        Returns (pattern, compiled) for queue_pattern.
+        """
+        pattern = self.process_pattern(pattern)
+        if not pattern or 'tracks' not in pattern:
+            return pattern, None
+        return pattern, CompactPattern.from_tracks(pattern, self.bpm)
+
+    def queue_pattern(self, compiled, pattern=None):
+        """Swap in a compiled pattern at the next bar boundary.
+
+        `pattern` is the JSON it came from, if any; without it (MIDI uploads)
+        the pattern is tick-based and does not follow BPM changes.
+        """
+        self.pending_pattern = (pattern, compiled)
+
+    def compile_pattern(self):
+        """Compile the loaded pattern to a step grid so play_lead is a lookup.
+
+        Notes are quantized to the nearest sixteenth rather than dropped, and the
+        grid spans the pattern's full length rounded up to whole bars.
+        """
+        if not self.pattern or 'tracks' not in self.pattern:
+            self.pattern_steps = None
+            return
+        # Prefer tempo-independent ticks (@tonejs/midi JSON), else seconds at our BPM
+        self.pattern_steps = CompactPattern.from_tracks(self.pattern, self.bpm)
+
+    def load_seed_pattern(self, name):
+        if self.pattern_library is not None:
+            loaded = self.pattern_library.get(name)
+            if loaded is None:
+                return
+            self.pending_pattern = None
+            self.pattern, self.pattern_steps = loaded
+            if self.bpm != COMPILE_BPM and not self.pattern.get('header', {}).get('ppq'):
+                self.compile_pattern() # Cached at COMPILE_BPM; seconds-based patterns follow our tempo
+            print(f"Loaded seed pattern: {name}")
+            return
+        filepath = os.path.join(PATTERN_DIR, f"{name}.json")
+        if os.path.exists(filepath):
+            with open(filepath, 'r') as f:
+                pattern = json.load(f)
+                self.set_pattern(pattern)
+                print(f"Loaded seed pattern: {name}")
+
+    def start(self, delay=0.0):
+        """Reset the clock (first tick `delay` seconds from now); the session manager's loop drives the steps."""
+        if not self.is_running:
+            self.is_running = True
+            self.clock.start(time.monotonic_ns() + int(delay * 1e9))
+            self.next_bar_time = None
+            self.delta.reset()
+            if self.pattern_pool and self.state_pattern is None:
+                self.state_pattern = self.pattern_pool.take(self.state)
+                self.pattern_pool.prefetch_after(self.state)
+
+    def stop(self):
+        self.is_running = False
+
+    def set_bpm(self, bpm):
+        """Queue a tempo change, clamped to MIN_BPM..MAX_BPM; raises ValueError for non-numbers.
+
+        Takes effect at the start of the next bar so the grid never jumps mid-bar.
+        """
+        try:
+            bpm = float(bpm)
+        except (TypeError, ValueError):
+            raise ValueError(f"BPM must be a number, not {bpm!r}")
+        if not math.isfinite(bpm):
+            raise ValueError(f"BPM must be finite, not {bpm}")
+        self.pending_bpm = min(MAX_BPM, max(MIN_BPM, bpm))
+        return self.pending_bpm
+
+    def emit(self, event, data=None):
+        # While a bar is being rendered, events are queued with their step offset
+        if self.event_buffer is not None:
+            self.event_buffer.append([self.sixteenth_count, event, data])
+        else:
+            self.output(event, data)
+
+    def step(self):
+        """Run one clock step and return the time it covers in seconds."""
+        if self.schedule_mode in ("bar", "binary"):
+            steps = 16 - self.sixteenth_count
+            self.schedule_bar()
+            return self.sixteenth_note_duration * steps
+        self.next_bar_time = None
+        self.tick()
+        return self.sixteenth_note_duration
+
+    def render_bar(self):
+        """Run the remaining ticks of the current bar and return the collected events."""
+        self.event_buffer = []
+        try:
+            for _ in range(16 - self.sixteenth_count):
+                self.tick()
+        finally:
+            events, self.event_buffer = self.event_buffer, None
+        return events
+
+    def schedule_bar(self):
+        """Emit one bar of events ahead of time as a single `bar_events` batch.
+
+        Times are seconds on the sequencer's clock (zero at start()), so the
+        client can place every event on Tone.Transport regardless of emit latency.
+        In "binary" mode the batch goes out packed as `bar_binary` (see wire.py).
+        """
+        bar = self.bar_count
+        steps = 16 - self.sixteenth_count
+        if self.next_bar_time is None or self.next_bar_time < self.clock.now():
+            # First batch, or the clock slipped: anchor on the grid, lookahead_bars ahead
+            bar_start = self.clock.transport_time() - self.sixteenth_count * self.sixteenth_note_duration
+            self.next_bar_time = bar_start + self.lookahead_bars * 16 * self.sixteenth_note_duration
+        events = self.render_bar()
+        sixteenth = self.sixteenth_note_duration
+        # Bars are laid end to end, each at its own tempo, so a BPM change never overlaps them
+        start = self.next_bar_time
+        self.next_bar_time = start + steps * sixteenth
+        batch = {
+            'bar': bar,
+            'time': start,
+            'now': self.clock.now(),
+            'sixteenth': sixteenth,
+            'events': events
+        }
+        if self.schedule_mode == "binary":
+            self.output('bar_binary', encode_bar(batch))
+        else:
+            self.output('bar_events', batch)
+
+    def tick(self):
+        started = time.perf_counter_ns()
+        if self.sixteenth_count == 0 and self.pending_pattern is not None:
+            self.pattern, self.pattern_steps = self.pending_pattern
+            self.pending_pattern = None
+        if self.sixteenth_count == 0 and self.pending_bpm is not None:
+            self.bpm = self.pending_bpm
+            self.sixteenth_note_duration = (60 / self.bpm) / 4
+            self.pending_bpm = None
+            if self.pattern and not self.pattern.get('header', {}).get('ppq'):
+                try:
+                    self.compile_pattern() # Only seconds-based patterns move with the tempo
+                except ValueError as e:
+                    print(f"Keeping the old lead grid: {e}")  # Too long at the new tempo
+            self.delta.reset() # Ramp durations were computed at the old tempo
+
+        # State Machine (every 32 bars)
+        if self.sixteenth_count == 0 and self.bar_count % 32 == 0 and self.bar_count > 0:
+            self.update_state()
+
+        if self.sixteenth_count == 0:
+            self.prepare_variation()
+
+        # Sequencing Logic (each instrument is timed on every SAMPLE_EVERY-th tick)
+        if self.ticks_until_sample:
+            self.ticks_until_sample -= 1
+            for _, play in self.players:
+                play()
+        else:
+            self.ticks_until_sample = metrics.SAMPLE_EVERY - 1
+            for name, play in self.players:
+                play_started = time.perf_counter_ns()
+                play()
+                metrics.PLAY_SECONDS.observe(metrics.elapsed(play_started), name)
+
+        # Increment counts
+        self.sixteenth_count += 1
+        if self.sixteenth_count == 16:
+            self.sixteenth_count = 0
+            self.bar_count += 1
+        metrics.TICK_SECONDS.observe(metrics.elapsed(started))
+
+    def update_state(self):
+        states = ["Groove", "Breakdown", "Build-up", "Drop"]
+        current_index = states.index(self.state)
+        # Advance state
+        self.state = states[(current_index + 1) % len(states)]
+        if self.pattern_pool:
+            # Swap in material prepared while the last state played, then prepare the next
+            self.state_pattern = self.pattern_pool.take(self.state)
+            self.pattern_pool.prefetch_after(self.state)
+        self.emit('state_change', {'state': self.state, 'bar': self.bar_count})
+
+    def prepare_variation(self):
+        """Pick this bar's variant of the lead source, generating a batch when none are left.
+
+        Variants are made VARIANTS_PER_BATCH at a time in one NumPy pass, so the
+        per-tick path only ever looks notes up.
+        """
+        source = self.pattern_steps or self.state_pattern
+        if source is None or self.mutation <= 0:
+            self.lead_variant = None
+            return
+        if source is not self.variant_source or self.mutation != self.variant_amount:
+            self.variant_source, self.variant_amount = source, self.mutation
+            self.variants = []
+        if not self.variants:
+            if self.variations is None:
+                from variation import VariationEngine
+                self.variations = VariationEngine(self.scale, self.variation_seed)
+            if source is self.pattern_steps:
+                self.variants = self.variations.variants(source, VARIANTS_PER_BATCH, self.mutation)
+            else:
+                self.variants = self.variations.variants(source, VARIANTS_PER_BATCH, self.mutation,
+                                                         tracks=('lead',), scale=STATE_LEAD_SCALE)
+        self.lead_variant = self.variants.pop()
+
+    def current_lead(self, source):
+        """This bar's variant of `source`, or `source` itself when nothing is mutating."""
+        if self.lead_variant is not None and self.variant_source is source:
+            return self.lead_variant
+        return source
+
+    def play_kick(self):
+        if self.sixteenth_count % 4 == 0:
+            # Ghost Kick: always trigger sidechain for the pumping effect
+            self.emit('trigger_sidechain')
+
+            if self.state != "Breakdown":
+                self.emit('trigger_kick', {'note': 'C1', 'duration': '8n'})
+
+    def play_bass(self):
+        if self.state in ["Breakdown", "Build-up"]:
+            self.delta.send('bass', 'bass_loop', {'note': None})
+            return
+        # Constant 16th notes for the frontend Trance Gate to mask: send the loop
+        # once and let the client's 16th-note loop play it
+        payload = {'note': SCALE[0], 'duration': '16n'}
+        if not self.delta.send('bass', 'bass_loop', payload):
+            self.delta.count_saved('trigger_bass', payload)
+
+    def play_lead(self):
+        # Use MIDI pattern if available (mutation comes from prepare_variation)
+        if self.pattern_steps:
+            lead = self.current_lead(self.pattern_steps)
+            # Loop the compiled pattern over its full length
+            position = (self.bar_count * 16 + self.sixteenth_count) % len(lead)
+
+            for pitch, velocity in lead.step_voices(position):
+                # Relative to an unaccented note, for source and variant alike, so a
+                # mutation only humanizes around the pattern's own level
+                self.emit('trigger_lead', {'note': midi_to_note(pitch), 'duration': '16n',
+                                           'detune': (self.rng['lead'].random() - 0.5) * 20,
+                                           'velocity': min(1.0, velocity / DEFAULT_VELOCITY)})
+            return
+
+        if self.state_pattern:
+            # Pre-generated lead, dropped an octave into the lead register
+            lead = self.current_lead(self.state_pattern)
+            step = lead.get('lead', self.sixteenth_count)
+            if step:
+                note = midi_to_note(self.scale.snap(step[0] - 12))
+                detune = (self.rng['lead'].random() - 0.5) * 20
+                self.emit('trigger_lead', {'note': note, 'duration': '16n', 'detune': detune,
+                                           'velocity': min(1.0, step[1] / DEFAULT_VELOCITY)})
+            return
+
+        prob = 0.3
+        if self.state == "Drop": prob = 0.6
+        if self.state == "Breakdown": prob = 0.2
+
+        if self.rng['lead'].random() < prob:
+            note_index = MELODY_INDICES[self.melody_step % len(MELODY_INDICES)]
+            self.melody_step += 1
+            note = SCALE[note_index]
+
+            # Chaos factor: random detune
+            detune = (self.rng['lead'].random() - 0.5) * 20
+            self.emit('trigger_lead', {'note': note, 'duration': '16n', 'detune': detune})
+
+    def play_chords(self):
+        if self.state != "Groove":
+            return
+        # Play a G minor chord progression on the first beat of every 2 bars
+        if self.sixteenth_count == 0 and self.bar_count % 2 == 0:
+            progression = [
+                ["G2", "Bb2", "D3"],  # Gm
+                ["C3", "Eb3", "G3"],  # Cm
+                ["F2", "A2", "C3"],   # F
+                ["D3", "F3", "A3"]    # Dm
+            ]
+            chord = progression[(self.bar_count // 2) % len(progression)]
+            self.emit('trigger_chords', {'notes': chord, 'duration': '2n'})
+
+    def play_piano(self):
+        if self.state != "Breakdown":
+            return
+        # Sparse, staccato melody in high register
+        if self.sixteenth_count in [0, 4, 8, 12] and self.rng['piano'].random() < 0.4:
+            note = self.rng['piano'].choice(SCALE[14:]) # Higher notes
+            self.emit('trigger_piano', {'note': note, 'duration': '8n'})
+
+    def play_pads(self):
+        if self.state not in ["Groove", "Breakdown"]:
+            return
+        # Long, ambient textures on the first beat of every 4 bars
+        if self.sixteenth_count == 0 and self.bar_count % 4 == 0:
+            note = self.rng['pads'].choice(["G1", "C2", "F1", "D2"]) # Root notes
+            self.emit('trigger_pads', {'note': note, 'duration': '1m'})
+
+    def play_arp(self):
+        if self.state not in ["Drop", "Groove"]:
+            return
+
+        g_minor_scale = ["G2", "A2", "Bb2", "C3", "D3", "Eb3", "F3", "G3"]
+
+        if self.arp_mode == "Random":
+            note = self.rng['arp'].choice(g_minor_scale)
+        else:
+            if self.arp_mode == "Up":
+                arp_pattern = [0, 1, 2, 3, 4, 5, 6, 7]
+            elif self.arp_mode == "Down":
+                arp_pattern = [7, 6, 5, 4, 3, 2, 1, 0]
+            else: # UpDown
+                arp_pattern = [0, 1, 2, 3, 4, 5, 6, 7, 6, 5, 4, 3, 2, 1]
+
+            note_index = arp_pattern[self.sixteenth_count % len(arp_pattern)]
+            note = g_minor_scale[note_index]
+
+        self.emit('trigger_arp', {'note': note, 'duration': '16n'})
+
+    def play_fx(self):
+        if self.state == "Build-up":
+            # Riser start every 8 bars
+            if self.sixteenth_count == 0 and self.bar_count % 8 == 0:
+                self.emit('trigger_riser', {'duration': 8})
+
+            # Snare roll
+            phase_pos = self.bar_count % 32
+            snare_prob = 0
+            if phase_pos > 16: snare_prob = 0.3
+            if phase_pos > 24: snare_prob = 0.6
+            if phase_pos > 28: snare_prob = 1.0
+
+            if self.sixteenth_count % 2 == 0 and self.rng['fx'].random() < snare_prob:
+                 self.emit('trigger_snare', {'duration': '16n'})
+
+    def cutoff_automation(self):
+        """Lead cutoff as (value now, target, bars to target, segment start bar)."""
+        if self.state == "Groove":
+            # Sweep 1500 -> 2000 over every 8 bars
+            pos = self.bar_count % 8
+            return 1500 + 500 * pos / 8, 2000, 8 - pos, self.bar_count - pos
+        if self.state == "Build-up":
+            # Rise 100 Hz per bar across the 32-bar build
+            pos = self.bar_count % 32
+            return 600 + pos * 100, 600 + 32 * 100, 32 - pos, self.bar_count - pos
+        cutoff = {"Breakdown": 600, "Drop": 3000}.get(self.state, 1000)
+        return cutoff, cutoff, 0, None
+
+    def update_params(self):
+        # Evolve filter: one ramp per automation segment, interpolated by the client
+        remaining = (16 - self.sixteenth_count) * self.sixteenth_note_duration
+        value, target, bars, segment = self.cutoff_automation()
+        if bars:
+            data = {'param': 'lead_cutoff', 'from': value, 'to': target,
+                    'duration': remaining + (bars - 1) * 16 * self.sixteenth_note_duration}
+            sent = self.delta.send('lead_cutoff', 'param_ramp', data, token=(self.state, segment))
+        else:
+            sent = self.delta.send('lead_cutoff', 'param_update', {'param': 'lead_cutoff', 'value': value})
+        if not sent:
+            self.delta.count_saved('param_update', {'param': 'lead_cutoff', 'value': value})
+
+        # Chaos factor for bass: glide to a new random spread once per bar
+        if self.sixteenth_count == 0:
+            self.bass_spread, previous = 20 + self.rng['params'].random() * 20, self.bass_spread
+        else:
+            previous = self.bass_spread
+        data = {'param': 'bass_spread', 'from': previous, 'to': self.bass_spread, 'duration': remaining}
+        if not self.delta.send('bass_spread', 'param_ramp', data, token=self.bar_count):
+            self.delta.count_saved('param_update', {'param': 'bass_spread', 'value': self.bass_spread})
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+import metrics
+from queue_backend import owner
+from sequencer import Sequencer
+from wire import batch_time
+
+BROADCAST_PREFIX = "broadcast:"
+BATCH_EVENTS = ('bar_events', 'bar_binary')
+
+
+class Session:
+    def __init__(self, room, sequencer, broadcast=False, ring_bars=0, private=False):
+        self.room = room
+        self.sequencer = sequencer
+        self.members = set()  # Includes members connected to other workers
+        self.private = private  # A client's own session, always on the worker it is connected to
+        self.generation = 0  # Bumped on every start so stale heap entries are dropped
+        self.broadcast = broadcast
+        # Recent (play time, event, encoded batch) for listeners who join mid-stream
+        self.recent = deque(maxlen=ring_bars)
+
+
+class SessionManager:
+    """One Sequencer per room, all driven from a single clock loop.
+
+    Every client gets a session named after its sid unless it joins a shared
+    room. The loop keeps a heap of (deadline, session) and only ever sleeps
+    until the earliest deadline, so the cost is one heap push/pop per tick
+    per running session.
+
+    Broadcast rooms ("broadcast:<stream>") are read-only radio streams: each
+    bar is rendered and packed once for every listener, and the last few
+    bars are kept so late joiners can start on the next bar.
+
+    With several workers (queue_backend.py), each shared room or broadcast
+    runs on the one worker that owns it. A client connected elsewhere is
+    "placed" there: its worker relays membership to the owner, which emits
+    to the room through the message queue. Private sessions never leave
+    the client's worker and skip the queue.
+
+    Socket handlers and the clock loop run on different threads: `lock`
+    guards the sessions, the heap and the hand-off of `loop_running`.
+    """
+
+    # Upper bound on one sleep so sessions started mid-sleep are not delayed much
+    MAX_SLEEP = 0.02
+    # Bars a broadcast keeps for late joiners
+    RING_BARS = 4
+
+    def __init__(self, socketio, pool_factory=None, worker_index=0, worker_count=1, relay=None,
+                 **sequencer_options):
+        self.socketio = socketio
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        # relay(worker, name, sid, args) runs commands[name](sid, *args) on another worker
+        self.relay = relay
+        self.commands = {'session_join': self.join, 'session_leave': self.leave}
+        self.placement = {}  # sid -> room owned by another worker
+        # pool_factory() builds each session's own PatternPool
+        self.pool_factory = pool_factory
+        self.sequencer_options = sequencer_options
+        self.sessions = {}  # room -> Session
+        self.rooms_by_sid = {}
+        self.heap = []
+        self.order = itertools.count()  # Tie-breaker for equal deadlines
+        self.loop_running = False
+        self.lock = threading.RLock()
+        self.first_tick = None  # perf_counter() after the first clock step, for boot timing
+
+    def _output_for(self, room):
+        def output(event, data=None):
+            session = self.sessions.get(room)
+            metrics.record_emit(event, data, len(session.members) if session else 1)
+            if session is not None and session.broadcast and event in BATCH_EVENTS:
+                session.recent.append((batch_time(data), event, data))
+            # One encode per emit; Socket.IO reuses the packet for every member of the room
+            if session is not None and session.private:
+                self.socketio.emit(event, data, to=room, ignore_queue=True)
+            else:
+                self.socketio.emit(event, data, to=room)
+        return output
+
+    def join(self, sid, room=None):
+        """Attach a client to `room` (its own sid by default) and return the sequencer."""
+        room = room or sid
+        worker = self.owner(room, sid)
+        # Built outside the lock: pool_factory() may wait for the melody model
+        pool = None
+        if worker == self.worker_index and room not in self.sessions and self.pool_factory:
+            pool = self.pool_factory()
+        with self.lock:
+            if worker != self.worker_index:
+                if self.placement.get(sid) != room:
+                    self.leave(sid)
+                    self.placement[sid] = room
+                    self.relay(worker, 'session_join', sid, [room])
+                return None
+            if self.rooms_by_sid.get(sid) not in (None, room) or sid in self.placement:
+                self.leave(sid)
+            session = self.sessions.get(room)
+            if session is None:
+                if pool is None and self.pool_factory:
+                    pool = self.pool_factory()  # Only if a leave() removed the room since the check above
+                options = dict(self.sequencer_options)
+                broadcast = room.startswith(BROADCAST_PREFIX)
+                if broadcast:
+                    # One packed batch per bar for everyone; the stream name seeds the arrangement
+                    options.update(schedule_mode="binary", seed=room[len(BROADCAST_PREFIX):])
+                sequencer = Sequencer(self._output_for(room), pattern_pool=pool, **options)
+                session = Session(room, sequencer, broadcast, self.RING_BARS if broadcast else 0, private=room == sid)
+                self.sessions[room] = session
+            session.members.add(sid)
+            self.rooms_by_sid[sid] = room
+            # Resend loop/ramp state so the newcomer is not left with stale values
+            session.sequencer.delta.reset()
+            return session.sequencer
+
+    def leave(self, sid):
+        """Detach a client; the session is discarded once nobody is listening."""
+        with self.lock:
+            placed = self.placement.pop(sid, None)
+            if placed is not None:
+                self.relay(self.owner(placed, sid), 'session_leave', sid)
+                return
+            room = self.rooms_by_sid.pop(sid, None)
+            session = self.sessions.get(room)
+            if session is None:
+                return
+            session.members.discard(sid)
+            if not session.members:
+                session.sequencer.stop()
+                del self.sessions[room]
+
+    def owner(self, room, sid=None):
+        """Worker that runs `room`; a client's private room is always local."""
+        if room == sid or self.worker_count == 1:
+            return self.worker_index
+        return owner(room, self.worker_count)
+
+    def is_local(self, sid):
+        """True if `sid`'s session runs on this worker."""
+        return sid not in self.placement
+
+    def forward(self, sid, name, args=()):
+        """Run command `name` for `sid` on the worker that owns its session."""
+        self.relay(self.owner(self.placement[sid], sid), name, sid, args)
+
+    def handle_command(self, name, sid, args):
+        """Entry point for commands relayed from other workers."""
+        self.commands[name](sid, *args)
+
+    def get(self, sid):
+        """The sequencer serving `sid`, creating a private session if needed (None if it runs elsewhere)."""
+        if sid in self.placement:
+            return None
+        room = self.rooms_by_sid.get(sid)
+        if room is None:
+            return self.join(sid)
+        return self.sessions[room].sequencer
+
+    def room_for(self, sid):
+        return self.placement.get(sid) or self.rooms_by_sid.get(sid, sid)
+
+    def subscribe(self, sid, stream):
+        """Make `sid` a listener of broadcast `stream` and return the room name."""
+        room = BROADCAST_PREFIX + stream
+        self.join(sid, room)
+        return room
+
+    def stream_for(self, sid):
+        """Broadcast stream name `sid` listens to, or None."""
+        room = self.room_for(sid)
+        return room[len(BROADCAST_PREFIX):] if room.startswith(BROADCAST_PREFIX) else None
+
+    def control(self, sid):
+        """The sequencer `sid` may change, or None for broadcast listeners and remote sessions."""
+        sequencer = self.get(sid)
+        if sequencer is None:
+            return None
+        session = self.sessions[self.room_for(sid)]
+        return None if session.broadcast else sequencer
+
+    def replay(self, sid):
+        """Recent broadcast bars that have not started playing yet, oldest first."""
+        session = self.sessions.get(self.room_for(sid))
+        if session is None or not session.broadcast:
+            return []
+        now = session.sequencer.clock.now()
+        return [(event, data) for start, event, data in session.recent if start >= now]
+
+    def start(self, sid):
+        self.get(sid)  # Joins outside the lock first, so a new session's pool is not built under it
+        with self.lock:
+            sequencer = self.get(sid)
+            if sequencer is None:
+                return None  # Runs on another worker
+            session = self.sessions[self.room_for(sid)]
+            if sequencer.is_running:
+                if self.loop_running:
+                    return sequencer
+                sequencer.stop()  # The loop it was on is gone; restart its clock below
+            # A running loop may be mid-sleep; schedule the first tick for when it next wakes
+            sequencer.start(delay=self.MAX_SLEEP if self.loop_running else 0)
+            session.generation += 1
+            heapq.heappush(self.heap, (sequencer.clock.deadline_ns, next(self.order), session, session.generation))
+            if not self.loop_running:
+                self.loop_running = True
+                self.socketio.start_background_task(self.run)
+            return sequencer
+
+    def stop(self, sid):
+        # A broadcast keeps playing until its last listener leaves
+        sequencer = self.control(sid)
+        if sequencer is not None:
+            sequencer.stop()
+
+    def run(self):
+        """Shared clock loop: step whichever running session is due next."""
+        try:
+            while True:
+                with self.lock:
+                    if not self.heap:
+                        # Decided under the lock, so a start() after this launches a new loop
+                        self.loop_running = False
+                        return
+                    deadline_ns, _, session, generation = self.heap[0]
+                    sequencer = session.sequencer
+                    if (generation != session.generation or not sequencer.is_running
+                            or self.sessions.get(session.room) is not session):
+                        heapq.heappop(self.heap)
+                        continue
+                    delay = (deadline_ns - time.monotonic_ns()) / 1e9
+                    if delay <= 0:
+                        heapq.heappop(self.heap)
+                if delay > 0:
+                    self.socketio.sleep(min(delay, self.MAX_SLEEP))
+                    continue
+                try:
+                    metrics.TICK_LATENESS.observe(sequencer.clock.mark() / 1e9)
+                    sequencer.clock.advance(sequencer.step())
+                except Exception as e:
+                    # One broken session must not stop the clock for every other session
+                    print(f"Session {session.room} stopped: {e!r}")
+                    sequencer.stop()
+                    continue
+                if self.first_tick is None:
+                    self.first_tick = time.perf_counter()
+                with self.lock:
+                    heapq.heappush(self.heap, (sequencer.clock.deadline_ns, next(self.order), session, generation))
+        except BaseException:
+            with self.lock:
+                self.loop_running = False
+            raise
+
+    def timing(self):
+        """Clock statistics for every session."""
+        with self.lock:
+            sessions = list(self.sessions.items())
+        return {
+            "sessions": len(sessions),
+            "running": sum(1 for _, s in sessions if s.sequencer.is_running),
+            "rooms": {room: dict(s.sequencer.clock.stats.snapshot(), bpm=s.sequencer.bpm,
+                                 schedule_mode=s.sequencer.schedule_mode, members=len(s.members),
+                                 broadcast=s.broadcast)
+                      for room, s in sessions},
+        }
+
+    def bandwidth(self):
+        """Frames and bytes the change-only channel sent and saved, per session."""
+        with self.lock:
+            sessions = [(room, s, sorted(s.members)) for room, s in self.sessions.items()]
+        return {room: dict(s.sequencer.delta.snapshot(), members=members) for room, s, members in sessions}
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""Server-side synthesis: the sequencer's event stream rendered to PCM with NumPy.
+
+A lighter port of index.html's Tone.js rig, for clients that cannot run
+it (plain audio players, low-power devices, recording):
+- oscillators are additive: a band-limited waveform is a sum of harmonics
+  built with the recurrence sin(kx) = 2cos(x)sin((k-1)x) - sin((k-2)x),
+  so each harmonic costs two array operations and nothing aliases
+- a voice's lowpass filter is applied by weighting its harmonics with the
+  filter's gain at note-on instead of running a per-sample IIR
+- linear ADSR envelopes; the kick is a pitch-swept sine, snare and riser
+  are white noise
+- the bass bus goes through the trance gate, and the bass, lead, chord,
+  pad and arp buses through the sidechain pump, like the browser graph
+
+Rendered voices are cached by everything that shapes them (note, detune,
+filter, length), so repeated notes cost one array add. AudioRenderer
+renders whole bars: tails spill into a pending buffer that later bars
+mix in. AudioBroadcast renders a broadcast session's emitted bars once
+and shares the PCM with every HTTP listener of the stream.
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+import numpy as np
+
+import metrics
+from pitch import note_to_midi
+from render import DURATIONS
+from wire import decode_bar
+
+SAMPLE_RATE = int(os.getenv('AUDIO_SAMPLE_RATE', '44100'))
+VOICE_CACHE_SIZE = int(os.getenv('AUDIO_VOICE_CACHE', '512'))
+
+MASTER_LOWPASS = 12000
+SIDECHAIN_DEPTH = 0.316  # -10 dB dip, 0.05 s down and 0.1 s back, like triggerSidechain()
+GATE_RAMP = 0.01
+GATE_MASK = (1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1)  # TranceGate's starting mask
+MASTER_GAIN = 0.5
+
+
+def _db(value):
+    return 10 ** (value / 20)
+
+
+class Instrument:
+    """One synth from index.html: waveform, unison voices, envelope, filter, level and bus."""
+
+    __slots__ = ("waveform", "voices", "spread", "envelope", "cutoff", "order", "gain", "bus")
+
+    def __init__(self, waveform, envelope, gain_db, bus, voices=1, spread=0.0, cutoff=None, order=2):
+        self.waveform = waveform
+        self.voices = voices
+        self.spread = spread  # Cents between the outer unison voices
+        self.envelope = envelope  # (attack, decay, sustain, release)
+        self.cutoff = cutoff
+        self.order = order  # Filter poles; -12 dB/oct is 2, -24 dB/oct is 4
+        self.gain = _db(gain_db)
+        self.bus = bus
+
+
+INSTRUMENTS = {
+    'lead': Instrument('saw', (0.01, 0.3, 0.4, 0.8), -12, 'sidechain', voices=3, spread=40, cutoff=1500, order=4),
+    'bass': Instrument('saw', (0.01, 0.1, 0.5, 0.4), -6, 'gate', voices=3, spread=30, cutoff=500, order=4),
+    'chords': Instrument('saw', (0.1, 0.2, 0.5, 1.0), -10, 'sidechain'),
+    'piano': Instrument('sine', (0.01, 0.5, 0.0, 0.5), -5, 'dry'),
+    'pads': Instrument('triangle', (2.0, 1.0, 0.8, 2.0), -15, 'sidechain'),
+    'arp': Instrument('square', (0.01, 0.1, 0.1, 0.1), -12, 'sidechain', cutoff=800, order=2),
+}
+EVENT_INSTRUMENTS = {'trigger_lead': 'lead', 'trigger_chords': 'chords', 'trigger_piano': 'piano',
+                     'trigger_pads': 'pads', 'trigger_arp': 'arp', 'trigger_bass': 'bass'}
+BUSES = ('gate', 'sidechain', 'dry')
+
+
+def frequency(midi):
+    return 440.0 * 2 ** ((midi - 69) / 12)
+
+
+def harmonics(waveform, fundamental, cutoff=None, order=2, sample_rate=SAMPLE_RATE):
+    """Amplitude of each harmonic (index 0 is the fundamental) after the lowpass."""
+    top = min(sample_rate / 2, MASTER_LOWPASS)
+    if cutoff:
+        # Past ~3x the cutoff an order-2 or steeper filter is down 40 dB or more
+        top = min(top, cutoff * 10 ** (2 / order))
+    count = max(1, int(top // fundamental))
+    k = np.arange(1, count + 1, dtype=np.float64)
+    if waveform == 'sine':
+        weights = (k == 1).astype(np.float64)
+    elif waveform == 'saw':
+        weights = (2 / np.pi) / k
+    elif waveform == 'square':
+        weights = np.where(k % 2 == 1, (4 / np.pi) / k, 0.0)
+    elif waveform == 'triangle':
+        weights = np.where(k % 2 == 1, (8 / np.pi ** 2) * (-1.0) ** ((k - 1) // 2) / k ** 2, 0.0)
+    else:
+        raise ValueError(f"unknown waveform {waveform}")
+    if cutoff:
+        weights = weights / np.sqrt(1 + (k * fundamental / cutoff) ** (2 * order))
+    return weights
+
+
+def additive(fundamental, weights, samples, sample_rate=SAMPLE_RATE):
+    """sum_k weights[k-1] * sin(k * 2pi f t) over `samples` samples."""
+    x = np.arange(samples) * (2 * np.pi * fundamental / sample_rate)
+    current = np.sin(x)
+    out = current * weights[0]
+    if len(weights) > 1:
+        twice_cos = 2 * np.cos(x)
+        previous = np.zeros(samples)
+        for weight in weights[1:]:
+            previous, current = current, twice_cos * current - previous
+            if weight:
+                out += weight * current
+    return out
+
+
+def envelope(samples, gate, attack, decay, sustain, release, sample_rate=SAMPLE_RATE):
+    """Linear ADSR over `samples` samples with the note held for `gate` seconds."""
+    t = np.arange(samples) / sample_rate
+    points = [0.0, attack, attack + decay]
+    levels = [0.0, 1.0, sustain]
+    out = np.interp(t, points, levels)
+    held = min(samples, int(gate * sample_rate))
+    level = float(np.interp(gate, points, levels))
+    out[held:] = level * np.maximum(0.0, 1 - (t[held:] - gate) / release) if release else 0.0
+    return out
+
+
+class VoiceCache:
+    """LRU of rendered voices (float32 arrays, unit velocity), shared by every stream."""
+
+    def __init__(self, size=VOICE_CACHE_SIZE):
+        self.size = size
+        self.voices = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        with self.lock:
+            voice = self.voices.get(key)
+            if voice is not None:
+                self.hits += 1
+                self.voices.move_to_end(key)
+                return voice
+            self.misses += 1
+        voice = build()
+        with self.lock:
+            self.voices[key] = voice
+            while len(self.voices) > self.size:
+                self.voices.popitem(last=False)
+        return voice
+
+    def stats(self):
+        with self.lock:
+            return {"voices": len(self.voices), "size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+VOICES = VoiceCache()
+
+
+def tone(instrument, midi, gate, detune=0.0, cutoff=None, sample_rate=SAMPLE_RATE):
+    """One note of `instrument` held for `gate` seconds, release tail included."""
+    attack, decay, sustain, release = instrument.envelope
+    samples = int((gate + release) * sample_rate) + 1
+    base = frequency(midi) * 2 ** (detune / 1200)
+    out = np.zeros(samples)
+    if instrument.voices > 1:
+        offsets = np.linspace(-instrument.spread / 2, instrument.spread / 2, instrument.voices)
+    else:
+        offsets = (0.0,)
+    for cents in offsets:
+        fundamental = base * 2 ** (cents / 1200)
+        out += additive(fundamental, harmonics(instrument.waveform, fundamental, cutoff or instrument.cutoff,
+                                               instrument.order, sample_rate), samples, sample_rate)
+    out *= envelope(samples, gate, attack, decay, sustain, release, sample_rate)
+    out *= instrument.gain / instrument.voices ** 0.5
+    return out.astype(np.float32)
+
+
+def kick(sample_rate=SAMPLE_RATE):
+    """MembraneSynth C2: a sine swept down 4 octaves in 8 ms, 0.2 s decay."""
+    samples = int(0.4 * sample_rate)
+    t = np.arange(samples) / sample_rate
+    pitch = frequency(note_to_midi('C2')) * 2 ** (4 * np.exp(-t / 0.008 * 4))
+    phase = np.cumsum(pitch) * (2 * np.pi / sample_rate)
+    amplitude = np.interp(t, [0.0, 0.001, 0.201], [0.0, 1.0, 0.0])
+    return (np.sin(phase) * amplitude).astype(np.float32)
+
+
+def noise(seconds, attack, decay, sustain, release, gain_db, seed=0, sample_rate=SAMPLE_RATE):
+    samples = int((seconds + release) * sample_rate) + 1
+    burst = np.random.default_rng(seed).uniform(-1.0, 1.0, samples)
+    burst *= envelope(samples, seconds, attack, decay, sustain, release, sample_rate) * _db(gain_db)
+    return burst.astype(np.float32)
+
+
+def wav_header(frames=None, sample_rate=SAMPLE_RATE, channels=1):
+    """16-bit PCM WAV header; without `frames` the sizes are left at their maximum for streaming."""
+    data = 0xFFFFFFFF - 36 if frames is None else frames * 2 * channels
+    return (b'RIFF' + struct.pack('<I', min(0xFFFFFFFF, data + 36)) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, sample_rate * 2 * channels,
+                                    2 * channels, 16)
+            + b'data' + struct.pack('<I', data))
+
+
+class AudioRenderer:
+    """Turns bars of sequencer events into mono 16-bit PCM.
+
+    Give it a Sequencer to render_bar() straight from it, or only a seed
+    and feed it already emitted bars with render_events().
+    """
+
+    def __init__(self, sequencer=None, sample_rate=SAMPLE_RATE, voices=VOICES, seed=None):
+        self.sequencer = sequencer
+        self.sample_rate = sample_rate
+        self.voices = voices
+        if sequencer is not None:
+            seed = sequencer.seed
+        self.rng = np.random.default_rng(zlib.crc32(str(seed).encode('utf-8')))
+        self.pending = {bus: np.zeros(0, dtype=np.float32) for bus in BUSES}
+        self.seconds = 0.0  # Rendered so far
+        self.frames = 0
+        self.gate = np.array(GATE_MASK, dtype=np.float32)
+        self.gate_value = 1.0  # Where the gate's last ramp ended
+        self.gate_steps = 0  # Sixteenths played through the gate, for its evolve()
+        self.bass = None  # Current bass_loop payload
+        self.cutoff = (0.0, 1500.0, 1500.0, 0.0)  # Lead cutoff ramp: (start, from, to, duration)
+
+    def render_bar(self):
+        """Run one bar of the sequencer and return its PCM as int16 bytes."""
+        sequencer = self.sequencer
+        events = sequencer.render_bar()
+        return self.render_events(events, sequencer.sixteenth_note_duration)
+
+    def render_events(self, events, sixteenth):
+        """PCM for one bar of [step, event, data] events, `sixteenth` seconds per step."""
+        started = time.perf_counter_ns()
+        rate = self.sample_rate
+        bar_start = self.seconds
+        frames = round((bar_start + 16 * sixteenth) * rate) - self.frames
+        step_frames = [round((bar_start + i * sixteenth) * rate) - self.frames for i in range(17)]
+
+        buses = {bus: np.zeros(frames, dtype=np.float32) for bus in BUSES}
+        for bus, tail in self.pending.items():
+            n = min(len(tail), frames)
+            buses[bus][:n] += tail[:n]
+            self.pending[bus] = tail[n:]
+        sidechain = []
+
+        events = iter(events)
+        pending = next(events, None)
+        for step in range(16):
+            at = step_frames[step]
+            now = bar_start + step * sixteenth
+            while pending is not None and pending[0] == step:
+                _, event, data = pending
+                data = data or {}
+                if event == 'trigger_sidechain':
+                    sidechain.append(at)
+                elif event == 'trigger_kick':
+                    self._mix(buses, 'dry', at, self.voices.get(('kick', rate), lambda: kick(rate)))
+                elif event == 'trigger_snare':
+                    self._mix(buses, 'dry', at, self.voices.get(
+                        ('snare', rate), lambda: noise(0.1, 0.005, 0.1, 0.0, 0.05, -6, 1, rate)))
+                elif event == 'trigger_riser':
+                    seconds = data.get('duration', 8) * 16 * sixteenth
+                    self._mix(buses, 'dry', at, self.voices.get(
+                        ('riser', round(seconds * rate), rate),
+                        lambda: noise(seconds, 0.1, 0.2, 0.1, 0.8, -20, 2, rate)))
+                elif event == 'bass_loop':
+                    self.bass = data if data.get('note') else None
+                elif event == 'param_ramp' and data.get('param') == 'lead_cutoff':
+                    self.cutoff = (now, data['from'], data['to'], data['duration'])
+                elif event == 'param_update' and data.get('param') == 'lead_cutoff':
+                    self.cutoff = (now, data['value'], data['value'], 0.0)
+                elif event in EVENT_INSTRUMENTS:
+                    name = EVENT_INSTRUMENTS[event]
+                    gate = DURATIONS.get(data.get('duration'), 1) * sixteenth
+                    velocity = data.get('velocity', 1.0)
+                    cutoff = self._lead_cutoff(now) if name == 'lead' else None
+                    for note in data.get('notes') or [data['note']]:
+                        self._note(buses, name, at, note_to_midi(note), gate, data.get('detune', 0.0),
+                                   cutoff, velocity)
+                pending = next(events, None)
+            if self.bass:
+                # The client's 16th-note loop replays bass_loop until it changes
+                gate = DURATIONS.get(self.bass.get('duration'), 1) * sixteenth
+                self._note(buses, 'bass', at, note_to_midi(self.bass['note']), gate)
+
+        self._trance_gate(buses['gate'], step_frames)
+        mix = buses['sidechain']
+        mix += buses['gate']
+        if sidechain:
+            mix *= self._pump(frames, sidechain)
+        mix += buses['dry']
+        np.tanh(mix * MASTER_GAIN, out=mix)
+
+        self.seconds += 16 * sixteenth
+        self.frames += frames
+        metrics.AUDIO_BAR_SECONDS.observe(metrics.elapsed(started))
+        return (mix * 32767).astype('<i2').tobytes()
+
+    def _note(self, buses, name, at, midi, gate, detune=0.0, cutoff=None, velocity=1.0):
+        instrument = INSTRUMENTS[name]
+        rate = self.sample_rate
+        # Quantized so humanized detune and swept cutoffs still hit the cache
+        detune = round(detune)
+        if cutoff is not None:
+            cutoff = round(2 ** (round(12 * np.log2(cutoff)) / 12))
+        key = (name, midi, round(gate * rate), detune, cutoff, rate)
+        voice = self.voices.get(key, lambda: tone(instrument, midi, gate, detune, cutoff, rate))
+        self._mix(buses, instrument.bus, at, voice, velocity)
+
+    def _mix(self, buses, bus, at, voice, velocity=1.0):
+        out = buses[bus]
+        n = min(len(voice), len(out) - at)
+        if velocity == 1.0:
+            out[at:at + n] += voice[:n]
+        else:
+            out[at:at + n] += voice[:n] * np.float32(velocity)
+        if n < len(voice):
+            tail = voice[n:] if velocity == 1.0 else voice[n:] * np.float32(velocity)
+            pending = self.pending[bus]
+            if len(pending) < len(tail):
+                pending = np.concatenate((pending, np.zeros(len(tail) - len(pending), dtype=np.float32)))
+            pending[:len(tail)] += tail
+            self.pending[bus] = pending
+
+    def _lead_cutoff(self, now):
+        start, begin, end, duration = self.cutoff
+        progress = min(1.0, (now - start) / duration) if duration > 0 else 1.0
+        return min(9000.0, max(400.0, begin + (end - begin) * progress))
+
+    def _trance_gate(self, bus, step_frames):
+        """Apply the 16-step gate mask with a 10 ms ramp into each step's value."""
+        ramp = max(1, int(GATE_RAMP * self.sample_rate))
+        for step in range(16):
+            value = float(self.gate[self.gate_steps % 16])
+            start, end = step_frames[step], step_frames[step + 1]
+            n = min(ramp, end - start)
+            if self.gate_value != value:
+                bus[start:start + n] *= np.linspace(self.gate_value, value, n, endpoint=False, dtype=np.float32)
+            if value != 1.0:
+                bus[start + n:end] *= value
+            self.gate_value = value
+            if self.gate_steps % 64 == 0 and self.gate_steps > 0:
+                # Like TranceGate.evolve(): flip one step every 4 bars
+                index = int(self.rng.integers(16))
+                self.gate[index] = 1 - self.gate[index]
+            self.gate_steps += 1
+
+    def _pump(self, frames, triggers):
+        gain = np.ones(frames, dtype=np.float32)
+        rate = self.sample_rate
+        dip = np.interp(np.arange(int(0.15 * rate)), [0, 0.05 * rate, 0.15 * rate],
+                        [1.0, SIDECHAIN_DEPTH, 1.0]).astype(np.float32)
+        for at in triggers:
+            n = min(len(dip), frames - at)
+            gain[at:at + n] = dip[:n]
+        return gain
+
+
+class AudioBroadcast:
+    """A broadcast session's emitted bars, rendered once for every HTTP listener.
+
+    Bars are read from the session's ring buffer (Session.recent) when a
+    listener asks for one that is not rendered yet; the first listener to
+    ask renders it and the rest reuse its PCM, so the cost per stream does
+    not grow with the audience.
+    """
+
+    def __init__(self, session, sample_rate=SAMPLE_RATE, voices=VOICES, keep=8):
+        self.session = session
+        self.renderer = AudioRenderer(sample_rate=sample_rate, voices=voices, seed=session.sequencer.seed)
+        self.chunks = deque(maxlen=keep)  # (bar index, play time, PCM)
+        self.rendered = 0  # Index of the next bar to render
+        self.last_time = None  # Play time of the last rendered bar
+        self.lock = threading.Lock()
+
+    def _pull(self):
+        for start, event, batch in list(self.session.recent):
+            if self.last_time is not None and start <= self.last_time:
+                continue
+            if event == 'bar_binary':
+                batch = decode_bar(batch)
+            pcm = self.renderer.render_events(batch['events'], batch['sixteenth'])
+            self.chunks.append((self.rendered, start, pcm))
+            self.rendered += 1
+            self.last_time = start
+
+    def first(self):
+        """Index of the bar a new listener starts on: the next one to start playing."""
+        with self.lock:
+            self._pull()
+            now = self.session.sequencer.clock.now()
+            for index, start, _ in self.chunks:
+                if start >= now:
+                    return index
+            return self.rendered
+
+    def get(self, index):
+        """(index, PCM) of bar `index`, or None until it is emitted.
+
+        A listener that fell further behind than the kept bars skips ahead
+        to the oldest one still kept.
+        """
+        with self.lock:
+            if index >= self.rendered:
+                self._pull()
+            for kept, _, pcm in self.chunks:
+                if kept >= index:
+                    return kept, pcm
+            return None
+
+    def stream(self, bars=None, sleep=time.sleep, poll=0.05):
+        """WAV bytes, one bar per chunk, from the next bar on; endless unless `bars` is given.
+
+        Bars arrive as the session emits them, so the stream keeps pace with
+        the broadcast. It ends when the session stops.
+        """
+        rate = self.renderer.sample_rate
+        frames = size = None
+        if bars is not None:
+            frames = round(bars * 16 * self.session.sequencer.sixteenth_note_duration * rate)
+            size = frames * 2
+        yield wav_header(frames, rate)
+        index = self.first()
+        sent = 0
+        while bars is None or sent < size:
+            chunk = self.get(index)
+            if chunk is None:
+                if not self.session.sequencer.is_running:
+                    break
+                sleep(poll)
+                continue
+            index, pcm = chunk
+            index += 1
+            if size is not None:
+                pcm = pcm[:size - sent]  # Bar lengths round to whole frames; keep to the declared size
+            sent += len(pcm)
+            yield pcm
+        if size is not None and sent < size:
+            yield bytes(size - sent)
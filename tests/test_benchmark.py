@@ -0,0 +1,43 @@
+import unittest
+
+from benchmark import bench_wire, compare
+from clock import JitterStats
+
+
+def report(**results):
+    return {"results": results}
+
+
+class CompareTest(unittest.TestCase):
+    def test_slowdown_beyond_tolerance_is_a_regression(self):
+        regressions = compare(report(boot={"first_event_ms": 130.0}), report(boot={"first_event_ms": 100.0}), 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("first_event_ms", regressions[0])
+
+    def test_slowdown_within_tolerance_passes(self):
+        self.assertEqual(compare(report(boot={"first_event_ms": 115.0}), report(boot={"first_event_ms": 100.0}), 0.2), [])
+
+    def test_unmeasured_metrics_are_skipped(self):
+        now = {"mode": "tick", "bytes_per_s_per_client": 100.0, "tick_lateness_p99_ms": None}
+        then = {"mode": "tick", "bytes_per_s_per_client": 100.0, "tick_lateness_p99_ms": 1.0}
+        self.assertEqual(compare(report(sockets=now), report(sockets=then), 0.2), [])
+
+    def test_different_socket_modes_are_not_compared(self):
+        now = {"mode": "binary", "bytes_per_s_per_client": 500.0, "tick_lateness_p99_ms": 1.0}
+        then = {"mode": "tick", "bytes_per_s_per_client": 100.0, "tick_lateness_p99_ms": 1.0}
+        self.assertEqual(compare(report(sockets=now), report(sockets=then), 0.2), [])
+
+
+class ThresholdTest(unittest.TestCase):
+    def test_binary_bars_stay_small(self):
+        # Deterministic for a seed, so a fixed budget is a reliable regression check
+        self.assertLess(bench_wire(bars=32, repeat=1)["binary_bytes_per_bar"], 400)
+
+    def test_jitter_without_samples_is_null(self):
+        snapshot = JitterStats().snapshot()
+        self.assertEqual(snapshot["window"], 0)
+        self.assertIsNone(snapshot["mean_ms"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import random
+import unittest
+
+from compact_pattern import CompactPattern
+from markov import MelodyModel
+from pitch import G_MINOR
+
+
+def line(*pitches):
+    pattern = CompactPattern(steps=16)
+    for step, pitch in enumerate(pitches):
+        pattern.set("lead", step * 4, pitch)
+    return pattern
+
+
+class FrozenModelTest(unittest.TestCase):
+    def test_frozen_model_refuses_to_learn(self):
+        model = MelodyModel()
+        model.learn(line(67, 70, 72, 74))
+        model.freeze()
+        with self.assertRaises(RuntimeError):
+            model.learn(line(79, 77, 74, 72))
+        self.assertEqual(model.stats()["patterns"], 1)
+
+    def test_same_seed_same_line(self):
+        model = MelodyModel()
+        model.learn(line(67, 70, 72, 74))
+        model.freeze()
+        first = model.generate(random.Random(42), G_MINOR, 67, 79)
+        self.assertEqual(model.generate(random.Random(42), G_MINOR, 67, 79), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
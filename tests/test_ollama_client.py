@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_client import OllamaClient
+from pregen import PatternPool
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """Just enough of Ollama's streaming /api/generate, on a free local port.
+
+    `mode` is "ok" (stream `reply` in two chunks), "slow" (answer after
+    `delay` seconds) or "error" (HTTP 500).
+    """
+    daemon_threads = True
+
+    def __init__(self, reply='{"energy": 0.9}'):
+        super().__init__(('127.0.0.1', 0), FakeOllamaHandler)
+        self.reply = reply
+        self.mode = "ok"
+        self.delay = 1.0
+        self.requests = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server.requests += 1
+        if server.mode == "error":
+            self.send_response(500)
+            self.end_headers()
+            return
+        if server.mode == "slow":
+            time.sleep(server.delay)
+        half = len(server.reply) // 2
+        lines = [{"response": server.reply[:half], "done": False}, {"response": server.reply[half:], "done": True}]
+        body = b''.join(json.dumps(line).encode('utf-8') + b'\n' for line in lines)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OllamaClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOllama()
+        self.addCleanup(self.server.close)
+        self.client = OllamaClient(self.server.url, timeout=0.2, failure_threshold=2, reset_timeout=0.3)
+        self.addCleanup(self.client.close)
+
+    def test_streamed_reply_is_joined_and_parsed(self):
+        self.assertEqual(self.client.generate("a"), '{"energy": 0.9}')
+        self.assertEqual(self.client.generate("b", parse_json=True), {"energy": 0.9})
+
+    def test_timeout_resolves_to_none(self):
+        self.server.mode = "slow"
+        started = time.monotonic()
+        self.assertIsNone(self.client.generate("a"))
+        self.assertLess(time.monotonic() - started, self.server.delay)
+        self.assertEqual(self.client.breaker.failures, 1)
+
+    def test_breaker_opens_and_skips_the_server(self):
+        self.server.mode = "error"
+        self.assertIsNone(self.client.generate("a"))
+        self.assertIsNone(self.client.generate("b"))
+        self.assertTrue(self.client.breaker.is_open)
+        future = self.client.submit("c")
+        self.assertTrue(future.done())
+        self.assertIsNone(future.result())
+        self.assertEqual(self.server.requests, 2)
+
+    def test_breaker_closes_after_a_successful_probe(self):
+        self.server.mode = "error"
+        self.client.generate("a")
+        self.client.generate("b")
+        self.server.mode = "ok"
+        time.sleep(self.client.breaker.reset_timeout)
+        self.assertEqual(self.client.generate("c"), '{"energy": 0.9}')
+        self.assertFalse(self.client.breaker.is_open)
+
+    def test_pattern_pool_falls_back_while_ollama_fails(self):
+        self.server.mode = "error"
+        pool = PatternPool(seed=1, ollama=self.client)
+        pattern = pool.take("groove")
+        self.assertIsNone(pool.energy_requests["groove"].result())
+        # Same material as a pool that never had Ollama: the default energy
+        self.assertEqual(pattern.to_bytes(), PatternPool(seed=1).take("groove").to_bytes())
+        self.assertIsNone(pool._energy("groove", None))
+
+if __name__ == '__main__':
+    unittest.main()
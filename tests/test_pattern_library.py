@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pattern_library import PatternLibrary
+
+
+def write(directory, name, pattern):
+    with open(os.path.join(directory, f"{name}.json"), 'w') as f:
+        json.dump(pattern, f)
+
+
+class MalformedPatternTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        good = {"tracks": [{"name": "Lead", "notes": [{"name": "G4", "time": 0, "duration": 0.25}]}]}
+        for name in ("a_first", "c_after", "d_after", "e_after"):
+            write(self.directory, name, good)
+        write(self.directory, "b_bad", {"tracks": [{"notes": [{"name": "C4", "time": "soon"}]}]})
+        write(self.directory, "b_strings", {"tracks": ["abc"]})
+
+    def test_bad_file_is_skipped_and_the_rest_load(self):
+        library = PatternLibrary(self.directory)
+        library.warm()
+        self.assertEqual(library.search()['total'], 4)
+        self.assertEqual(set(library.skipped), {"b_bad", "b_strings"})
+        self.assertEqual(sorted(name for name, _ in library.compiled()), ["a_first", "c_after", "d_after", "e_after"])
+
+    def test_bad_file_is_not_retried_until_it_changes(self):
+        library = PatternLibrary(self.directory)
+        library.warm()
+        self.assertEqual(library.refresh(force=True), 0)
+        write(self.directory, "b_bad", {"tracks": [{"notes": [{"name": "C4", "time": 0, "duration": 0.25}]}]})
+        os.utime(os.path.join(self.directory, "b_bad.json"), ns=(1, 1))
+        self.assertEqual(library.refresh(force=True), 1)
+        self.assertNotIn("b_bad", library.skipped)
+        self.assertEqual(library.search()['total'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
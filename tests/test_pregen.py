@@ -0,0 +1,105 @@
+import hashlib
+import unittest
+
+from pregen import DEFAULT_ENERGY, STATES, PatternPool
+from trance_ai import TranceAI
+
+
+class DeferredSpawn:
+    """spawn() that keeps background calls until run() is called."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, fn, *args):
+        self.calls.append((fn, args))
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for fn, args in calls:
+            fn(*args)
+
+
+class KeyTest(unittest.TestCase):
+    def test_unknown_states_are_rejected(self):
+        pool = PatternPool(seed=1)
+        for state in ("chorus", "", None, 7):
+            with self.assertRaises(ValueError):
+                pool.take(state)
+
+    def test_bad_energies_are_rejected(self):
+        pool = PatternPool(seed=1)
+        for energy in ("loud", [0.5], float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                pool.take("groove", energy)
+
+    def test_energies_collapse_to_eleven_levels(self):
+        pool = PatternPool(seed=1, spawn=DeferredSpawn())
+        for i in range(-50, 150):
+            pool.prefetch("Groove", i / 97)
+        self.assertEqual(len(pool.queues), 11)
+        self.assertEqual({state for state, _ in pool.queues}, {"groove"})
+
+
+class ReseedTest(unittest.TestCase):
+    def test_fills_from_before_a_reseed_are_discarded(self):
+        spawn = DeferredSpawn()
+        pool = PatternPool(seed=1, spawn=spawn)
+        pool.prefetch("groove")
+        pool.reseed(2)
+        spawn.run()
+        self.assertEqual(pool.ready("groove"), 0)
+        self.assertFalse(pool.filling)
+
+        # The new seed's stream is untouched by the stale fill
+        expected = PatternPool(seed=2).take("groove")
+        self.assertEqual(pool.take("groove").to_bytes(), expected.to_bytes())
+
+    def test_current_fills_are_kept(self):
+        spawn = DeferredSpawn()
+        pool = PatternPool(seed=1, spawn=spawn)
+        for state in STATES:
+            pool.prefetch(state)
+        spawn.run()
+        self.assertEqual([pool.ready(state) for state in STATES], [pool.depth] * len(STATES))
+
+
+class SeededOutputTest(unittest.TestCase):
+    # sha256 prefixes of TranceAI("golden").generate_compact(state) for each state in turn.
+    # A change here changes what every seeded set and render sounds like: update on purpose only.
+    GOLDEN = {"groove": "85db37821e808a56", "breakdown": "ae5fdd1bd4c2679b",
+              "buildup": "2c07bfd0db32f214", "drop": "520941c116589fab"}
+
+    def test_generator_matches_the_golden_output(self):
+        generator = TranceAI("golden")
+        digests = {state: hashlib.sha256(generator.generate_compact(state).to_bytes()).hexdigest()[:16]
+                   for state in self.GOLDEN}
+        self.assertEqual(digests, self.GOLDEN)
+
+    def test_takes_follow_each_state_generator(self):
+        pool = PatternPool(seed=1)
+        generator = TranceAI("1:groove")
+        for _ in range(3):
+            self.assertEqual(pool.take("groove").to_bytes(),
+                             generator.generate_compact("groove", DEFAULT_ENERGY).to_bytes())
+
+    def test_refill_order_does_not_change_the_material(self):
+        order = ["groove", "drop", "groove", "breakdown", "buildup", "drop", "groove"]
+        inline = PatternPool(seed="set")
+        expected = [inline.take(state).to_bytes() for state in order]
+
+        spawn = DeferredSpawn()
+        pool = PatternPool(seed="set", spawn=spawn)
+        for state in reversed(STATES):
+            pool.prefetch(state)
+        spawn.calls.reverse()
+        spawn.run()
+        taken = []
+        for state in order:
+            taken.append(pool.take(state).to_bytes())
+            spawn.run()
+        self.assertEqual(taken, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
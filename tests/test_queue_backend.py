@@ -0,0 +1,91 @@
+import time
+import unittest
+import uuid
+
+import socketio
+
+from queue_backend import client_manager, owner
+from sessions import SessionManager
+
+
+def wait_until(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Worker:
+    """One app worker: a Socket.IO server on a local:// queue and its SessionManager."""
+
+    def __init__(self, index, channel):
+        self.manager = client_manager('local://', channel=channel, worker_index=index)
+        self.server = socketio.Server(async_mode='threading', client_manager=self.manager)
+        self.server.manager_initialized = True
+        self.manager.initialize()
+        self.sessions = SessionManager(self.server, worker_index=index, worker_count=2, relay=self.manager.relay)
+        self.manager.command_handler = self.sessions.handle_command
+        self.sessions.commands['session_start'] = self.sessions.start
+        # Emits published by the other worker, as this worker's listening thread sees them
+        self.received = []
+        handle_emit = self.manager._handle_emit
+        self.manager._handle_emit = lambda message: (self.received.append(message), handle_emit(message))
+
+
+class TwoWorkersTest(unittest.TestCase):
+    def setUp(self):
+        channel = f"test-{uuid.uuid4().hex}"
+        self.workers = [Worker(0, channel), Worker(1, channel)]
+        # A shared room run by worker 1
+        self.room = next(f"room{i}" for i in range(100) if owner(f"room{i}", 2) == 1)
+
+    def tearDown(self):
+        for worker in self.workers:
+            for session in list(worker.sessions.sessions.values()):
+                session.sequencer.stop()
+
+    def test_join_is_relayed_to_the_owner(self):
+        near, far = self.workers
+        self.assertIsNone(near.sessions.join("a", self.room))
+        self.assertFalse(near.sessions.is_local("a"))
+        self.assertTrue(wait_until(lambda: self.room in far.sessions.sessions))
+        self.assertEqual(far.sessions.sessions[self.room].members, {"a"})
+        self.assertNotIn(self.room, near.sessions.sessions)
+
+    def test_leave_is_relayed_and_drops_the_empty_session(self):
+        near, far = self.workers
+        near.sessions.join("a", self.room)
+        self.assertTrue(wait_until(lambda: self.room in far.sessions.sessions))
+        near.sessions.leave("a")
+        self.assertTrue(near.sessions.is_local("a"))
+        self.assertTrue(wait_until(lambda: self.room not in far.sessions.sessions))
+
+    def test_forward_runs_the_command_on_the_owner(self):
+        near, far = self.workers
+        calls = []
+        far.sessions.commands['probe'] = lambda sid, value: calls.append((sid, value))
+        near.sessions.join("a", self.room)
+        near.sessions.forward("a", 'probe', [7])
+        self.assertTrue(wait_until(lambda: calls))
+        self.assertEqual(calls, [("a", 7)])
+
+    def test_owner_emits_reach_the_other_worker(self):
+        near, far = self.workers
+        near.sessions.join("a", self.room)
+        near.sessions.forward("a", 'session_start')
+        self.assertTrue(wait_until(lambda: any(m['room'] == self.room for m in near.received)))
+        self.assertTrue(far.sessions.sessions[self.room].sequencer.is_running)
+
+    def test_private_sessions_stay_off_the_queue(self):
+        near, far = self.workers
+        self.assertIsNotNone(near.sessions.join("b"))
+        near.sessions.start("b")
+        time.sleep(0.2)
+        self.assertFalse(far.received)
+        self.assertNotIn("b", far.sessions.sessions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from compact_pattern import CompactPattern
+from sequencer import MAX_BPM, MIN_BPM, Sequencer
+
+
+class SetBpmTest(unittest.TestCase):
+    def test_values_are_coerced_and_clamped(self):
+        sequencer = Sequencer(seed=1)
+        self.assertEqual(sequencer.set_bpm("150"), 150.0)
+        self.assertEqual(sequencer.set_bpm(0), MIN_BPM)
+        self.assertEqual(sequencer.set_bpm(-20), MIN_BPM)
+        self.assertEqual(sequencer.set_bpm(10000), MAX_BPM)
+
+    def test_non_numbers_are_rejected(self):
+        sequencer = Sequencer(seed=1)
+        for bad in ("fast", None, [140], float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                sequencer.set_bpm(bad)
+        self.assertIsNone(sequencer.pending_bpm)
+
+    def test_clamped_tempo_ticks(self):
+        sequencer = Sequencer(seed=1)
+        sequencer.set_bpm(0)
+        sequencer.render_bar()
+        self.assertEqual(sequencer.bpm, MIN_BPM)
+
+
+class ScheduleBarTest(unittest.TestCase):
+    def test_bars_stay_contiguous_across_a_tempo_change(self):
+        batches = []
+        sequencer = Sequencer(output=lambda event, data=None: batches.append(data), schedule_mode="bar", seed=1)
+        sequencer.start()
+        for bar in range(4):
+            if bar == 2:
+                sequencer.set_bpm(150)
+            sequencer.clock.advance(sequencer.step())
+        for previous, batch in zip(batches, batches[1:]):
+            self.assertAlmostEqual(previous['time'] + 16 * previous['sixteenth'], batch['time'])
+        self.assertAlmostEqual(batches[2]['sixteenth'], 60 / 150 / 4)
+
+
+class LeadVelocityTest(unittest.TestCase):
+    def lead_velocities(self, mutation):
+        sequencer = Sequencer(seed=1)
+        sequencer.pattern_steps = CompactPattern.from_placed([(step, "Lead", 67, 80, 24) for step in range(0, 16, 2)])
+        sequencer.mutation = mutation
+        velocities = []
+        for _ in range(4):
+            velocities += [data['velocity'] for _, event, data in sequencer.render_bar() if event == 'trigger_lead']
+        return velocities
+
+    def test_source_notes_carry_their_velocity(self):
+        velocities = self.lead_velocities(0)
+        self.assertTrue(velocities)
+        self.assertTrue(all(v == 0.8 for v in velocities))
+
+    def test_mutation_varies_around_the_source_level(self):
+        velocities = self.lead_velocities(0.5)
+        self.assertAlmostEqual(sum(velocities) / len(velocities), 0.8, delta=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import threading
+import time
+import unittest
+
+from sessions import SessionManager
+
+
+class FakeSocketIO:
+    """The parts of flask_socketio.SocketIO that SessionManager uses."""
+
+    def __init__(self):
+        self.emitted = []  # (event, data, room)
+        self.lock = threading.Lock()
+
+    def emit(self, event, data=None, to=None, **kwargs):
+        with self.lock:
+            self.emitted.append((event, data, to))
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def start_background_task(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def frames_to(self, room):
+        with self.lock:
+            return sum(1 for _, _, to in self.emitted if to == room)
+
+
+class SlowToEmpty(list):
+    """A heap that takes a while to report being empty, widening the window where the loop decides to exit."""
+
+    def __len__(self):
+        size = super().__len__()
+        if not size:
+            time.sleep(0.01)
+        return size
+
+
+class ClockLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.socketio = FakeSocketIO()
+        self.sessions = SessionManager(self.socketio)
+
+    def tearDown(self):
+        for session in list(self.sessions.sessions.values()):
+            session.sequencer.stop()
+
+    def test_failing_session_does_not_stop_the_others(self):
+        self.sessions.start('a')
+        self.sessions.start('b')
+        broken = self.sessions.get('a')
+
+        def fail():
+            raise ZeroDivisionError("float division by zero")
+        broken.step = fail
+        time.sleep(0.5)
+
+        self.assertFalse(broken.is_running)
+        self.assertTrue(self.sessions.loop_running)
+        before = self.socketio.frames_to('b')
+        time.sleep(0.3)
+        self.assertGreater(self.socketio.frames_to('b'), before)
+
+    def test_failed_session_can_be_restarted(self):
+        self.sessions.start('a')
+        sequencer = self.sessions.get('a')
+        step = sequencer.step
+        sequencer.step = lambda: 1 / 0
+        time.sleep(0.3)
+        self.assertFalse(sequencer.is_running)
+
+        sequencer.step = step
+        self.sessions.start('a')
+        time.sleep(0.3)
+        self.assertTrue(sequencer.is_running)
+        self.assertGreater(sequencer.bar_count * 16 + sequencer.sixteenth_count, 0)
+
+    def test_start_restarts_sessions_left_by_a_dead_loop(self):
+        self.sessions.start('a')
+        time.sleep(0.05)
+        sequencer = self.sessions.get('a')
+        # Simulate the loop having exited with the sequencer still marked as running
+        self.sessions.heap.clear()
+        time.sleep(0.05)
+        self.assertFalse(self.sessions.loop_running)
+        self.assertTrue(sequencer.is_running)
+
+        self.sessions.start('a')
+        self.assertTrue(self.sessions.loop_running)
+        ticks = sequencer.bar_count * 16 + sequencer.sixteenth_count
+        time.sleep(0.3)
+        self.assertGreater(sequencer.bar_count * 16 + sequencer.sixteenth_count, ticks)
+
+    def test_start_while_the_loop_exits_always_gets_a_loop(self):
+        self.sessions.heap = SlowToEmpty()
+        for i in range(10):
+            sid = f"s{i}"
+            self.sessions.start(sid)
+            self.sessions.leave(sid)  # Drains the heap: the loop exits on its next turn...
+            time.sleep(0.03)  # The loop is now inside its slow emptiness check
+            self.sessions.start(f"t{i}")  # ...possibly right as this start() looks at loop_running
+            sequencer = self.sessions.get(f"t{i}")
+            ticks = sequencer.bar_count * 16 + sequencer.sixteenth_count
+            deadline = time.monotonic() + 1
+            while sequencer.bar_count * 16 + sequencer.sixteenth_count == ticks and time.monotonic() < deadline:
+                time.sleep(0.005)
+            self.assertGreater(sequencer.bar_count * 16 + sequencer.sixteenth_count, ticks, f"t{i} never ticked")
+            self.sessions.leave(f"t{i}")
+
+    def test_stats_while_clients_come_and_go(self):
+        errors = []
+
+        def churn(prefix):
+            try:
+                for i in range(100):
+                    self.sessions.start(f"{prefix}{i}")
+                    self.sessions.leave(f"{prefix}{i}")
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=churn, args=(prefix,)) for prefix in "abc"]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            self.sessions.timing()
+            self.sessions.bandwidth()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.sessions.sessions, {})
+
+    def test_start_of_a_placed_client_is_a_no_op(self):
+        self.sessions.placement['c'] = 'elsewhere'
+        self.assertIsNone(self.sessions.start('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
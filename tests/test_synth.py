@@ -0,0 +1,51 @@
+import unittest
+
+from sequencer import Sequencer
+from sessions import Session
+from synth import AudioBroadcast, VoiceCache
+from wire import batch_time
+
+
+def broadcast_session():
+    session = Session("broadcast:test", None, broadcast=True, ring_bars=4)
+    session.sequencer = Sequencer(lambda event, data=None: session.recent.append((batch_time(data), event, data)),
+                                  schedule_mode="binary", seed="test")
+    return session
+
+
+class AudioBroadcastTest(unittest.TestCase):
+    def test_listeners_share_each_rendered_bar(self):
+        session = broadcast_session()
+        broadcast = AudioBroadcast(session, voices=VoiceCache())
+        session.sequencer.start()
+        session.sequencer.clock.advance(session.sequencer.step())
+        start = broadcast.first()
+        first = broadcast.get(start)
+        self.assertIsNotNone(first)
+        self.assertIs(broadcast.get(start)[1], first[1])
+        self.assertEqual(broadcast.rendered, 1)
+        self.assertIsNone(broadcast.get(start + 1))
+
+        session.sequencer.clock.advance(session.sequencer.step())
+        index, pcm = broadcast.get(start + 1)
+        self.assertEqual(index, start + 1)
+        self.assertEqual(broadcast.rendered, 2)
+
+    def test_finite_stream_has_the_declared_size(self):
+        session = broadcast_session()
+        broadcast = AudioBroadcast(session, voices=VoiceCache())
+        sequencer = session.sequencer
+        sequencer.start()
+        stream = broadcast.stream(bars=2, sleep=lambda seconds: sequencer.clock.advance(sequencer.step()))
+        header = next(stream)
+        data = b''.join(stream)
+        self.assertEqual(len(data), int.from_bytes(header[40:44], 'little'))
+
+    def test_stream_ends_when_the_session_stops(self):
+        session = broadcast_session()
+        broadcast = AudioBroadcast(session, voices=VoiceCache())
+        self.assertEqual(len(b''.join(broadcast.stream())), 44)
+
+
+if __name__ == '__main__':
+    unittest.main()
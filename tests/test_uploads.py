@@ -0,0 +1,82 @@
+import io
+import unittest
+
+from compact_pattern import MAX_BARS, MAX_STEPS, MAX_VOICES, CompactPattern
+from midi_file import encode_midi
+from sequencer import Sequencer
+from uploads import PatternIngest, UploadError, compile_midi
+
+
+def midi_with_ppq(ppq):
+    data = bytearray(encode_midi([("Lead", 0, [(0, 120, 67, 100)])], ppq=480))
+    data[12:14] = ppq.to_bytes(2, 'big')
+    return io.BytesIO(bytes(data))
+
+
+class PatternLengthTest(unittest.TestCase):
+    def test_midi_longer_than_the_cap_is_rejected(self):
+        ticks = MAX_STEPS * 120  # 480 ppq, 120 ticks per sixteenth
+        data = encode_midi([("Lead", 0, [(0, 120, 67, 100), (ticks, 120, 67, 100)])], ppq=480)
+        with self.assertRaises(UploadError):
+            compile_midi(io.BytesIO(data))
+
+    def test_midi_at_the_cap_is_accepted(self):
+        ticks = (MAX_STEPS - 1) * 120
+        data = encode_midi([("Lead", 0, [(ticks, 120, 67, 100)])], ppq=480)
+        self.assertEqual(compile_midi(io.BytesIO(data)).steps, MAX_STEPS)
+
+    def test_zero_ppq_is_rejected(self):
+        with self.assertRaises(UploadError):
+            compile_midi(midi_with_ppq(0))
+
+    def test_json_note_far_in_the_future_is_rejected(self):
+        ingest = PatternIngest(max_workers=1)
+        self.addCleanup(ingest.shutdown)
+        for time in (1e7, float('inf'), float('nan')):
+            pattern = {"tracks": [{"name": "Lead", "notes": [{"name": "G4", "time": time, "duration": 0.1}]}]}
+            with self.assertRaises(UploadError):
+                ingest.submit_pattern(Sequencer(seed=1), pattern).result()
+
+    def test_from_placed_checks_before_allocating(self):
+        with self.assertRaisesRegex(ValueError, f"{MAX_BARS} bars"):
+            CompactPattern.from_placed([(MAX_STEPS, "Lead", 67, 100, 24)])
+
+
+class MalformedUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.ingest = PatternIngest(max_workers=1)
+        self.addCleanup(self.ingest.shutdown)
+
+    def prepare(self, pattern):
+        return self.ingest.submit_pattern(Sequencer(seed=1), pattern).result()
+
+    def test_midi_key_byte_out_of_range_is_rejected(self):
+        data = encode_midi([("Lead", 0, [(0, 120, 67, 100)])], ppq=480)
+        data = data.replace(bytes([0x90, 67, 100]), bytes([0x90, 0xFF, 0x40]))
+        with self.assertRaises(UploadError):
+            compile_midi(io.BytesIO(data))
+
+    def test_stacked_notes_are_capped_per_step(self):
+        ok = encode_midi([("Lead", 0, [(0, 120, 60 + i, 100) for i in range(MAX_VOICES)])], ppq=480)
+        self.assertEqual(len(compile_midi(io.BytesIO(ok)).names), MAX_VOICES)
+        crowded = [(0, "Lead", 67, 100, 24)] * 19999
+        with self.assertRaisesRegex(ValueError, "on one step"):
+            CompactPattern.from_placed(crowded)
+
+    def test_malformed_json_is_an_upload_error(self):
+        for pattern in ({"tracks": ["abc"]}, {"tracks": "abc"}, ["abc"],
+                        {"tracks": [{"notes": [{"name": "G4", "time": "x"}]}]},
+                        {"tracks": [{"notes": [{"name": ["G4"]}]}]},
+                        {"tracks": [{"notes": ["G4"]}]}):
+            with self.subTest(pattern=pattern), self.assertRaises(UploadError):
+                self.prepare(pattern)
+
+    def test_bad_values_are_not_echoed(self):
+        pattern = {"tracks": [{"notes": [{"name": "G4", "velocity": "loud" * 1000}]}]}
+        with self.assertRaises(UploadError) as caught:
+            self.prepare(pattern)
+        self.assertLess(len(str(caught.exception)), 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
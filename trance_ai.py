@@ -2,10 +2,25 @@
 import random
 import json
 import math
+import sys
+
+from compact_pattern import CompactPattern
+from pitch import get_scale, note_to_midi
+
+# G minor pentatonic G4..F5 and the natural minor run above it
+GM_PENTATONIC = get_scale('G', 'minor_pentatonic', note_to_midi('G4'), note_to_midi('F5'))
+GM_HIGH = get_scale('G', 'minor', note_to_midi('G5'), note_to_midi('C6'))
+# Ranges for lines from a trained MelodyModel
+MODEL_LEAD = get_scale('G', 'minor', note_to_midi('G4'), note_to_midi('G5'))
+MODEL_BASS = get_scale('G', 'minor', note_to_midi('G2'), note_to_midi('G3'))
 
 class TranceAI:
-    def __init__(self):
-        self.gm_scale = [67, 70, 72, 74, 77]  # G minor pentatonic
+    def __init__(self, seed=None, model=None):
+        # Private stream so generators never share (or disturb) global randomness
+        self.rng = random.Random(seed)
+        # Optional markov.MelodyModel; once trained it writes the groove's lead and bass
+        self.model = model
+        self.gm_scale = GM_PENTATONIC.midi  # [67, 70, 72, 74, 77]
         self.switch_angel = [67, 77, 67, 79, 74]  # Classic motif
         
     def generate_state_pattern(self, state="groove", energy=0.7):
@@ -14,8 +29,9 @@ class TranceAI:
         
         if state == "groove":
             patterns["kick"] = [1,0,0,0, 1,0,0,0, 1,0,0,0, 1,0,0,0]
-            patterns["bass"] = self._bass_groove()
-            patterns["lead"] = self._lead_melody(energy)
+            patterns["bass"] = self._model_line(MODEL_BASS, (80, 100)) or self._bass_groove()
+            velocity = 45 + int(20 * energy)
+            patterns["lead"] = self._model_line(MODEL_LEAD, (velocity, velocity + 25)) or self._lead_melody(energy)
             
         elif state == "breakdown":
             patterns["kick"] = [0,0,0,0, 0,0,0,0, 0,0,0,0, 0,0,0,0]
@@ -33,7 +49,17 @@ class TranceAI:
             patterns["lead"] = self._switch_angel_lead()
             
         return patterns
+
+    def generate_compact(self, state="groove", energy=0.7):
+        """generate_state_pattern() as a CompactPattern."""
+        return CompactPattern.from_state_pattern(self.generate_state_pattern(state, energy))
     
+    def _model_line(self, scale, velocity):
+        """A 16-step line from the melody model, or None when there is none (or it is untrained)."""
+        if self.model is None:
+            return None
+        return self.model.generate(self.rng, scale, scale.midi[0], scale.midi[-1], velocity=velocity)
+
     def _bass_groove(self):
         return [
             {"note": 43, "vel": 90} if i % 4 == 0 or i == 6 or i == 14 
@@ -70,8 +96,8 @@ class TranceAI:
             if i % 2 == 0 and current_note_idx < num_active_steps:
                 pattern[i] = {
                     "note": arpeggio_sequence[current_note_idx],
-                    "vel": random.randint(50, 75),  # Softer velocities for "soft pluck"
-                    "dur": random.choice([0.125, 0.25]) # Shorter durations for "soft pluck"
+                    "vel": self.rng.randint(50, 75),  # Softer velocities for "soft pluck"
+                    "dur": self.rng.choice([0.125, 0.25]) # Shorter durations for "soft pluck"
                 }
                 current_note_idx += 1
             
@@ -85,10 +111,10 @@ class TranceAI:
         # Sparse, ambient lead for breakdown
         pattern = [None] * 16
         for i in [0, 4, 8, 12]:
-            if random.random() > 0.3:
+            if self.rng.random() > 0.3:
                 pattern[i] = {
-                    "note": random.choice(self.gm_scale),
-                    "vel": random.randint(40, 70),
+                    "note": self.rng.choice(self.gm_scale),
+                    "vel": self.rng.randint(40, 70),
                     "dur": 2.0
                 }
         return pattern
@@ -119,20 +145,20 @@ class TranceAI:
     
     def _tension_lead(self):
         # High energy lead for buildup
-        high_notes = [79, 81, 82, 84]  # Higher octave
+        high_notes = GM_HIGH.midi  # [79, 81, 82, 84], higher octave
         pattern = [None] * 16
         
         for i in range(8, 16):  # Second half gets busier
-            if random.random() > 0.2:
+            if self.rng.random() > 0.2:
                 pattern[i] = {
-                    "note": random.choice(high_notes),
+                    "note": self.rng.choice(high_notes),
                     "vel": 80 + i,
                     "dur": 0.25
                 }
         return pattern
 
 if __name__ == "__main__":
-    ai = TranceAI()
+    ai = TranceAI(seed=int(sys.argv[1]) if len(sys.argv) > 1 else None)
     
     # Generate patterns for each state
     states = ["groove", "breakdown", "buildup", "drop"]
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Pattern uploads, parsed and compiled off the clock.
+
+A .mid upload is read straight from the request stream by
+midi_file.MidiReader, snapped to the scale note by note and placed into a
+CompactPattern without ever building a @tonejs/midi JSON tree. JSON
+uploads (update_pattern) go through Sequencer.prepare_pattern. Both run in
+a small thread pool; the caller hands the result to
+Sequencer.queue_pattern, which swaps it in at the next bar.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from compact_pattern import MAX_BARS, MAX_STEPS, PPQ, CompactPattern
+from midi_file import MidiError, MidiReader
+from pitch import G_MINOR
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(1024 * 1024)))
+MAX_UPLOAD_NOTES = int(os.getenv('MAX_UPLOAD_NOTES', '20000'))
+
+
+NOTE_NUMBERS = ('time', 'duration', 'ticks', 'durationTicks', 'midi', 'velocity')
+
+
+class UploadError(ValueError):
+    pass
+
+
+def count_notes(pattern):
+    """Notes in a @tonejs/midi style pattern; UploadError if it is not shaped like one."""
+    tracks = pattern.get('tracks', []) if isinstance(pattern, dict) else None
+    if not isinstance(tracks, list):
+        raise UploadError("pattern must be an object with a list of tracks")
+    count = 0
+    for track in tracks:
+        notes = track.get('notes', []) if isinstance(track, dict) else None
+        if not isinstance(notes, list):
+            raise UploadError("each track must be an object with a list of notes")
+        for note in notes:
+            if not isinstance(note, dict):
+                raise UploadError("each note must be an object")
+            if not isinstance(note.get('name', ''), str):
+                raise UploadError("note name must be a string")
+            for key in NOTE_NUMBERS:
+                value = note.get(key, 0)
+                # The type, never the value, goes into the message: it may be huge
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise UploadError(f"note {key} must be a number, not {type(value).__name__}")
+        count += len(notes)
+    return count
+
+
+def compile_midi(stream, scale=G_MINOR, max_bytes=MAX_UPLOAD_BYTES, max_notes=MAX_UPLOAD_NOTES):
+    """Standard MIDI File bytes from `stream` -> snapped CompactPattern.
+
+    Quantizes exactly like CompactPattern.from_tracks on the same file's
+    @tonejs/midi JSON. Raises UploadError for bad, oversized, overlong or
+    empty files.
+    """
+    started = time.perf_counter_ns()
+    try:
+        reader = MidiReader(stream, max_bytes, max_notes)
+        ppq = reader.ppq
+        snap = scale.snap_table
+        placed = []
+        for track, start, length, midi, velocity in reader.notes():
+            step = round(start / ppq * 4)
+            if step >= MAX_STEPS:
+                raise UploadError(f"pattern is longer than {MAX_BARS} bars")
+            placed.append((step, track, snap[midi], velocity, min(0xFFFF, int(length / ppq * PPQ + 0.5)) or 1))
+    except UploadError:
+        raise
+    except MidiError as e:
+        raise UploadError(str(e)) from e
+    except Exception as e:
+        # Anything the reader did not anticipate is still the file's fault, not a server error
+        raise UploadError(f"unreadable MIDI file: {e!r}") from e
+
+    # Track names are only known once their chunk has been read
+    names = []
+    for t, name in enumerate(reader.track_names):
+        name = name or f"track{t}"
+        names.append(f"{name}#{t}" if name in names else name)
+    try:
+        compact = CompactPattern.from_placed([(step, names[t], midi, velocity, duration)
+                                              for step, t, midi, velocity, duration in placed])
+    except ValueError as e:
+        raise UploadError(str(e)) from e
+    if compact is None:
+        raise UploadError("file has no notes")
+    metrics.PROCESS_PATTERN_SECONDS.observe(metrics.elapsed(started))
+    return compact
+
+
+class PatternIngest:
+    """Worker pool for pattern uploads, so parsing never runs on the clock thread."""
+
+    def __init__(self, max_workers=2, max_bytes=MAX_UPLOAD_BYTES, max_notes=MAX_UPLOAD_NOTES):
+        self.max_bytes = max_bytes
+        self.max_notes = max_notes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+
+    def submit_midi(self, stream, scale=G_MINOR):
+        """Future of the CompactPattern for a .mid stream."""
+        return self.executor.submit(compile_midi, stream, scale, self.max_bytes, self.max_notes)
+
+    def submit_pattern(self, sequencer, pattern):
+        """Future of sequencer.prepare_pattern(pattern) for a JSON upload."""
+        return self.executor.submit(self._prepare, sequencer, pattern)
+
+    def _prepare(self, sequencer, pattern):
+        if pattern and count_notes(pattern) > self.max_notes:
+            raise UploadError(f"more than {self.max_notes} notes")
+        try:
+            pattern, compiled = sequencer.prepare_pattern(pattern)
+        except ValueError as e:
+            raise UploadError(str(e)) from e
+        except Exception as e:
+            # Whatever else a malformed pattern trips over, the client still gets upload_error
+            raise UploadError(f"malformed pattern ({type(e).__name__})") from e
+        return pattern, compiled
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
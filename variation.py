@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Batch pattern variation with NumPy.
+
+VariationEngine.variants() turns one CompactPattern into K mutated copies
+in a single vectorized pass over its arrays:
+- pitch substitution: a walk of one or two scale degrees
+- octave shifts: only applied when the result stays inside the scale's range
+- rhythmic displacement: a note moves one step into an empty neighbour
+- velocity humanization: Gaussian, clipped to 1..127
+
+All pitch changes stay on the scale, and all randomness comes from one
+seeded numpy Generator.
+"""
+from array import array
+
+import numpy as np
+
+from compact_pattern import CompactPattern
+from pitch import G_MINOR
+
+
+def _shift(values, mask, direction, fill=0):
+    """Move the entries selected by `mask` one step along the last axis."""
+    out = np.where(mask, fill, values)
+    if direction > 0:
+        out[..., 1:] = np.where(mask[..., :-1], values[..., :-1], out[..., 1:])
+    else:
+        out[..., :-1] = np.where(mask[..., 1:], values[..., 1:], out[..., :-1])
+    return out
+
+
+class VariationEngine:
+    def __init__(self, scale=G_MINOR, seed=None):
+        self.scale = scale
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def variants(self, pattern, k=8, amount=0.3, tracks=None, scale=None):
+        """K varied copies of `pattern` (only `tracks`, if given, are touched).
+
+        `amount` (0-1) is the substitution probability per note; octave shifts
+        and displacements each happen at a quarter of that rate.
+        """
+        scale = scale or self.scale
+        names, steps = pattern.names, pattern.steps
+        n = len(names) * steps
+        if k <= 0 or n == 0:
+            return []
+        scale_midi = np.array(scale.midi, dtype=np.int16)
+        degree_of = np.array(scale.degree_table, dtype=np.int16)
+        low, high = scale.midi[0], scale.midi[-1]
+
+        pitch = np.tile(np.frombuffer(pattern.pitch, dtype=np.uint8).astype(np.int16), (k, 1))
+        velocity = np.tile(np.frombuffer(pattern.velocity, dtype=np.uint8).astype(np.float32), (k, 1))
+        duration = np.tile(np.frombuffer(pattern.duration, dtype=np.uint16), (k, 1))
+        active = np.tile(np.frombuffer(pattern.active, dtype=np.uint8).astype(bool), (k, 1))
+
+        selected = np.ones(len(names), dtype=bool) if tracks is None else np.isin(names, list(tracks))
+        eligible = active & np.repeat(selected, steps)
+
+        # Every random number for the batch in two draws
+        roll = self.rng.random((5, k, n))
+        walk = self.rng.integers(1, 3, size=(k, n)) * np.where(roll[4] < 0.5, -1, 1)
+
+        # Pitch substitution: walk along the scale
+        substitute = eligible & (roll[0] < amount)
+        degrees = np.clip(degree_of[pitch] + walk, 0, len(scale_midi) - 1)
+        pitch = np.where(substitute, scale_midi[degrees], pitch)
+
+        # Octave shifts that stay in range
+        shifted = pitch + np.where(roll[4] < 0.5, 12, -12)
+        octave = eligible & (roll[1] < amount / 4) & (shifted >= low) & (shifted <= high)
+        pitch = np.where(octave, shifted, pitch)
+
+        # Velocity humanization
+        noise = self.rng.normal(0.0, 12.0 * amount, size=(k, n)).astype(np.float32)
+        velocity = np.where(eligible, np.clip(velocity + noise, 1, 127), velocity)
+
+        # Rhythmic displacement, per track so notes never cross into the next one
+        shape = (k, len(names), steps)
+        pitch, velocity, duration, active = (a.reshape(shape) for a in (pitch, velocity, duration, active))
+        displace = eligible.reshape(shape) & (roll[2] < amount / 4).reshape(shape)
+        later = roll[3].reshape(shape) < 0.5
+        right = displace & later
+        right[..., -1] = False
+        right[..., :-1] &= ~active[..., 1:]
+        pitch, velocity, duration = (_shift(a, right, 1) for a in (pitch, velocity, duration))
+        active = _shift(active, right, 1, False)
+        left = displace & ~later
+        left[..., 0] = False
+        left[..., 1:] &= ~active[..., :-1]
+        pitch, velocity, duration = (_shift(a, left, -1) for a in (pitch, velocity, duration))
+        active = _shift(active, left, -1, False)
+
+        pitch = pitch.reshape(k, n).astype(np.uint8)
+        velocity = velocity.reshape(k, n).astype(np.uint8)
+        duration = duration.reshape(k, n).astype(np.uint16)
+        active = active.reshape(k, n).astype(np.uint8)
+
+        results = []
+        for i in range(k):
+            variant = CompactPattern.__new__(CompactPattern)
+            variant.names = list(names)
+            variant.steps = steps
+            variant.pitch = array('B', pitch[i].tobytes())
+            variant.velocity = array('B', velocity[i].tobytes())
+            variant.duration = array('H')
+            variant.duration.frombytes(duration[i].tobytes())
+            variant.active = array('B', active[i].tobytes())
+            results.append(variant)
+        return results
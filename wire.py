@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Packed binary encoding of a bar batch, sent as a Socket.IO binary attachment.
+
+A `bar_binary` frame carries the same content as a `bar_events` dict:
+
+    header  <B I d d f H   version, bar, time, now, sixteenth, event count
+    event   <B B           step, event code, then a body per code:
+      sidechain  (empty)
+      notes      <B B + n*B          duration code, note count, MIDI numbers
+      lead       notes + <h B        detune in 1/100 cent, velocity 0-127 (255 = none)
+      param_ramp <B f f f            param code, from, to, duration
+      JSON       <H + bytes          length and UTF-8 JSON [event, data] (anything else)
+
+index.html decodes it back into [step, event, data] triples.
+"""
+import json
+import struct
+
+from pitch import midi_to_note
+
+VERSION = 1
+HEADER = struct.Struct('<BIddfH')
+EVENT = struct.Struct('<BB')
+NOTES = struct.Struct('<BB')
+LEAD = struct.Struct('<hB')
+RAMP = struct.Struct('<Bfff')
+JSON_LENGTH = struct.Struct('<H')
+
+EVENT_CODES = ['trigger_sidechain', 'trigger_kick', 'trigger_snare', 'trigger_lead', 'trigger_chords',
+               'trigger_piano', 'trigger_pads', 'trigger_arp', 'bass_loop', 'param_ramp']
+DURATION_CODES = ['16n', '8n', '4n', '2n', '1n', '1m']
+PARAM_CODES = ['lead_cutoff', 'bass_spread']
+JSON_EVENT = 255
+NO_VELOCITY = 255
+
+_EVENT_INDEX = {name: i for i, name in enumerate(EVENT_CODES)}
+_DURATION_INDEX = {name: i for i, name in enumerate(DURATION_CODES)}
+_PARAM_INDEX = {name: i for i, name in enumerate(PARAM_CODES)}
+_LEAD_KEYS = {'note', 'duration', 'detune', 'velocity'}
+_NOTE_KEYS = {'note', 'duration'}
+_CHORD_KEYS = {'notes', 'duration'}
+# Only the app's own flat spellings are packed, so every name decodes back unchanged
+_MIDI_BY_NAME = {midi_to_note(m): m for m in range(128)}
+
+
+def _encode_notes(event, data):
+    """Body for a note event, or None if it needs the JSON fallback."""
+    chord = event == 'trigger_chords'
+    allowed = _CHORD_KEYS if chord else _LEAD_KEYS if event == 'trigger_lead' else _NOTE_KEYS
+    if not isinstance(data, dict) or 'duration' not in data or not data.keys() <= allowed:
+        return None
+    duration = _DURATION_INDEX.get(data['duration'])
+    if chord:
+        notes = data.get('notes')
+    else:
+        note = data.get('note', False)
+        notes = [] if note is None and event == 'bass_loop' else [note]
+    if duration is None or notes is None or len(notes) > 255:
+        return None
+    try:
+        midis = bytes(_MIDI_BY_NAME[name] for name in notes)
+    except (KeyError, TypeError):
+        return None
+    body = NOTES.pack(duration, len(midis)) + midis
+    if event == 'trigger_lead':
+        velocity = data.get('velocity')
+        body += LEAD.pack(max(-32768, min(32767, round(data.get('detune', 0.0) * 100))),
+                          NO_VELOCITY if velocity is None else max(0, min(127, round(velocity * 127))))
+    return body
+
+
+_body_cache = {}  # (event, note, duration) -> packed body for plain one-note events
+
+
+def _encode_event(step, event, data):
+    code = _EVENT_INDEX.get(event)
+    if event not in ('trigger_lead', 'trigger_chords') and type(data) is dict and len(data) == 2:
+        key = (event, data.get('note', False), data.get('duration'))
+        body = _body_cache.get(key)
+        if body is None and code is not None:
+            body = _encode_notes(event, data)
+            if body is not None and len(_body_cache) < 4096:
+                _body_cache[key] = body
+    elif event == 'trigger_sidechain':
+        body = b'' if data is None else None
+    elif event == 'param_ramp':
+        body = None
+        if isinstance(data, dict) and set(data) == {'param', 'from', 'to', 'duration'} and data['param'] in _PARAM_INDEX:
+            body = RAMP.pack(_PARAM_INDEX[data['param']], data['from'], data['to'], data['duration'])
+    else:
+        body = None if code is None else _encode_notes(event, data)
+    if body is None:
+        payload = json.dumps([event, data], separators=(',', ':')).encode('utf-8')
+        return EVENT.pack(step, JSON_EVENT) + JSON_LENGTH.pack(len(payload)) + payload
+    return EVENT.pack(step, code) + body
+
+
+def encode_bar(batch):
+    """bar_events dict -> bytes."""
+    events = batch['events']
+    parts = [HEADER.pack(VERSION, batch['bar'], batch['time'], batch['now'], batch['sixteenth'], len(events))]
+    parts.extend(_encode_event(step, event, data) for step, event, data in events)
+    return b''.join(parts)
+
+
+def batch_time(batch):
+    """Play time of a bar batch, packed or not, without decoding the events."""
+    if isinstance(batch, (bytes, bytearray, memoryview)):
+        return HEADER.unpack_from(batch)[2]
+    return batch['time']
+
+
+def decode_bar(buffer):
+    """bytes -> bar_events dict (detune and velocity come back quantized)."""
+    version, bar, time, now, sixteenth, count = HEADER.unpack_from(buffer)
+    if version != VERSION:
+        raise ValueError(f"unsupported wire version {version}")
+    offset = HEADER.size
+    events = []
+    for _ in range(count):
+        step, code = EVENT.unpack_from(buffer, offset)
+        offset += EVENT.size
+        if code == JSON_EVENT:
+            (length,) = JSON_LENGTH.unpack_from(buffer, offset)
+            offset += JSON_LENGTH.size
+            event, data = json.loads(bytes(buffer[offset:offset + length]))
+            offset += length
+        elif EVENT_CODES[code] == 'trigger_sidechain':
+            event, data = 'trigger_sidechain', None
+        elif EVENT_CODES[code] == 'param_ramp':
+            param, start, end, duration = RAMP.unpack_from(buffer, offset)
+            offset += RAMP.size
+            event, data = 'param_ramp', {'param': PARAM_CODES[param], 'from': start, 'to': end, 'duration': duration}
+        else:
+            event = EVENT_CODES[code]
+            duration, n = NOTES.unpack_from(buffer, offset)
+            offset += NOTES.size
+            names = [midi_to_note(m) for m in buffer[offset:offset + n]]
+            offset += n
+            if event == 'trigger_chords':
+                data = {'notes': names, 'duration': DURATION_CODES[duration]}
+            else:
+                data = {'note': names[0] if names else None, 'duration': DURATION_CODES[duration]}
+            if event == 'trigger_lead':
+                detune, velocity = LEAD.unpack_from(buffer, offset)
+                offset += LEAD.size
+                data['detune'] = detune / 100
+                if velocity != NO_VELOCITY:
+                    data['velocity'] = velocity / 127
+        events.append([step, event, data])
+    return {'bar': bar, 'time': time, 'now': now, 'sixteenth': sixteenth, 'events': events}
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Run several app.py workers behind one message queue.
+
+    MESSAGE_QUEUE=redis://localhost:6379 python workers.py 4
+
+Worker i listens on PORT + i (PORT defaults to 5000). Put a load balancer
+with sticky sessions in front of them (see README, "Workers"): Socket.IO's
+long-polling transport needs every request of a client on the same worker.
+
+Each worker is a gunicorn process with exactly one gthread worker: its
+sessions and clock loop live in that process, so more gunicorn workers
+per port would split a client's requests across unrelated states. Scale
+with more workers here instead. --server dev runs `python app.py`
+(Werkzeug's development server) for local testing.
+"""
+import argparse
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("count", type=int, nargs="?", default=os.cpu_count() or 1, help="number of workers")
+    parser.add_argument("--port", type=int, default=int(os.getenv('PORT', '5000')), help="port of worker 0")
+    parser.add_argument("--queue", default=os.getenv('MESSAGE_QUEUE', ''), help="message queue URL")
+    parser.add_argument("--server", choices=("gunicorn", "dev"), default="gunicorn",
+                        help="gunicorn (production) or Werkzeug's development server")
+    parser.add_argument("--threads", type=int, default=int(os.getenv('THREADS', '100')),
+                        help="gunicorn threads per worker, one per connected client")
+    args = parser.parse_args()
+
+    if args.count > 1 and (not args.queue or args.queue.startswith('local://')):
+        parser.error("several workers need a shared MESSAGE_QUEUE (redis://, amqp://, kafka://, zmq+tcp://)")
+    if args.server == "gunicorn" and importlib.util.find_spec("gunicorn") is None:
+        parser.error("gunicorn is not installed (pip install gunicorn), or use --server dev")
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    workers = []
+    for i in range(args.count):
+        port = args.port + i
+        env = dict(os.environ, WORKER_INDEX=str(i), WORKER_COUNT=str(args.count),
+                   MESSAGE_QUEUE=args.queue, PORT=str(port))
+        if args.server == "gunicorn":
+            command = [sys.executable, "-m", "gunicorn", "--workers", "1", "--worker-class", "gthread",
+                       "--threads", str(args.threads), "--bind", f"0.0.0.0:{port}", "app:app"]
+        else:
+            command = [sys.executable, os.path.join(root, "app.py")]
+        workers.append(subprocess.Popen(command, env=env, cwd=root))
+        print(f"Worker {i} on port {port}")
+
+    try:
+        # If any worker dies the rest cannot serve its rooms, so stop them all
+        os.wait()
+    except KeyboardInterrupt:
+        pass
+    for worker in workers:
+        if worker.poll() is None:
+            worker.send_signal(signal.SIGINT)
+    for worker in workers:
+        worker.wait()
+
+
+if __name__ == "__main__":
+    main()